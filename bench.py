@@ -0,0 +1,368 @@
+"""Offline benchmarks of compare/update/merge_dicts on seeded synthetic documents
+
+    python bench.py --save                 # record bench_baseline.json
+    python bench.py                        # compare to it, exit 1 on a regression
+    python bench.py --scale 0.1 -k deep    # a quick run of the deep scenarios
+
+Each scenario is timed (best of --repeat runs) and then run once more under
+tracemalloc for its peak memory. Documents are generated from --seed, so two runs
+with the same seed and scale measure the same inputs.
+"""
+import argparse
+import json
+import random
+import sys
+import tracemalloc
+from copy import deepcopy
+from functools import partial
+from time import perf_counter
+
+import dict_compare
+
+DEFAULT_BASELINE = "bench_baseline.json"
+# a scenario regresses when it gets this much slower or bigger than its baseline
+DEFAULT_THRESHOLD = 0.25
+# measurements under these are too noisy to fail on
+MIN_SECONDS = 0.01
+MIN_PEAK_BYTES = 1 << 16
+
+KEY_ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+LIST_ITEMS = ["DONE", "NEW_CASE", "ROLLBACK", "PENDING", "FAILED", "RUNNING"]
+
+# a heavy configuration in the shape of the event-definition fixtures in test.py
+MAPPED_OPTIONS = {
+    "column_mapping": dict(
+        map={"action": "action_definitions", "alarm": "alarm_definitions", "text": "event_message"},
+        inner_key_validity=False,
+        generic_key=["metadata"],
+    ),
+    "fix_funcs": {"event_type": [str.upper], "severity": [str.upper, str.strip]},
+    "ignore_keys": ["id", "_state"],
+}
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    """Register fn(rng, scale) -> setup, where setup() returns a fresh job to time"""
+
+    def register(fn):
+        SCENARIOS[name] = fn
+        return fn
+
+    return register
+
+
+# -- generators --------------------------------------------------------------
+
+
+def random_key(rng, length=8):
+    return "".join(rng.choice(KEY_ALPHABET) for _ in range(length))
+
+
+def random_leaf(rng):
+    kind = rng.random()
+    if kind < 0.4:
+        return rng.randint(0, 1 << 20)
+    if kind < 0.8:
+        return random_key(rng, rng.randint(4, 16))
+    if kind < 0.9:
+        return rng.choice([True, False, None])
+    return rng.sample(LIST_ITEMS, rng.randint(1, 3))
+
+
+def wide_document(rng, width):
+    """A dict of `width` top-level keys, a tenth of them holding small nested dicts"""
+    document = {}
+    for i in range(width):
+        if i % 10:
+            document[f"key{i}"] = random_leaf(rng)
+        else:
+            document[f"key{i}"] = {random_key(rng): random_leaf(rng) for _ in range(4)}
+    return document
+
+
+def deep_document(rng, depth, width=4):
+    """A chain of `depth` nested dicts, each level with `width` leaves beside the child"""
+    document = node = {}
+    for level in range(depth):
+        for i in range(width):
+            node[f"leaf{i}"] = random_leaf(rng)
+        node[f"level{level}"] = node = {}
+    return document
+
+
+def list_heavy_document(rng, width, list_size=50):
+    """A dict of shuffled lists, to be compared with avoid_inner_order=True"""
+    return {
+        f"list{i}": [rng.randint(0, 1 << 16) for _ in range(list_size)]
+        for i in range(width)
+    }
+
+
+def mapped_document(rng, count):
+    """Event definitions keyed by name, in the benchmark-side shape of MAPPED_OPTIONS"""
+    return {
+        f"event{i}": {
+            "action": {"alarm_only": rng.choice([True, False]), "cooldown": rng.randint(0, 3600)},
+            "alarm": {"severity": rng.choice(["critical ", "major", "minor"]), "trigger_on": rng.sample(LIST_ITEMS, 2)},
+            "event_type": rng.choice(["object_modified", "object_created"]),
+            "text": random_key(rng, 24),
+            "id": i,
+        }
+        for i in range(count)
+    }
+
+
+def to_test_side(document):
+    """Rename the mapped keys of a mapped_document as they appear in the test documents"""
+    column_map = MAPPED_OPTIONS["column_mapping"]["map"]
+    return {
+        name: copy_document({column_map.get(k, k): v for k, v in event.items()})
+        for name, event in document.items()
+    }
+
+
+def copy_document(document):
+    """deepcopy() of a document of dicts, lists and leaves, without recursing"""
+    root = {}
+    stack = [(document, root)]
+    while stack:
+        source, target = stack.pop()
+        for key, value in source.items():
+            if isinstance(value, dict):
+                target[key] = {}
+                stack.append((value, target[key]))
+            elif isinstance(value, list):
+                target[key] = list(value)
+            else:
+                target[key] = value
+    return root
+
+
+def mutate(rng, document, rate=0.05):
+    """A copy of document with about `rate` of its leaves changed, dropped or added"""
+    document = copy_document(document)
+    stack = [document]
+    while stack:
+        node = stack.pop()
+        for key in list(node):
+            value = node[key]
+            if isinstance(value, dict):
+                stack.append(value)
+                continue
+            roll = rng.random()
+            if roll < rate * 0.6:
+                node[key] = random_leaf(rng)
+            elif roll < rate * 0.8:
+                del node[key]
+            elif roll < rate:
+                node[random_key(rng)] = random_leaf(rng)
+    return document
+
+
+def shuffle_lists(rng, document):
+    document = copy_document(document)
+    for value in document.values():
+        rng.shuffle(value)
+    return document
+
+
+# -- scenarios ---------------------------------------------------------------
+
+
+def compare_job(benchmark, test, **kwargs):
+    return lambda: partial(
+        dict_compare.compare, benchmark, test, logger=dict_compare.NULL_LOGGER, **kwargs
+    )
+
+
+def update_job(benchmark, test, **kwargs):
+    # update changes test: every run gets its own copy, made outside the timing
+    return lambda: partial(
+        dict_compare.update, benchmark, copy_document(test), logger=dict_compare.NULL_LOGGER, **kwargs
+    )
+
+
+@scenario("compare_wide")
+def compare_wide(rng, scale):
+    benchmark = wide_document(rng, int(100_000 * scale))
+    return compare_job(benchmark, mutate(rng, benchmark))
+
+
+@scenario("update_wide")
+def update_wide(rng, scale):
+    benchmark = wide_document(rng, int(100_000 * scale))
+    return update_job(benchmark, mutate(rng, benchmark))
+
+
+@scenario("updated_wide")
+def updated_wide(rng, scale):
+    # copy-on-write: test isn't changed, so no copy per run
+    benchmark = wide_document(rng, int(100_000 * scale))
+    test = mutate(rng, benchmark)
+    return lambda: partial(dict_compare.updated, benchmark, test, logger=dict_compare.NULL_LOGGER)
+
+
+@scenario("merge_wide")
+def merge_wide(rng, scale):
+    orig = wide_document(rng, int(100_000 * scale))
+    new = mutate(rng, orig, rate=0.2)
+    return lambda: partial(dict_compare.merge_dicts, copy_document(orig), new)
+
+
+@scenario("compare_deep")
+def compare_deep(rng, scale):
+    benchmark = deep_document(rng, int(1000 * scale))
+    return compare_job(benchmark, mutate(rng, benchmark))
+
+
+@scenario("update_deep")
+def update_deep(rng, scale):
+    benchmark = deep_document(rng, int(1000 * scale))
+    return update_job(benchmark, mutate(rng, benchmark))
+
+
+@scenario("compare_lists_unordered")
+def compare_lists_unordered(rng, scale):
+    benchmark = list_heavy_document(rng, int(10_000 * scale))
+    return compare_job(benchmark, shuffle_lists(rng, benchmark), avoid_inner_order=True)
+
+
+@scenario("update_lists_unordered")
+def update_lists_unordered(rng, scale):
+    benchmark = list_heavy_document(rng, int(10_000 * scale))
+    test = mutate(rng, shuffle_lists(rng, benchmark))
+    return update_job(benchmark, test, avoid_inner_order=True)
+
+
+@scenario("compare_mapped")
+def compare_mapped(rng, scale):
+    benchmark = mapped_document(rng, int(5_000 * scale))
+    test = mutate(rng, to_test_side(benchmark))
+    return compare_job(benchmark, test, **deepcopy(MAPPED_OPTIONS))
+
+
+@scenario("update_mapped")
+def update_mapped(rng, scale):
+    benchmark = mapped_document(rng, int(5_000 * scale))
+    test = mutate(rng, to_test_side(benchmark))
+    return update_job(benchmark, test, **deepcopy(MAPPED_OPTIONS))
+
+
+@scenario("cache_miss_wide")
+def cache_miss_wide(rng, scale):
+    # a new cache every run: both documents are hashed, then compared
+    benchmark = wide_document(rng, int(100_000 * scale))
+    test = mutate(rng, benchmark)
+    return lambda: partial(
+        dict_compare.ResultCache().compare, benchmark, test, logger=dict_compare.NULL_LOGGER
+    )
+
+
+@scenario("cache_hit_wide")
+def cache_hit_wide(rng, scale):
+    # a warm cache: only the test is hashed, the benchmark's digest is kept
+    benchmark = wide_document(rng, int(100_000 * scale))
+    test = mutate(rng, benchmark)
+    cache = dict_compare.ResultCache()
+    cache.compare(benchmark, test, logger=dict_compare.NULL_LOGGER)
+    return lambda: partial(cache.compare, benchmark, test, logger=dict_compare.NULL_LOGGER)
+
+
+# -- runner ------------------------------------------------------------------
+
+
+def run_scenario(name, scale=1.0, seed=0, repeat=3):
+    """Return {"seconds": best wall time, "peak_bytes": peak traced memory} of a scenario"""
+    setup = SCENARIOS[name](random.Random(f"{seed}:{name}"), scale)
+    best = float("inf")
+    for _ in range(repeat):
+        job = setup()
+        start = perf_counter()
+        job()
+        best = min(best, perf_counter() - start)
+
+    job = setup()
+    tracemalloc.start()
+    try:
+        job()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak}
+
+
+def run(names, scale=1.0, seed=0, repeat=3, out=None):
+    results = {}
+    for name in names:
+        results[name] = run_scenario(name, scale, seed, repeat)
+        if out:
+            out.write(format_result(name, results[name]) + "\n")
+    return results
+
+
+def format_result(name, result):
+    return f"{name:<26} {result['seconds'] * 1000:10.1f} ms {result['peak_bytes'] / (1 << 20):10.2f} MB"
+
+
+def regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Return a message per scenario of results slower or bigger than baseline by more than threshold
+
+    Scenarios missing from either side are skipped, as are measurements too small to
+    be compared reliably (MIN_SECONDS, MIN_PEAK_BYTES).
+    """
+    floors = {"seconds": MIN_SECONDS, "peak_bytes": MIN_PEAK_BYTES}
+    messages = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric, floor in floors.items():
+            old, new = base[metric], result[metric]
+            if max(old, new) < floor:
+                continue
+            if old and (new - old) / old > threshold:
+                messages.append(f"{name}: {metric} {old:.6g} -> {new:.6g} (+{(new - old) / old:.0%})")
+    return messages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", "--filter", default="", help="run only scenarios whose name contains this")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every document size by this")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    names = [name for name in SCENARIOS if args.filter in name]
+    results = run(names, args.scale, args.seed, args.repeat, out=sys.stdout)
+    record = {"scale": args.scale, "seed": args.seed, "results": results}
+
+    if args.save:
+        with open(args.baseline, "w") as fp:
+            json.dump(record, fp, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+    except FileNotFoundError:
+        print(f"no baseline at {args.baseline}: run with --save first")
+        return 0
+    if (baseline["scale"], baseline["seed"]) != (args.scale, args.seed):
+        print(f"baseline was recorded with scale={baseline['scale']} seed={baseline['seed']}")
+        return 2
+
+    failures = regressions(results, baseline["results"], args.threshold)
+    for message in failures:
+        print(f"REGRESSION {message}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
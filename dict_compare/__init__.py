@@ -0,0 +1,96 @@
+"""Deep python dictionary difference
+
+The compare engine lives in dict_compare.engine; the binary codec and the files
+built on it, the process pool and asyncio drivers, and the streaming JSON compare
+have their own modules. Everything public is re-exported here.
+"""
+
+from .engine import (
+    COLLECTION_VAR,
+    LOG_HANDLER_NAME,
+    MAX_RENDERED_CHARS,
+    NOT_FOUND,
+    NULL_LOGGER,
+    Comparator,
+    CompareContext,
+    CompareSession,
+    CompareStats,
+    DictCompareLogger,
+    DictDiff,
+    DiffEvent,
+    Fingerprints,
+    ListPatch,
+    LookupCache,
+    Normalized,
+    NotFoundSentinel,
+    Patch,
+    ResultCache,
+    ThreeWayDiff,
+    added_keys,
+    bench_to_mapped_keys,
+    compare,
+    compare_many,
+    compare_with_reference,
+    convert_to_nested_dicts,
+    dict_to_key_chain,
+    first_difference,
+    fix_key,
+    get_column_mapping,
+    get_dict_to_update,
+    get_logger,
+    get_nested_value,
+    get_shared_keys,
+    get_valid_keys,
+    get_valid_mapped_keys,
+    is_equal,
+    is_same_type,
+    iter_diffs,
+    iterator,
+    key_to_ignore,
+    listify,
+    mapped_to_bench_keys,
+    merge_dicts,
+    modified_keys,
+    reconcile,
+    removed_keys,
+    tuplize,
+    update,
+    updated,
+    value_of,
+)
+from .codec import DiffArchive, VersionStore, decode_diff, encode_diff
+from .drivers import acompare, acompare_stream, compare_parallel, update_parallel
+from .json_stream import compare_json_files
+
+__all__ = (
+    "CompareStats",
+    "Comparator",
+    "CompareSession",
+    "ResultCache",
+    "ThreeWayDiff",
+    "VersionStore",
+    "DiffArchive",
+    "DiffEvent",
+    "NULL_LOGGER",
+    "Normalized",
+    "Fingerprints",
+    "ListPatch",
+    "Patch",
+    "compare",
+    "compare_json_files",
+    "compare_many",
+    "compare_with_reference",
+    "compare_parallel",
+    "encode_diff",
+    "decode_diff",
+    "acompare",
+    "acompare_stream",
+    "first_difference",
+    "is_equal",
+    "iter_diffs",
+    "update",
+    "update_parallel",
+    "updated",
+    "merge_dicts",
+    "reconcile",
+)
@@ -0,0 +1,465 @@
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    MutableMapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+class DiffEvent(NamedTuple):
+    kind: str
+    path: tuple
+    bench_value: Any
+    test_value: Any
+
+def update(benchmark, test, avoid_inner_order=True, **kwargs) -> Union[dict, "Patch"]: ...
+def updated(benchmark, test, avoid_inner_order=True, **kwargs) -> dict: ...
+def compare(
+    benchmark: dict,
+    test: dict,
+    key: str = None,
+    avoid_inner_order: bool = False,
+    **kwargs
+): ...
+def iter_diffs(
+    benchmark: dict,
+    test: dict,
+    key: str = None,
+    avoid_inner_order: bool = False,
+    **kwargs
+) -> Iterator[DiffEvent]: ...
+def first_difference(benchmark: dict, test: dict, **kwargs) -> Optional[DiffEvent]: ...
+def is_equal(benchmark: dict, test: dict, **kwargs) -> bool: ...
+def compare_many(
+    benchmark: dict,
+    tests,
+    key: str = None,
+    avoid_inner_order: bool = False,
+    **kwargs
+): ...
+def compare_parallel(
+    benchmark: dict,
+    tests,
+    workers: int = None,
+    chunk_size: int = 64,
+    ordered: bool = True,
+    key: str = None,
+    avoid_inner_order: bool = False,
+    external_logger=None,
+    diff_id=None,
+    mp_context=None,
+    **kwargs
+): ...
+async def acompare(benchmark: dict, test: dict, executor=None, **kwargs): ...
+def acompare_stream(
+    source: AsyncIterable[tuple],
+    benchmark: dict = None,
+    executor=None,
+    max_in_flight: int = 8,
+    ordered: bool = False,
+    **kwargs
+) -> AsyncIterator[tuple]: ...
+def reconcile(
+    benchmark: dict,
+    tests,
+    avoid_inner_order: bool = True,
+    changed_fields_of: Callable[[dict], Any] = None,
+    external_logger=None,
+    diff_id=None,
+    **kwargs
+) -> Iterator[tuple]: ...
+def update_parallel(
+    benchmark: dict,
+    tests,
+    workers: int = None,
+    chunk_size: int = 64,
+    ordered: bool = True,
+    avoid_inner_order: bool = True,
+    changed_fields_of=None,
+    external_logger=None,
+    diff_id=None,
+    mp_context=None,
+    **kwargs
+): ...
+def compare_json_files(
+    benchmark,
+    test,
+    avoid_inner_order: bool = False,
+    chunk_size: int = 65536,
+    max_spill: int = 10000,
+    **kwargs
+): ...
+def merge_dicts(orig_dict, new_dict): ...
+def compare_with_reference(
+    reference: dict,
+    original: dict,
+    revised: dict,
+    key: str = None,
+    avoid_inner_order: bool = False,
+    external_logger=None,
+    diff_id=None,
+    **kwargs
+) -> "ThreeWayDiff": ...
+
+class KeyOptions:
+    mapping: dict
+    reverse_mapping: dict
+    inner_key_validity: bool
+    generic_key: tuple
+    ignore_keys: frozenset
+    fix_funcs: Dict[Any, tuple]
+    def __init__(self, column_mapping: dict = None, ignore_keys=None, fix_funcs: dict = None): ...
+    def get_column_mapping(self, recursive: bool = False) -> dict: ...
+    def bench_to_mapped_keys(self, bench_keys, recursive: bool = False) -> tuple: ...
+    def mapped_to_bench_keys(self, mapped_keys, recursive: bool = False) -> tuple: ...
+    def get_valid_keys(self, d) -> set: ...
+    def get_valid_mapped_keys(self, test: Dict[str, Any]) -> list: ...
+    def key_to_ignore(self, key) -> bool: ...
+    def fix_key(self, keys, value, logger=None, stats: "CompareStats" = None): ...
+    def get_nested_value(self, key, _dict, default, lookup_cache=None): ...
+    def iterator(self, collection, recursive: bool = False) -> Iterator[tuple]: ...
+
+class Comparator(KeyOptions):
+    def __init__(
+        self,
+        column_mapping: dict = None,
+        ignore_keys=None,
+        fix_funcs: dict = None,
+        changed_fields=None,
+        list_keys: dict = None,
+        sequence_diff: Union[bool, int] = False,
+    ): ...
+    @classmethod
+    def from_kwargs(cls, **kwargs) -> "Comparator": ...
+    def options_key(self) -> Optional[tuple]: ...
+    def compare(
+        self,
+        benchmark: dict,
+        test: dict,
+        key: str = None,
+        avoid_inner_order: bool = False,
+        external_logger=None,
+        diff_id=None,
+        **kwargs
+    ): ...
+    def iter_diffs(
+        self,
+        benchmark: dict,
+        test: dict,
+        key: str = None,
+        avoid_inner_order: bool = False,
+        external_logger=None,
+        diff_id=None,
+        **kwargs
+    ) -> Iterator[DiffEvent]: ...
+    def compare_in(self, test: dict, key, context) -> "DictDiff": ...
+    def delta_in(
+        self, test: dict, context, changed_fields=None, decisions: Dict[str, int] = None
+    ) -> "Patch": ...
+    def region_diffs(self, root, level_path: tuple, key, test: dict, context) -> Iterator[DiffEvent]: ...
+    def first_difference(self, benchmark: dict, test: dict, **kwargs) -> Optional[DiffEvent]: ...
+    def is_equal(self, benchmark: dict, test: dict, **kwargs) -> bool: ...
+    def compare_many(
+        self,
+        benchmark: dict,
+        tests,
+        key: str = None,
+        avoid_inner_order: bool = False,
+        external_logger=None,
+        diff_id=None,
+        **kwargs
+    ): ...
+    def compare_with_reference(
+        self,
+        reference: dict,
+        original: dict,
+        revised: dict,
+        key: str = None,
+        avoid_inner_order: bool = False,
+        **kwargs
+    ) -> "ThreeWayDiff": ...
+    def reconcile(
+        self,
+        benchmark: dict,
+        tests,
+        avoid_inner_order: bool = True,
+        changed_fields_of: Callable[[dict], Any] = None,
+        external_logger=None,
+        diff_id=None,
+        decisions: Dict[str, int] = None,
+        as_patch: bool = False,
+        **kwargs
+    ) -> Iterator[tuple]: ...
+    def prepare(
+        self, benchmark: dict, fingerprints=None, logger=None, normalized=None
+    ) -> "BenchmarkPlan": ...
+    def open_context(
+        self, benchmark: dict, avoid_inner_order, external_logger=None, diff_id=None, **kwargs
+    ) -> "CompareContext": ...
+    def normalize(self, document: dict, logger=None) -> "Normalized": ...
+    def update(
+        self,
+        benchmark,
+        test,
+        external_logger=None,
+        diff_id=None,
+        avoid_inner_order=True,
+        changed_fields=None,
+        as_patch: bool = False,
+        **kwargs
+    ) -> Union[dict, "Patch"]: ...
+    def updated(
+        self,
+        benchmark,
+        test,
+        external_logger=None,
+        diff_id=None,
+        avoid_inner_order=True,
+        changed_fields=None,
+        **kwargs
+    ) -> dict: ...
+
+MAX_RENDERED_CHARS: int
+
+class DictCompareLogger:
+    def __init__(self, diff_id=None, external_logger=None, max_chars: int = ...): ...
+    def isEnabledFor(self, level: int) -> bool: ...
+    def info(self, msg: str, *args): ...
+    def warning(self, msg: str, *args): ...
+    def error(self, msg: str, *args): ...
+    def summary(self, changes: dict): ...
+
+class NullLogger:
+    def isEnabledFor(self, level: int) -> bool: ...
+    def info(self, msg: str, *args) -> None: ...
+    def warning(self, msg: str, *args) -> None: ...
+    def error(self, msg: str, *args) -> None: ...
+    def summary(self, changes: dict) -> None: ...
+
+NULL_LOGGER: NullLogger
+
+def render(value, max_chars: int = ...) -> str: ...
+
+class ElementChanges(NamedTuple):
+    added: list
+    removed: list
+
+def element_changes(bench_value, test_value) -> ElementChanges: ...
+def multiset(collection) -> Dict[Any, int]: ...
+
+MAX_SEQUENCE_EDITS: int
+
+class EditCapExceeded(Exception): ...
+
+def matching_blocks(first, second, max_edits: int = None) -> list: ...
+
+ADD_DECISION: str
+PATCH_ADD: str
+PATCH_REPLACE: str
+PATCH_REMOVE: str
+
+class Patch:
+    ops: list
+    def __init__(self, ops=()): ...
+    @classmethod
+    def compile(cls, ops, check_overlap: bool = True) -> "Patch": ...
+    def __len__(self) -> int: ...
+    def __iter__(self) -> Iterator[tuple]: ...
+    def to_list(self) -> list: ...
+    @classmethod
+    def from_list(cls, items) -> "Patch": ...
+    def to_delta(self) -> dict: ...
+    def apply(self, target: dict) -> dict: ...
+    def applied(self, target: dict) -> dict: ...
+
+class ListPatch:
+    ops: list
+    source_length: int
+    source_digest: bytes
+    def __init__(self, ops: list, source_length: int, source_digest: bytes): ...
+    @classmethod
+    def between(cls, test_list, bench_list, max_edits: int = None) -> Optional["ListPatch"]: ...
+    def apply(self, target) -> Union[list, tuple]: ...
+
+def encode_diff(diff: Union["DictDiff", "Patch", dict]) -> bytes: ...
+def decode_diff(data, offset: int = 0) -> Union["DictDiff", "Patch", dict]: ...
+
+class DiffArchive:
+    path: str
+    def __init__(self, path): ...
+    def __len__(self) -> int: ...
+    def __iter__(self) -> Iterator: ...
+    def __contains__(self, diff_id) -> bool: ...
+    def __getitem__(self, diff_id) -> Union["DictDiff", "Patch", dict]: ...
+    def __enter__(self) -> "DiffArchive": ...
+    def __exit__(self, *exc_info) -> None: ...
+    def append(self, diff_id, diff: Union["DictDiff", "Patch", dict]) -> None: ...
+    def get(self, diff_id, default=None): ...
+    def paths(self, diff_id) -> List[tuple]: ...
+    def close(self) -> None: ...
+
+class VersionStore:
+    checkpoint_interval: int
+    comparator: Comparator
+    def __init__(self, checkpoint_interval: int = 16): ...
+    def __len__(self) -> int: ...
+    def versions(self) -> range: ...
+    def commit(self, document: dict) -> int: ...
+    def get(self, version: int = None) -> dict: ...
+    def delta(self, version: int) -> "Patch": ...
+    def changed(self, path) -> List[int]: ...
+    def compact(self, before: int) -> None: ...
+
+class DictDiff:
+    added: MutableMapping[tuple, Any]
+    removed: MutableMapping[tuple, Any]
+    modified: MutableMapping[tuple, tuple]
+    def __init__(self, added: dict = None, removed: dict = None, modified: dict = None): ...
+    def update(self, diff: "DictDiff", key: str = None): ...
+    @property
+    def changes(self) -> dict: ...
+    def node_count(self) -> int: ...
+    def record(self, event: DiffEvent) -> None: ...
+    def events(self) -> Iterator[DiffEvent]: ...
+    def touches(self, path: tuple) -> bool: ...
+    def pop_subtree(self, path: tuple) -> list: ...
+    def node_at(self, path: tuple): ...
+    def element_changes(self, path: tuple) -> ElementChanges: ...
+
+class ThreeWayDiff:
+    original: DictDiff
+    revised: DictDiff
+    both: DictDiff
+    conflicts: Dict[tuple, Tuple[Tuple[DiffEvent, ...], Tuple[DiffEvent, ...]]]
+    def __init__(self): ...
+    def record(self, side: str, event: DiffEvent) -> None: ...
+    def settle(self) -> None: ...
+    def status(self, path) -> str: ...
+
+class SessionUpdate(NamedTuple):
+    diffs: "DictDiff"
+    appeared: list
+    resolved: list
+
+class CompareSession:
+    comparator: Comparator
+    test: dict
+    diffs: "DictDiff"
+    def __init__(
+        self,
+        benchmark: dict,
+        test: dict,
+        key: str = None,
+        avoid_inner_order: bool = False,
+        logger=None,
+        stats: "CompareStats" = None,
+        **options
+    ): ...
+    def touch(self, *paths) -> None: ...
+    def tracked(self) -> "TrackedDict": ...
+    def refresh(self) -> SessionUpdate: ...
+
+class TrackedDict(MutableMapping):
+    def __init__(self, data: dict, session: CompareSession, path: tuple = ()): ...
+    def __getitem__(self, key): ...
+    def __setitem__(self, key, value) -> None: ...
+    def __delitem__(self, key) -> None: ...
+    def __iter__(self) -> Iterator: ...
+    def __len__(self) -> int: ...
+
+class ResultCache:
+    max_entries: int
+    max_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 67108864): ...
+    def __len__(self) -> int: ...
+    def clear(self) -> None: ...
+    def as_dict(self) -> Dict[str, int]: ...
+    def compare(
+        self,
+        benchmark: dict,
+        test: dict,
+        key: str = None,
+        avoid_inner_order: bool = False,
+        **kwargs
+    ) -> "DictDiff": ...
+    def update(
+        self,
+        benchmark: dict,
+        test: dict,
+        avoid_inner_order: bool = True,
+        changed_fields=None,
+        as_patch: bool = False,
+        **kwargs
+    ) -> Union[dict, "Patch"]: ...
+    def updated(
+        self, benchmark: dict, test: dict, avoid_inner_order: bool = True, changed_fields=None, **kwargs
+    ) -> dict: ...
+
+class CompareStats:
+    PHASES: tuple
+    COUNTERS: tuple
+    timings: Dict[str, float]
+    counters: Dict[str, int]
+    def __init__(self): ...
+    def reset(self): ...
+    def merge(self, other: "CompareStats"): ...
+    def as_dict(self) -> Dict[str, Union[int, float]]: ...
+    def export(self, emit: Callable[[str, Union[int, float]], Any], prefix: str = "dict_compare"): ...
+
+class Fingerprints:
+    document: dict
+    def __init__(self, document: dict = None): ...
+    def __len__(self) -> int: ...
+    def digest(self, value) -> bytes: ...
+
+class ExactFingerprints(Fingerprints): ...
+
+class BenchSide:
+    value: Any
+    def __init__(self, value): ...
+    def same_type(self) -> bool: ...
+    def items(self) -> dict: ...
+
+class Normalized:
+    document: dict
+    fix_funcs: Dict[str, tuple]
+    def __init__(self, document: dict, fix_funcs: Dict[str, tuple]): ...
+    def __len__(self) -> int: ...
+    def fixed(self, keys, value, logger=None, stats: "CompareStats" = None): ...
+    def multiset(self, collection) -> Dict[Any, int]: ...
+
+class BenchmarkPlan:
+    comparator: Comparator
+    benchmark: dict
+    fingerprints: Fingerprints
+    normalized: Normalized
+    def __init__(
+        self,
+        comparator: Comparator,
+        benchmark: dict,
+        fingerprints=None,
+        logger=None,
+        normalized: Normalized = None,
+    ): ...
+    def __len__(self) -> int: ...
+    def bench_side(self, bench_key, lookup_cache=None) -> "BenchSide": ...
+
+class CompareContext:
+    plan: BenchmarkPlan
+    avoid_inner_order: bool
+    logger: DictCompareLogger
+    stats: Optional[CompareStats]
+    expanded_lists: set
+    def __init__(
+        self, plan: BenchmarkPlan, avoid_inner_order=False, logger=None, stats: CompareStats = None
+    ): ...
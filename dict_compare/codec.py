@@ -0,0 +1,580 @@
+"""Binary encoding of diffs, and the DiffArchive and VersionStore files built on it"""
+
+import mmap
+import os
+import struct
+from contextlib import ExitStack
+
+from .engine import (
+    ADDED,
+    MODIFIED,
+    NOT_FOUND,
+    NULL_LOGGER,
+    PATCH_ADD,
+    PATCH_REMOVE,
+    PATCH_REPLACE,
+    Comparator,
+    DictDiff,
+    ListPatch,
+    NotFoundSentinel,
+    Patch,
+    deep_equal,
+    step_into_chain,
+    tuplize,
+)
+
+# every how many versions a VersionStore keeps a whole one
+DEFAULT_CHECKPOINT_INTERVAL = 16
+
+# leading bytes of an encoded diff and of a diff archive, with their format version
+DIFF_MAGIC = b"DDF1"
+ARCHIVE_MAGIC = b"DDA1"
+# what an encoded diff holds
+ENCODED_DICT_DIFF, ENCODED_PATCH, ENCODED_VALUE = b"D", b"P", b"V"
+# sizes of the encoded id and diff of an archive record
+RECORD_HEADER = struct.Struct("<II")
+FLOAT = struct.Struct("<d")
+# tags of the encoded collections, built back by BinaryReader.value()
+COLLECTION_TAGS = {list: b"l", tuple: b"u", set: b"e", frozenset: b"z"}
+
+
+def encode_diff(diff) -> bytes:
+    """Encode a DictDiff, a Patch or an update() delta into a compact binary form
+
+    Every string (path segment, key or leaf) is written once, where it first
+    appears, and referred back to by its index in that string table afterwards.
+    Leaves are typed, so decode_diff() gives back the same ints, floats, tuples
+    and sets. The (kind, path) entries come before the values,
+    so they can be read alone (see DiffArchive.paths()).
+    """
+    writer = BinaryWriter()
+    if isinstance(diff, DictDiff):
+        kind, entries = ENCODED_DICT_DIFF, []
+        for event in diff.events():
+            if event.kind == MODIFIED:
+                values = (event.bench_value, event.test_value)
+            elif event.kind == ADDED:
+                values = (event.bench_value,)
+            else:
+                values = (event.test_value,)
+            entries.append((event.kind, event.path, values))
+    elif isinstance(diff, Patch):
+        kind = ENCODED_PATCH
+        entries = [(op, path, (value,)) for op, path, value in diff]
+    else:
+        kind, entries = ENCODED_VALUE, [("", (), (diff,))]
+    writer.varint(len(entries))
+    for tag, path, _ in entries:
+        writer.value(tag)
+        writer.value(path)
+    for _, _, values in entries:
+        for value in values:
+            writer.value(value)
+    return writer.getvalue(kind)
+
+
+def decode_diff(data, offset: int = 0):
+    """Decode what encode_diff() encoded, from data (bytes or an mmap) at offset"""
+    reader = BinaryReader(data, offset)
+    try:
+        kind = reader.header()
+        entries = reader.entries()
+        if kind == ENCODED_DICT_DIFF:
+            diffs = DictDiff()
+            for tag, path in entries:
+                if tag == MODIFIED:
+                    diffs.modified[path] = (reader.value(), reader.value())
+                elif tag == ADDED:
+                    diffs.added[path] = reader.value()
+                else:
+                    diffs.removed[path] = reader.value()
+            return diffs
+        if kind == ENCODED_PATCH:
+            return Patch([(op, path, reader.value()) for op, path in entries])
+        return reader.value()
+    except IndexError:
+        raise ValueError("encoded diff is cut short") from None
+
+
+class BinaryWriter:
+    """The body of an encoded diff, as it's written"""
+
+    __slots__ = ("body", "_strings")
+
+    def __init__(self):
+        self.body = bytearray()
+        # string -> index in the table
+        self._strings = {}
+
+    def varint(self, number: int):
+        body = self.body
+        while number > 0x7F:
+            body.append(number & 0x7F | 0x80)
+            number >>= 7
+        body.append(number)
+
+    def value(self, value):
+        """Append a typed value; collections are written without recursing"""
+        stack = [value]
+        while stack:
+            value = stack.pop()
+            write = self.WRITERS.get(type(value)) or self.writer_of(value)
+            write(self, value, stack)
+
+    def writer_of(self, value):
+        """The writer of a value of a subclass of an encoded type"""
+        for kind, write in self.WRITERS.items():
+            if isinstance(value, kind):
+                return write
+        raise TypeError(f"can't encode a {type(value).__name__}: {value!r}")
+
+    def _string(self, value, _):
+        self.body += b"s"
+        index = self._strings.get(value)
+        if index is None:
+            # a new string: its size and bytes, and the next index
+            self._strings[value] = len(self._strings)
+            encoded = value.encode("utf-8", "surrogatepass")
+            self.varint(len(encoded) << 1 | 1)
+            self.body += encoded
+        else:
+            self.varint(index << 1)
+
+    def _constant(self, value, _):
+        self.body += b"n" if value is None else b"x" if value is NOT_FOUND else b"t" if value else b"f"
+
+    def _int(self, value, _):
+        self.body += b"i"
+        # zigzag: small negative numbers stay short
+        self.varint(value << 1 if value >= 0 else ~value << 1 | 1)
+
+    def _float(self, value, _):
+        self.body += b"d" + FLOAT.pack(value)
+
+    def _bytes(self, value, _):
+        self.body += b"b"
+        self.varint(len(value))
+        self.body += value
+
+    def _dict(self, value, stack):
+        self.body += b"m"
+        self.varint(len(value))
+        stack.extend(reversed([part for item in value.items() for part in item]))
+
+    def _collection(self, value, stack):
+        tag = COLLECTION_TAGS.get(type(value))
+        if tag is None:
+            tag = next(t for base, t in COLLECTION_TAGS.items() if isinstance(value, base))
+        self.body += tag
+        self.varint(len(value))
+        stack.extend(reversed(list(value)))
+
+    def _list_patch(self, value, stack):
+        self.body += b"p"
+        stack.extend((value.source_digest, value.source_length, value.ops))
+
+    # exact type -> writer; subclasses are matched in this order by writer_of()
+    WRITERS = {
+        str: _string,
+        bool: _constant,
+        type(None): _constant,
+        NotFoundSentinel: _constant,
+        int: _int,
+        float: _float,
+        dict: _dict,
+        list: _collection,
+        tuple: _collection,
+        set: _collection,
+        frozenset: _collection,
+        bytes: _bytes,
+        ListPatch: _list_patch,
+    }
+
+    def getvalue(self, kind: bytes) -> bytes:
+        return b"".join((DIFF_MAGIC, kind, self.body))
+
+
+class BinaryReader:
+    """Reads an encoded diff from bytes or an mmap, from an offset on"""
+
+    __slots__ = ("data", "pos", "strings")
+
+    def __init__(self, data, pos: int = 0):
+        self.data = data
+        self.pos = pos
+        self.strings = []
+
+    def varint(self) -> int:
+        data, pos = self.data, self.pos
+        number = shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            number |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                self.pos = pos
+                return number
+            shift += 7
+
+    def checked_end(self, size: int) -> int:
+        """The end of the next size bytes, which must all be there"""
+        end = self.pos + size
+        if end > len(self.data):
+            raise IndexError(end)
+        return end
+
+    def header(self) -> bytes:
+        """Check the magic and return the kind of the diff"""
+        start = self.pos
+        if self.data[start : start + len(DIFF_MAGIC)] != DIFF_MAGIC:
+            raise ValueError("not an encoded diff")
+        self.pos = start + len(DIFF_MAGIC) + 1
+        return self.data[start + len(DIFF_MAGIC) : self.pos]
+
+    def entries(self) -> list:
+        """The (kind or op, path) entries, leaving the reader at the first value"""
+        return [(self.value(), self.value()) for _ in range(self.varint())]
+
+    def value(self):
+        """Read a typed value; collections are built without recursing"""
+        data = self.data
+        # [tag, items left to read, items read] of the collections being read
+        stack = []
+        while True:
+            tag = bytes(data[self.pos : self.pos + 1])
+            self.pos += 1
+            read = self.READERS.get(tag)
+            if read is None:
+                if not tag:
+                    raise IndexError(self.pos)
+                raise ValueError(f"unknown tag {tag!r} at {self.pos - 1}")
+            depth = len(stack)
+            value = read(self, tag, stack)
+            if len(stack) > depth:
+                # a collection was opened: its items come next
+                continue
+            # hand the value to the collections it completes
+            while stack:
+                top = stack[-1]
+                top[2].append(value)
+                top[1] -= 1
+                if top[1]:
+                    break
+                stack.pop()
+                value = build_collection(top[0], top[2])
+            else:
+                return value
+
+    def _string(self, _, __):
+        ref = self.varint()
+        if not ref & 1:
+            return self.strings[ref >> 1]
+        end = self.checked_end(ref >> 1)
+        value = bytes(self.data[self.pos : end]).decode("utf-8", "surrogatepass")
+        self.strings.append(value)
+        self.pos = end
+        return value
+
+    def _int(self, _, __):
+        number = self.varint()
+        return ~(number >> 1) if number & 1 else number >> 1
+
+    def _float(self, _, __):
+        end = self.checked_end(FLOAT.size)
+        value = FLOAT.unpack_from(self.data, self.pos)[0]
+        self.pos = end
+        return value
+
+    def _bytes(self, _, __):
+        end = self.checked_end(self.varint())
+        value = bytes(self.data[self.pos : end])
+        self.pos = end
+        return value
+
+    def _collection(self, tag, stack):
+        """An empty collection, or None with the collection pushed on stack to read its items"""
+        size = 3 if tag == b"p" else self.varint() * (2 if tag == b"m" else 1)
+        if size:
+            stack.append([tag, size, []])
+            return None
+        return build_collection(tag, [])
+
+    # tag -> reader
+    READERS = {
+        b"s": _string,
+        b"i": _int,
+        b"d": _float,
+        b"b": _bytes,
+        b"n": lambda *_: None,
+        b"t": lambda *_: True,
+        b"f": lambda *_: False,
+        b"x": lambda *_: NOT_FOUND,
+        **dict.fromkeys((b"l", b"u", b"e", b"z", b"m", b"p"), _collection),
+    }
+
+
+def build_collection(tag: bytes, items: list):
+    if tag == b"l":
+        return items
+    if tag == b"m":
+        return dict(zip(items[::2], items[1::2]))
+    if tag == b"p":
+        return ListPatch(*items)
+    return {b"u": tuple, b"e": set, b"z": frozenset}[tag](items)
+
+
+class DiffArchive:
+    """An append-only file of diffs encoded by encode_diff(), read back by id through mmap
+
+    Opening an archive scans its record headers and ids into an offset index - no
+    diff is decoded - and drops a last record cut short by a crash. A diff appended
+    again under an id shadows the older one. Reads go through a read-only mmap of
+    the file, so getting one diff, or only its paths, decodes that record alone.
+    Ids are any value encode_diff() can encode.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # diff id -> offset of its encoded diff
+        self._index = {}
+        self._map = None
+        # the file and its map are closed again if opening fails anywhere
+        with ExitStack() as on_error:
+            self._file = on_error.enter_context(open(path, "a+b"))
+            on_error.callback(self._unmap)
+            self._file.seek(0, os.SEEK_END)
+            if not self._file.tell():
+                self._file.write(ARCHIVE_MAGIC)
+                self._file.flush()
+            self._end = self._file.tell()
+            self._scan()
+            on_error.pop_all()
+
+    def __repr__(self):
+        return f"DiffArchive({self.path!r}, {len(self)} diffs)"
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __contains__(self, diff_id):
+        return diff_id in self._index
+
+    def __getitem__(self, diff_id):
+        return decode_diff(self._mapped(), self._index[diff_id])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _scan(self):
+        data = self._mapped()
+        if data[: len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+            raise ValueError(f"{self.path} is not a diff archive")
+        pos, size = len(ARCHIVE_MAGIC), len(data)
+        while pos + RECORD_HEADER.size <= size:
+            id_size, diff_size = RECORD_HEADER.unpack_from(data, pos)
+            start = pos + RECORD_HEADER.size
+            if start + id_size + diff_size > size:
+                break
+            self._index[decode_diff(data, start)] = start + id_size
+            pos = start + id_size + diff_size
+        if pos < size:
+            # the next append goes right after the last whole record
+            self._unmap()
+            self._file.truncate(pos)
+        self._end = pos
+
+    def _mapped(self):
+        if self._map is None or len(self._map) < self._end:
+            self._unmap()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _unmap(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def append(self, diff_id, diff):
+        """Encode diff and write it at the end of the archive under diff_id"""
+        encoded_id, encoded = encode_diff(diff_id), encode_diff(diff)
+        self._file.write(RECORD_HEADER.pack(len(encoded_id), len(encoded)) + encoded_id + encoded)
+        self._file.flush()
+        self._index[diff_id] = self._end + RECORD_HEADER.size + len(encoded_id)
+        self._end = self._index[diff_id] + len(encoded)
+
+    def get(self, diff_id, default=None):
+        return self[diff_id] if diff_id in self._index else default
+
+    def paths(self, diff_id) -> list:
+        """The (kind or op, path) entries of a diff, without decoding any of its values"""
+        reader = BinaryReader(self._mapped(), self._index[diff_id])
+        reader.header()
+        return reader.entries()
+
+    def close(self):
+        self._unmap()
+        self._file.close()
+
+
+class VersionStore:
+    """The versions of a document, kept as periodic checkpoints and forward Patches
+
+    commit() diffs each new version against the previous one and keeps the Patch
+    between them, encoded (see encode_diff()); every checkpoint_interval-th
+    version is kept whole as well. get() decodes the nearest checkpoint at or
+    before a version and applies the Patches after it, so at most
+    checkpoint_interval - 1 of them. changed() answers which versions touched a
+    key chain from an index of the Patches' paths, and compact() drops the
+    oldest versions.
+
+    Versions are diffed by a plain Comparator. A version its Patch doesn't
+    reproduce (under keys starting with "_", which compare() skips) is kept
+    whole too, and counts as changing every path; leaves that are equal, like
+    1 and True, aren't told apart. Documents hold what encode_diff() can
+    encode, and are copied on the way in and out; dict key order isn't kept.
+    """
+
+    def __init__(self, checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL):
+        if checkpoint_interval < 1:
+            raise ValueError("checkpoint_interval must be at least 1")
+        self.checkpoint_interval = checkpoint_interval
+        self.comparator = Comparator()
+        # version -> encoded whole document, of the checkpoints
+        self._checkpoints = {}
+        # version -> encoded Patch from the version before, of every version but the first
+        self._patches = {}
+        # key chain -> versions with an op at it, and versions with an op at or under it
+        self._ops_at = {}
+        self._ops_under = {}
+        # versions whose Patch didn't reproduce them: they may have changed any path
+        self._inexact = set()
+        self._first = 0
+        self._next = 0
+        # a private copy of the last version, to diff the next one against
+        self._head = None
+
+    def __len__(self):
+        return self._next - self._first
+
+    def __repr__(self):
+        return (
+            f"VersionStore({len(self)} versions from {self._first}, "
+            f"{len(self._checkpoints)} checkpoints)"
+        )
+
+    def versions(self) -> range:
+        return range(self._first, self._next)
+
+    def commit(self, document: dict) -> int:
+        """Store document as the next version and return its number"""
+        version = self._next
+        if self._head is not None:
+            patch = self._patch_to(document)
+            encoded = encode_diff(patch)
+            self._patches[version] = encoded
+            self._index(version, patch)
+            decode_diff(encoded).apply(self._head)
+        if self._head is not None and not deep_equal(self._head, document):
+            self._inexact.add(version)
+            self._head = None
+        if self._head is None or version % self.checkpoint_interval == 0:
+            encoded = encode_diff(document)
+            self._checkpoints[version] = encoded
+            self._head = decode_diff(encoded)
+        self._next += 1
+        return version
+
+    def _patch_to(self, document):
+        """The Patch from the last version to document"""
+        ops = []
+        removed = set()
+        for kind, path, bench_value, _ in self.comparator.iter_diffs(
+            document, self._head, logger=NULL_LOGGER
+        ):
+            if kind == ADDED:
+                ops.append((PATCH_ADD, path, bench_value))
+            elif kind == MODIFIED and isinstance(bench_value, dict):
+                # a dict value is merged into what's there: set it on a clean slate
+                ops.append((PATCH_REMOVE, path, None))
+                ops.append((PATCH_ADD, path, bench_value))
+            elif kind == MODIFIED:
+                ops.append((PATCH_REPLACE, path, bench_value))
+            else:
+                # compare() reports the leaves of a removed subtree: remove the subtree
+                end = next(
+                    (
+                        end
+                        for end in range(1, len(path))
+                        if step_into_chain(document, path[:end]) is NOT_FOUND
+                    ),
+                    len(path),
+                )
+                if path[:end] not in removed:
+                    removed.add(path[:end])
+                    ops.append((PATCH_REMOVE, path[:end], None))
+        return Patch.compile(ops, check_overlap=False)
+
+    def _index(self, version, patch):
+        for _, path, _ in patch:
+            self._ops_at.setdefault(path, []).append(version)
+            for end in range(len(path) + 1):
+                self._ops_under.setdefault(path[:end], []).append(version)
+
+    def _check(self, version):
+        if version is None:
+            version = self._next - 1
+        if not self._first <= version < self._next:
+            raise KeyError(f"version {version} isn't in the store")
+        return version
+
+    def get(self, version: int = None) -> dict:
+        """A copy of a version, by default the last one"""
+        version = self._check(version)
+        start = version
+        while start not in self._checkpoints:
+            start -= 1
+        document = decode_diff(self._checkpoints[start])
+        for later in range(start + 1, version + 1):
+            decode_diff(self._patches[later]).apply(document)
+        return document
+
+    def delta(self, version: int) -> "Patch":
+        """The Patch from the version before to version"""
+        version = self._check(version)
+        if version not in self._patches:
+            raise KeyError(f"version {version} has no version before it")
+        return decode_diff(self._patches[version])
+
+    def changed(self, path) -> list:
+        """The versions whose Patch changed path: at it, under it or over it"""
+        path = tuplize(path)
+        versions = self._inexact | set(self._ops_under.get(path, ()))
+        for end in range(len(path)):
+            versions.update(self._ops_at.get(path[:end], ()))
+        return sorted(v for v in versions if v > self._first)
+
+    def compact(self, before: int):
+        """Drop the versions before `before`, which becomes a checkpoint if it isn't one"""
+        before = self._check(before)
+        if before not in self._checkpoints:
+            self._checkpoints[before] = encode_diff(self.get(before))
+        for version in range(self._first, before):
+            self._checkpoints.pop(version, None)
+            self._patches.pop(version, None)
+            self._inexact.discard(version)
+        self._patches.pop(before, None)
+        self._first = before
+        for index in (self._ops_at, self._ops_under):
+            for path in list(index):
+                kept = [v for v in index[path] if v > before]
+                if kept:
+                    index[path] = kept
+                else:
+                    del index[path]
+
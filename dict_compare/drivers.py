@@ -0,0 +1,346 @@
+"""The batch drivers of dict_compare: process pool and asyncio front-ends over a Comparator"""
+
+import asyncio
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+
+from .engine import (
+    Comparator,
+    CompareContext,
+    DictCompareLogger,
+    compare,
+    iter_tests,
+)
+
+# compares running at once in an acompare_stream()
+DEFAULT_MAX_IN_FLIGHT = 8
+
+
+def compare_parallel(
+    benchmark: dict,
+    tests,
+    workers: int = None,
+    chunk_size: int = 64,
+    ordered: bool = True,
+    key: str = None,
+    avoid_inner_order: bool = False,
+    external_logger=None,
+    diff_id=None,
+    mp_context=None,
+    **kwargs,
+):
+    """compare_many() on a process pool, yielding (test_id, DictDiff)
+
+    Every worker gets the comparator and the benchmark once and prepares its own
+    plan; only chunks of chunk_size tests and their diffs cross processes. Results
+    come in the order of tests, or as they complete when ordered=False. The
+    workers log through external_logger and diff_id; logger, fingerprints,
+    normalized and stats belong to this process and raise TypeError.
+    """
+    check_parallel_options(kwargs)
+    options = dict(
+        key=key,
+        avoid_inner_order=avoid_inner_order,
+        external_logger=external_logger,
+        diff_id=diff_id,
+    )
+    return run_parallel(
+        Comparator.from_kwargs(**kwargs),
+        benchmark,
+        tests,
+        "compare",
+        options,
+        workers,
+        chunk_size,
+        ordered,
+        mp_context,
+    )
+
+
+async def acompare(benchmark: dict, test: dict, executor=None, **kwargs):
+    """compare() on an executor (the loop's default one if None), without blocking the loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(compare, benchmark, test, **kwargs))
+
+
+async def acompare_stream(
+    source,
+    benchmark: dict = None,
+    executor=None,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    ordered: bool = False,
+    **kwargs,
+):
+    """Compare the documents of an async iterable on an executor, yielding (id, DictDiff)
+
+    source yields (id, test) pairs compared to benchmark, or (id, benchmark, test)
+    triples. At most max_in_flight compares run at once: source isn't read further
+    until one finishes, so a slow consumer holds back a fast source. Results are
+    yielded as they finish, or in the order of source when ordered=True, where the
+    results held back for an earlier one count against max_in_flight too. The
+    first compare to fail raises. On a thread executor the plan of benchmark is
+    shared by the pairs; a ProcessPoolExecutor gets each document and the options
+    pickled, so fix_funcs must be module-level functions there.
+    """
+    loop = asyncio.get_running_loop()
+    window = StreamWindow(stream_submitter(loop, benchmark, executor, kwargs), max_in_flight, ordered)
+    items = source.__aiter__()
+    fetch = None
+    exhausted = False
+    try:
+        while True:
+            if fetch is None and not exhausted and window.has_room():
+                fetch = asyncio.ensure_future(items.__anext__())
+            waiting = set(window.in_flight)
+            if fetch is not None:
+                waiting.add(fetch)
+            if not waiting:
+                return
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            if fetch in done:
+                exhausted = not window.submit(fetch)
+                fetch = None
+            for result in window.drain(done):
+                yield result
+    finally:
+        if fetch is not None:
+            fetch.cancel()
+        window.cancel()
+
+
+def update_parallel(
+    benchmark: dict,
+    tests,
+    workers: int = None,
+    chunk_size: int = 64,
+    ordered: bool = True,
+    avoid_inner_order: bool = True,
+    changed_fields_of=None,
+    external_logger=None,
+    diff_id=None,
+    mp_context=None,
+    **kwargs,
+):
+    """update() of many tests on a process pool, yielding (test_id, changes)
+
+    Workers compute the deltas, which are merged into the caller's tests as they
+    come back, so every test ends up exactly as the serial update() leaves it.
+    changed_fields_of(test), when given, returns the changed_fields of one test
+    and must be picklable (a module-level function). as_patch=True yields the
+    Patches, which are also smaller to send back than nested deltas. The workers
+    log through external_logger and diff_id; logger, fingerprints, normalized and
+    stats belong to this process and raise TypeError.
+    """
+    check_parallel_options(kwargs)
+    options = dict(
+        avoid_inner_order=avoid_inner_order,
+        changed_fields_of=changed_fields_of,
+        external_logger=external_logger,
+        diff_id=diff_id,
+        as_patch=kwargs.get("as_patch", False),
+    )
+    return run_parallel(
+        Comparator.from_kwargs(**kwargs),
+        benchmark,
+        tests,
+        "update",
+        options,
+        workers,
+        chunk_size,
+        ordered,
+        mp_context,
+    )
+
+
+def iter_chunks(items, chunk_size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# per-call options bound to the caller's process: the workers couldn't use them
+PROCESS_LOCAL_OPTIONS = ("logger", "fingerprints", "normalized", "stats")
+
+
+def check_parallel_options(kwargs):
+    """Raise TypeError when kwargs set an option the workers of run_parallel can't use"""
+    local = [name for name in PROCESS_LOCAL_OPTIONS if kwargs.get(name) is not None]
+    if local:
+        raise TypeError(
+            f"{', '.join(local)} can't be sent to worker processes"
+            " (they log through external_logger and diff_id)"
+        )
+
+
+# state of a parallel worker process, set once by init_worker()
+WORKER_STATE = {}
+
+
+def init_worker(comparator, benchmark, task, options):
+    options = dict(options)
+    logger = DictCompareLogger.init_logger(
+        options.pop("diff_id"), options.pop("external_logger")
+    )
+    WORKER_STATE.update(
+        comparator=comparator,
+        plan=comparator.prepare(benchmark, logger=logger),
+        task=task,
+        logger=logger,
+        options=options,
+    )
+
+
+def run_worker_chunk(chunk):
+    comparator, plan, logger, options = (
+        WORKER_STATE[k] for k in ("comparator", "plan", "logger", "options")
+    )
+    results = []
+    for test_id, test in chunk:
+        context = CompareContext(plan, options["avoid_inner_order"], logger)
+        if WORKER_STATE["task"] == "compare":
+            result = comparator.compare_in(test, options["key"], context)
+        else:
+            changed_fields_of = options["changed_fields_of"]
+            changed_fields = changed_fields_of(test) if changed_fields_of else None
+            result = comparator.delta_in(test, context, changed_fields)
+            logger.summary(result)
+        results.append((test_id, result))
+    return results
+
+
+def run_parallel(
+    comparator, benchmark, tests, task, options, workers, chunk_size, ordered, mp_context
+):
+    """Stream chunks of tests through a process pool, keeping a bounded number in flight"""
+    workers = workers or os.cpu_count() or 1
+    as_patch = options.pop("as_patch", False)
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp_context,
+        initializer=init_worker,
+        initargs=(comparator, benchmark, task, options),
+    )
+    chunks = iter_chunks(iter_tests(tests), chunk_size)
+    in_flight = {}
+    with pool:
+        for chunk in chunks:
+            in_flight[pool.submit(run_worker_chunk, chunk)] = chunk
+            if len(in_flight) < workers * 2:
+                continue
+            yield from collect_parallel(in_flight, task, ordered, as_patch)
+        while in_flight:
+            yield from collect_parallel(in_flight, task, ordered, as_patch)
+
+
+def collect_parallel(in_flight, task, ordered, as_patch=False):
+    """Pop and yield the results of the next finished chunk (the oldest one if ordered)"""
+    if ordered:
+        future = next(iter(in_flight), None)
+    else:
+        future = next(iter(wait(in_flight, return_when=FIRST_COMPLETED).done), None)
+    if future is None:
+        return
+    chunk = in_flight.pop(future)
+    results = future.result()
+    if task == "update":
+        # workers send back Patches: flat and smaller to pickle than nested deltas
+        for (_, test), (_, patch) in zip(chunk, results):
+            patch.apply(test)
+        if not as_patch:
+            results = [(test_id, patch.to_delta()) for test_id, patch in results]
+    yield from results
+
+
+def stream_submitter(loop, benchmark, executor, options):
+    """Return submit((id, test) or (id, benchmark, test)) -> future of its DictDiff"""
+    compare_on_plan = None
+    if benchmark is not None and not isinstance(executor, ProcessPoolExecutor):
+        # threads share the comparator and the plan of the stream's benchmark
+        comparator = Comparator.from_kwargs(**options)
+        logger = DictCompareLogger.init_logger(
+            options.get("diff_id"), options.get("external_logger"), logger=options.get("logger")
+        )
+        plan = comparator.prepare(
+            benchmark, options.get("fingerprints"), logger, options.get("normalized")
+        )
+        compare_on_plan = partial(
+            compare_prepared,
+            comparator,
+            plan,
+            key=options.get("key"),
+            avoid_inner_order=options.get("avoid_inner_order", False),
+            logger=logger,
+            stats=options.get("stats"),
+        )
+
+    def submit(item):
+        if len(item) == 3:
+            _, item_benchmark, test = item
+        elif benchmark is None:
+            raise ValueError("an (id, test) pair needs acompare_stream(benchmark=...)")
+        else:
+            (_, test), item_benchmark = item, benchmark
+        if compare_on_plan is not None and item_benchmark is benchmark:
+            return loop.run_in_executor(executor, compare_on_plan, test)
+        return loop.run_in_executor(executor, partial(compare, item_benchmark, test, **options))
+
+    return submit
+
+
+class StreamWindow:
+    """The compares of acompare_stream in flight, and when ordered, those done ahead of their turn"""
+
+    __slots__ = ("submitter", "max_in_flight", "ordered", "in_flight", "finished", "submitted", "yielded")
+
+    def __init__(self, submitter, max_in_flight, ordered):
+        self.submitter = submitter
+        self.max_in_flight = max_in_flight
+        self.ordered = ordered
+        self.in_flight = {}  # future -> (index in source, id)
+        self.finished = {}  # index -> (id, diffs) waiting for an earlier index, when ordered
+        self.submitted = self.yielded = 0
+
+    def has_room(self):
+        """Whether another item of the source may be read"""
+        return len(self.in_flight) + len(self.finished) < self.max_in_flight
+
+    def submit(self, fetch):
+        """Submit the item a finished fetch of the source got, False when the source is exhausted"""
+        try:
+            item = fetch.result()
+        except StopAsyncIteration:
+            return False
+        self.in_flight[self.submitter(item)] = (self.submitted, item[0])
+        self.submitted += 1
+        return True
+
+    def drain(self, done):
+        """Pop and yield the (id, diffs) of the done compares that are due"""
+        for future in done:
+            if future not in self.in_flight:
+                continue
+            index, test_id = self.in_flight.pop(future)
+            if not self.ordered:
+                yield test_id, future.result()
+                continue
+            self.finished[index] = (test_id, future.result())
+            while self.yielded in self.finished:
+                yield self.finished.pop(self.yielded)
+                self.yielded += 1
+
+    def cancel(self):
+        for future in self.in_flight:
+            future.cancel()
+
+
+def compare_prepared(comparator, plan, test, key=None, avoid_inner_order=False, logger=None, stats=None):
+    """comparator's compare of test to the benchmark of a plan prepared beforehand"""
+    context = CompareContext(plan, avoid_inner_order, logger, stats)
+    return comparator.compare_in(test, key, context)
+
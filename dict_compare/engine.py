@@ -0,0 +1,3477 @@
+import logging
+import pickle
+import reprlib
+from contextlib import contextmanager, nullcontext
+from collections import Counter, OrderedDict, namedtuple
+from collections.abc import Hashable, ItemsView, Mapping, MutableMapping
+from hashlib import blake2b
+from itertools import chain, islice
+from sys import intern
+from time import perf_counter
+from typing import Set, Any, Dict, Union
+
+
+COLLECTION_VAR = (tuple, list, set)
+
+__all__ = (
+    "CompareStats",
+    "Comparator",
+    "CompareSession",
+    "ResultCache",
+    "ThreeWayDiff",
+    "DiffEvent",
+    "NULL_LOGGER",
+    "Normalized",
+    "Fingerprints",
+    "ListPatch",
+    "Patch",
+    "compare",
+    "compare_many",
+    "compare_with_reference",
+    "first_difference",
+    "is_equal",
+    "iter_diffs",
+    "update",
+    "updated",
+    "merge_dicts",
+    "reconcile",
+)
+
+
+LOG_HANDLER_NAME = "dict_compare"
+# longest rendering of a single logged value: a diff or delta of a big document is cut
+MAX_RENDERED_CHARS = 2000
+
+# bounds of a ResultCache: entries, and bytes of pickled results
+DEFAULT_CACHE_ENTRIES = 1024
+DEFAULT_CACHE_BYTES = 64 << 20
+
+
+def get_logger():
+    base_logger = logging.getLogger()
+    # the handler is installed once per process, not once per compare
+    if not any(h.get_name() == LOG_HANDLER_NAME for h in base_logger.handlers):
+        handler = logging.StreamHandler()
+        handler.set_name(LOG_HANDLER_NAME)
+        log_format = "%(asctime)s [%(levelname)-1s]  %(message)s"
+        handler.setFormatter(logging.Formatter(log_format))
+        base_logger.addHandler(handler)
+        base_logger.setLevel(logging.INFO)
+    return base_logger
+
+
+class CappedRepr(reprlib.Repr):
+    """reprlib.Repr that keeps mapping order and renders DictDiffs without a full walk"""
+
+    def __init__(self):
+        super().__init__()
+        self.maxlevel = 6
+        self.maxdict = self.maxlist = self.maxtuple = self.maxset = 50
+        self.maxstring = self.maxother = 200
+
+    def repr_dict(self, x, level):
+        return self._repr_items(x.items(), len(x), level)
+
+    def repr_DiffView(self, x, level):
+        return self._repr_items(x._items(), len(x), level)
+
+    def repr_DictDiff(self, x, level):
+        return self.repr_dict(x.changes, level)
+
+    def _repr_items(self, items, length, level):
+        if not length:
+            return "{}"
+        if level <= 0:
+            return "{" + self.fillvalue + "}"
+        pieces = [
+            f"{self.repr1(k, level - 1)}: {self.repr1(v, level - 1)}"
+            for k, v in islice(items, self.maxdict)
+        ]
+        if length > self.maxdict:
+            pieces.append(self.fillvalue)
+        return "{" + ", ".join(pieces) + "}"
+
+
+CAPPED_REPR = CappedRepr()
+
+
+def render(value, max_chars=MAX_RENDERED_CHARS) -> str:
+    """str(value), cut to max_chars and without walking more of value than is shown"""
+    text = value if isinstance(value, str) else CAPPED_REPR.repr(value)
+    if len(text) > max_chars:
+        text = f"{text[:max_chars]}...<{len(text) - max_chars} more chars>"
+    return text
+
+
+class DictCompareLogger:
+    """Prefixes messages with the diff id and formats them only when they'd be logged
+
+    Messages take %-style args, like logging: they are rendered (see render) and
+    formatted only if the level is enabled on the underlying logger.
+    """
+
+    def __init__(self, diff_id=None, external_logger=None, max_chars=MAX_RENDERED_CHARS):
+        diff_id = f"{diff_id}:" if diff_id else ""
+        self._diff_id = diff_id or "[-]"
+        self._max_chars = max_chars
+        if external_logger:
+            self._logger_to_use = external_logger
+        else:
+            self._logger_to_use = get_logger()
+
+    def __repr__(self):
+        return f"[dict_compare_logger] {self._diff_id}"
+
+    def isEnabledFor(self, level) -> bool:
+        is_enabled_for = getattr(self._logger_to_use, "isEnabledFor", None)
+        return is_enabled_for is None or is_enabled_for(level)
+
+    def _do_log(self, msg, args, level="info"):
+        if not self.isEnabledFor(LOG_LEVELS[level]):
+            return
+        if args:
+            msg = msg % tuple(render(arg, self._max_chars) for arg in args)
+        log_func = getattr(self._logger_to_use, level)
+        log_func(f"[dict_compare] {self._diff_id} {msg}")
+
+    def info(self, msg, *args):
+        return self._do_log(msg, args, "info")
+
+    def warning(self, msg, *args):
+        return self._do_log(msg, args, "warning")
+
+    def error(self, msg, *args):
+        return self._do_log(msg, args, "error")
+
+    def summary(self, changes):
+        if not changes or not self.isEnabledFor(logging.INFO):
+            return
+        if isinstance(changes, Patch):
+            changes = changes.to_delta()
+        diffs = []
+        for key, change in changes.items():
+            try:
+                for change_key, change_value in change.items():
+                    value = render(change_value, self._max_chars)
+                    diffs.append(f"{key}.{change_key}='{value}'")
+            except AttributeError:
+                diffs.append(f"{key}='{render(change, self._max_chars)}'")
+        pp_changes = "\n".join(diffs)
+        self.info("Changes |->\n%s", pp_changes)
+
+    @classmethod
+    def init_logger(cls, diff_id, external_logger, **kwargs):
+        logger = kwargs.get("logger", None)
+        if not logger:
+            logger = cls(diff_id=diff_id, external_logger=external_logger)
+        return logger
+
+
+LOG_LEVELS = {"info": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR}
+
+
+class NullLogger:
+    """A logger that drops everything: pass logger=NULL_LOGGER to skip logging on hot paths"""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return "[dict_compare_logger] null"
+
+    def isEnabledFor(self, level) -> bool:
+        return False
+
+    def info(self, msg, *args):
+        pass
+
+    def warning(self, msg, *args):
+        pass
+
+    def error(self, msg, *args):
+        pass
+
+    def summary(self, changes):
+        pass
+
+
+NULL_LOGGER = NullLogger()
+
+
+def update(
+    benchmark,
+    test,
+    external_logger=None,
+    diff_id=None,
+    avoid_inner_order=True,
+    **kwargs,
+):
+    """Compare first and then update according to the delta"""
+    return Comparator.from_kwargs(**kwargs).update(
+        benchmark,
+        test,
+        external_logger=external_logger,
+        diff_id=diff_id,
+        avoid_inner_order=avoid_inner_order,
+        logger=kwargs.get("logger"),
+        fingerprints=kwargs.get("fingerprints"),
+        normalized=kwargs.get("normalized"),
+        stats=kwargs.get("stats"),
+        as_patch=kwargs.get("as_patch", False),
+    )
+
+
+def updated(
+    benchmark,
+    test,
+    external_logger=None,
+    diff_id=None,
+    avoid_inner_order=True,
+    **kwargs,
+):
+    """Return an updated version of test, sharing its unchanged subtrees, without changing it"""
+    return Comparator.from_kwargs(**kwargs).updated(
+        benchmark,
+        test,
+        external_logger=external_logger,
+        diff_id=diff_id,
+        avoid_inner_order=avoid_inner_order,
+        logger=kwargs.get("logger"),
+        fingerprints=kwargs.get("fingerprints"),
+        normalized=kwargs.get("normalized"),
+        stats=kwargs.get("stats"),
+    )
+
+
+def compare(
+    benchmark: dict,
+    test: dict,
+    key: str = None,
+    avoid_inner_order: bool = False,
+    external_logger=None,
+    diff_id=None,
+    **kwargs,
+):
+    """Compare between two dictionaries"""
+    return Comparator.from_kwargs(**kwargs).compare(
+        benchmark,
+        test,
+        key=key,
+        avoid_inner_order=avoid_inner_order,
+        external_logger=external_logger,
+        diff_id=diff_id,
+        logger=kwargs.get("logger"),
+        fingerprints=kwargs.get("fingerprints"),
+        normalized=kwargs.get("normalized"),
+        stats=kwargs.get("stats"),
+    )
+
+
+def iter_diffs(
+    benchmark: dict,
+    test: dict,
+    key: str = None,
+    avoid_inner_order: bool = False,
+    external_logger=None,
+    diff_id=None,
+    **kwargs,
+):
+    """Yield the differences between two dictionaries as (kind, path, bench_value, test_value)"""
+    return Comparator.from_kwargs(**kwargs).iter_diffs(
+        benchmark,
+        test,
+        key=key,
+        avoid_inner_order=avoid_inner_order,
+        external_logger=external_logger,
+        diff_id=diff_id,
+        logger=kwargs.get("logger"),
+        fingerprints=kwargs.get("fingerprints"),
+        normalized=kwargs.get("normalized"),
+        stats=kwargs.get("stats"),
+    )
+
+
+def first_difference(benchmark: dict, test: dict, **kwargs):
+    """Return the first difference between two dictionaries, or None if they're equal"""
+    return next(iter_diffs(benchmark, test, **kwargs), None)
+
+
+def is_equal(benchmark: dict, test: dict, **kwargs) -> bool:
+    """Whether two dictionaries compare equal, stopping at the first difference"""
+    return first_difference(benchmark, test, **kwargs) is None
+
+
+def compare_many(
+    benchmark: dict,
+    tests,
+    key: str = None,
+    avoid_inner_order: bool = False,
+    external_logger=None,
+    diff_id=None,
+    **kwargs,
+):
+    """Compare one benchmark against many tests, yielding (test_id, DictDiff) lazily"""
+    return Comparator.from_kwargs(**kwargs).compare_many(
+        benchmark,
+        tests,
+        key=key,
+        avoid_inner_order=avoid_inner_order,
+        external_logger=external_logger,
+        diff_id=diff_id,
+        logger=kwargs.get("logger"),
+        fingerprints=kwargs.get("fingerprints"),
+        normalized=kwargs.get("normalized"),
+        stats=kwargs.get("stats"),
+    )
+
+
+def compare_with_reference(
+    reference: dict,
+    original: dict,
+    revised: dict,
+    key: str = None,
+    avoid_inner_order: bool = False,
+    external_logger=None,
+    diff_id=None,
+    **kwargs,
+):
+    """Compare two documents to a common reference in one walk, as a ThreeWayDiff"""
+    logger = DictCompareLogger.init_logger(diff_id, external_logger, logger=kwargs.get("logger"))
+    return Comparator.from_kwargs(**kwargs).compare_with_reference(
+        reference,
+        original,
+        revised,
+        key=key,
+        avoid_inner_order=avoid_inner_order,
+        logger=logger,
+        fingerprints=kwargs.get("fingerprints"),
+        normalized=kwargs.get("normalized"),
+        stats=kwargs.get("stats"),
+    )
+
+
+def reconcile(
+    benchmark: dict,
+    tests,
+    avoid_inner_order: bool = True,
+    changed_fields_of=None,
+    external_logger=None,
+    diff_id=None,
+    **kwargs,
+):
+    """Update many tests according to one benchmark, yielding (test_id, changes) lazily"""
+    return Comparator.from_kwargs(**kwargs).reconcile(
+        benchmark,
+        tests,
+        avoid_inner_order=avoid_inner_order,
+        changed_fields_of=changed_fields_of,
+        external_logger=external_logger,
+        diff_id=diff_id,
+        logger=kwargs.get("logger"),
+        fingerprints=kwargs.get("fingerprints"),
+        normalized=kwargs.get("normalized"),
+        stats=kwargs.get("stats"),
+        decisions=kwargs.get("decisions"),
+        as_patch=kwargs.get("as_patch", False),
+    )
+
+
+# -- the per-key helpers of earlier versions, on a Comparator of the same options ----
+
+
+def added_keys(benchmark: Dict[str, Any], test: Dict[str, Any], **kwargs):
+    comparator = Comparator.from_kwargs(**kwargs)
+    bench_keys = comparator.get_valid_keys(benchmark)
+    test_keys = comparator.bench_to_mapped_keys(bench_keys, kwargs.get("recursive", False))
+    added = {}
+    for bench_key, mapped_key in zip(bench_keys, test_keys):
+        if comparator.get_nested_value(mapped_key, test, NOT_FOUND) is NOT_FOUND:
+            added[bench_key] = benchmark[bench_key]
+    return DictDiff(added=added)
+
+
+def removed_keys(benchmark: Dict[str, Any], test: Dict[str, Any], **kwargs):
+    comparator = Comparator.from_kwargs(**kwargs)
+    return DictDiff(
+        removed=dict(comparator.removed_keys(benchmark, test, kwargs.get("recursive", False)))
+    )
+
+
+def modified_keys(shared, avoid_inner_order, key: str = None, **kwargs):
+    """The diffs of the (bench_key, bench_value, mapped_keys, test_value) of get_shared_keys()"""
+    comparator = inner = Comparator.from_kwargs(**kwargs)
+    if comparator.mapping and not comparator.inner_key_validity:
+        # the nested dicts are compared unmapped (see get_column_mapping)
+        inner = Comparator.from_kwargs(
+            **dict(kwargs, column_mapping=dict(kwargs["column_mapping"], map={}))
+        )
+    logger = DictCompareLogger.init_logger(
+        kwargs.get("diff_id"), kwargs.get("external_logger"), logger=kwargs.get("logger")
+    )
+    prefix = tuplize(key) if key else ()
+    modify_diff = DictDiff()
+    for bench_key, bench_value, mapped_keys, test_value in shared:
+        bench_value = comparator.fix_key(bench_key, bench_value, logger)
+        test_value = comparator.fix_key(mapped_keys, test_value, logger)
+        if not is_modified(bench_value, test_value, avoid_inner_order):
+            continue
+        path = (*prefix, *tuplize(bench_key))
+        if isinstance(bench_value, dict) and isinstance(test_value, dict):
+            modify_diff.update(
+                inner.compare(
+                    bench_value, test_value, key=path, avoid_inner_order=avoid_inner_order, logger=logger
+                )
+            )
+        else:
+            modify_diff.modified[path] = (bench_value, test_value)
+    return modify_diff
+
+
+def get_dict_to_update(diffs: "DictDiff", benchmark: dict, test: dict, **kwargs):
+    logger = DictCompareLogger.init_logger(
+        kwargs.get("diff_id"), kwargs.get("external_logger"), logger=kwargs.get("logger")
+    )
+    return Comparator.from_kwargs(**kwargs).get_dict_to_update(diffs, benchmark, test, logger)
+
+
+def get_column_mapping(**kwargs):
+    return Comparator.from_kwargs(**kwargs).get_column_mapping(kwargs.get("recursive", False))
+
+
+def bench_to_mapped_keys(bench_keys, **kwargs):
+    comparator = Comparator.from_kwargs(**kwargs)
+    return comparator.bench_to_mapped_keys(bench_keys, kwargs.get("recursive", False))
+
+
+def mapped_to_bench_keys(mapped_keys, **kwargs):
+    comparator = Comparator.from_kwargs(**kwargs)
+    return comparator.mapped_to_bench_keys(mapped_keys, kwargs.get("recursive", False))
+
+
+def get_valid_keys(d, **kwargs) -> Set[str]:
+    return Comparator.from_kwargs(**kwargs).get_valid_keys(d)
+
+
+def get_valid_mapped_keys(test: Dict[str, Any], **kwargs):
+    return Comparator.from_kwargs(**kwargs).get_valid_mapped_keys(test)
+
+
+def fix_key(keys, value, **kwargs):
+    logger = DictCompareLogger.init_logger(
+        kwargs.get("diff_id"), kwargs.get("external_logger"), logger=kwargs.get("logger")
+    )
+    return Comparator.from_kwargs(**kwargs).fix_key(keys, value, logger)
+
+
+def get_shared_keys(benchmark, test, **kwargs):
+    """Get shared keys between two dictionaries"""
+    comparator = Comparator.from_kwargs(**kwargs)
+    shared = []
+    for bench_key, mapped_keys in comparator.iterator(benchmark, kwargs.get("recursive", False)):
+        if comparator.key_to_ignore(bench_key):
+            continue
+        bench_value = comparator.get_nested_value(bench_key, benchmark, NOT_FOUND)
+        mapped_value = comparator.get_nested_value(mapped_keys, test, NOT_FOUND)
+        if bench_value is not NOT_FOUND and mapped_value is not NOT_FOUND:
+            # take only keys in both dicts
+            shared.append((bench_key, bench_value, mapped_keys, mapped_value))
+    return shared
+
+
+def key_to_ignore(key, **kwargs):
+    return Comparator.from_kwargs(**kwargs).key_to_ignore(key)
+
+
+def value_of(item: Union[COLLECTION_VAR]):
+    """Align value of given collection to a sorted list"""
+    try:
+        return sorted(list(set(item)))
+    except TypeError:
+        return item
+
+
+def get_nested_value(key, _dict, default, **kwargs):
+    return Comparator.from_kwargs(**kwargs).get_nested_value(key, _dict, default)
+
+
+def iterator(collection, **kwargs):
+    return Comparator.from_kwargs(**kwargs).iterator(collection, kwargs.get("recursive", False))
+
+
+class KeyOptions:
+    """The column_mapping, ignore_keys and fix_funcs of a Comparator, compiled once
+
+    They're digested into a two-way mapping index, a frozenset and a fix_funcs table
+    up front, so the per-key helpers below don't re-read them on every call.
+    """
+
+    def __init__(self, column_mapping=None, ignore_keys=None, fix_funcs=None):
+        column_mapping = column_mapping or {}
+        self.mapping = dict(column_mapping.get("map", {}))
+        # first bench key wins when several map to the same test key
+        self.reverse_mapping = {}
+        for bench_key, mapped_key in self.mapping.items():
+            if isinstance(mapped_key, Hashable):
+                self.reverse_mapping.setdefault(mapped_key, bench_key)
+        self.inner_key_validity = bool(column_mapping.get("inner_key_validity"))
+        self.generic_key = tuple(column_mapping.get("generic_key", []))
+        self.ignore_keys = frozenset(ignore_keys or ())
+        self.fix_funcs = {k: tuple(funcs) for k, funcs in (fix_funcs or {}).items()}
+
+    def get_column_mapping(self, recursive=False):
+        if recursive and not self.inner_key_validity:
+            return {}
+        return self.mapping
+
+    def bench_to_mapped_keys(self, bench_keys, recursive=False):
+        column_mapping = self.get_column_mapping(recursive)
+        return tuple(column_mapping.get(o, o) for o in bench_keys)
+
+    def mapped_to_bench_keys(self, mapped_keys, recursive=False):
+        if recursive and not self.inner_key_validity:
+            return tuple(mapped_keys)
+        reverse_mapping = self.reverse_mapping
+        return tuple(reverse_mapping.get(mk, mk) for mk in mapped_keys)
+
+    def get_valid_keys(self, d) -> Set[str]:
+        return set(k for k in d if not self.key_to_ignore(k))
+
+    def get_valid_mapped_keys(self, test: Dict[str, Any]):
+        _dict = {k: test[k] for k in self.get_valid_keys(test)}
+        return dict_to_key_chain(_dict)
+
+    def key_to_ignore(self, key):
+        return key.startswith("_") or key in self.ignore_keys
+
+    def fix_key(self, keys, value, logger=None, stats=None):
+        return apply_fix_funcs(self.fix_funcs, keys, value, logger, stats)
+
+    def get_nested_value(self, key, _dict, default, lookup_cache=None):
+        keys = [*self.generic_key]
+        if isinstance(key, COLLECTION_VAR):
+            keys.extend(key)
+        else:
+            keys.append(key)
+
+        lookup_cache = lookup_cache or LookupCache()
+        for _key in [key, tuple(keys)]:
+            try:
+                # try a direct dict-key
+                return _dict[_key]
+            except KeyError:
+                # try chained keys traverse, walking the original structure by reference
+                value = lookup_cache.resolve(_dict, tuplize(_key))
+                if value is not NOT_FOUND:
+                    return value
+        # default handling
+        if isinstance(default, Exception):
+            raise default
+        return default
+
+    def iterator(self, collection, recursive=False):
+        column_mapping = self.get_column_mapping(recursive)
+        for key in collection:
+            mapped_keys = []
+            for x in (column_mapping.get(x, x) for x in tuplize(key)):
+                if isinstance(x, tuple):
+                    mapped_keys.extend(x)
+                else:
+                    mapped_keys.append(x)
+            yield key, tuple(mapped_keys)
+
+
+class Comparator(KeyOptions):
+    """Compare/update options compiled once and reused across many documents
+
+    On top of the KeyOptions, changed_fields is hashed into a frozenset of key
+    chains up front.
+
+    list_keys maps the key chain of a list of dicts (a key, or a tuple of keys, as it
+    appears in the diffs) to the field, or tuple of fields, identifying its elements:
+    {"rules": "id"} diffs the "rules" list element by element, with paths like
+    ("rules", <id>, "field"), instead of as one modified value. Unless avoid_inner_order,
+    a list whose elements only moved is still one modified value.
+
+    sequence_diff=True (or a cap on the edit distance, MAX_SEQUENCE_EDITS by default)
+    diffs other modified lists by position when order matters: Myers' diff reports
+    the items inserted, deleted and replaced instead of the whole list, and update()
+    patches the list (see ListPatch) instead of rewriting it.
+    """
+
+    OPTIONS = (
+        "column_mapping",
+        "ignore_keys",
+        "fix_funcs",
+        "changed_fields",
+        "list_keys",
+        "sequence_diff",
+    )
+
+    def __init__(
+        self,
+        column_mapping=None,
+        ignore_keys=None,
+        fix_funcs=None,
+        changed_fields=None,
+        list_keys=None,
+        sequence_diff=False,
+    ):
+        super().__init__(column_mapping, ignore_keys, fix_funcs)
+        self.changed_fields = hash_fields(changed_fields)
+        self.list_keys = {
+            tuplize(path): tuple(field) if isinstance(field, list) else field
+            for path, field in (list_keys or {}).items()
+        }
+        if sequence_diff is True:
+            sequence_diff = MAX_SEQUENCE_EDITS
+        # the edit distance cap of sequence diffs, None when they're off
+        self.max_edits = None if sequence_diff is False else sequence_diff
+        # a nested frame's removed keys are already found by its parent frame when no
+        # generic_key fallback, inner mapping or chain-valued mapping can make them differ
+        self._flat_removed = not (
+            self.generic_key
+            or (self.inner_key_validity and self.mapping)
+            or any(isinstance(v, tuple) for v in self.mapping.values())
+        )
+
+    @classmethod
+    def from_kwargs(cls, **kwargs):
+        """Build a comparator from the compare()/update() keyword options"""
+        return cls(**{k: kwargs[k] for k in cls.OPTIONS if k in kwargs})
+
+    def options_key(self):
+        """A hashable key of the compiled options (fix_funcs by identity), None if unhashable"""
+        mapping = Fingerprints().digest(self.mapping)
+        if mapping is None:
+            return None
+        try:
+            key = (
+                mapping,
+                self.inner_key_validity,
+                self.generic_key,
+                self.ignore_keys,
+                frozenset(self.fix_funcs.items()),
+                self.changed_fields,
+                frozenset(self.list_keys.items()),
+                self.max_edits,
+            )
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def __repr__(self):
+        return (
+            f"Comparator(map={self.mapping}, generic_key={self.generic_key}, "
+            f"ignore_keys={set(self.ignore_keys)}, fix_funcs={list(self.fix_funcs)})"
+        )
+
+    # -- public API --------------------------------------------------------
+
+    def update(
+        self,
+        benchmark,
+        test,
+        external_logger=None,
+        diff_id=None,
+        avoid_inner_order=True,
+        changed_fields=None,
+        as_patch=False,
+        **kwargs,
+    ):
+        """Compare first and then update according to the delta
+
+        changed_fields overrides the compiled ones for this call only. The delta is
+        applied as a Patch in one pass; as_patch=True returns that Patch instead of
+        the nested-dict delta. kwargs are the options of open_context().
+        """
+        context = self.open_context(
+            benchmark, avoid_inner_order, external_logger, diff_id, **kwargs
+        )
+
+        patch = self.delta_in(test, context, changed_fields)
+        with phase(context.stats, "merge"):
+            patch.apply(test)
+        context.logger.summary(patch)
+        return patch if as_patch else patch.to_delta()
+
+    def updated(
+        self,
+        benchmark,
+        test,
+        external_logger=None,
+        diff_id=None,
+        avoid_inner_order=True,
+        changed_fields=None,
+        **kwargs,
+    ):
+        """update() that leaves test untouched and returns the updated version of it
+
+        The new version copies only the dicts on the changed chains and shares every
+        other subtree with test (see Patch.applied), so no deepcopy of test is needed
+        to keep the old version.
+        """
+        context = self.open_context(
+            benchmark, avoid_inner_order, external_logger, diff_id, **kwargs
+        )
+
+        patch = self.delta_in(test, context, changed_fields)
+        with phase(context.stats, "merge"):
+            version = patch.applied(test)
+        context.logger.summary(patch)
+        return version
+
+    def delta_in(self, test, context, changed_fields=None, decisions=None):
+        """Compare test to the context's benchmark and return the Patch to update it with"""
+        diffs = self.compare_in(test, None, context)
+        if context.expanded_lists:
+            diffs = self._fold_lists(
+                diffs,
+                context.expanded_lists,
+                context.plan.benchmark,
+                test,
+                context.lookup_cache,
+            )
+        context.logger.info("diffs = %s", diffs)
+        if changed_fields is not None:
+            changed_fields = hash_fields(changed_fields)
+        with phase(context.stats, "delta"):
+            return self._patch_to_update(
+                diffs,
+                context.plan.benchmark,
+                test,
+                context.logger,
+                context.lookup_cache,
+                changed_fields=changed_fields,
+                plan=context.plan,
+                decisions=decisions,
+            )
+
+    def compare(
+        self,
+        benchmark: dict,
+        test: dict,
+        key: str = None,
+        avoid_inner_order: bool = False,
+        external_logger=None,
+        diff_id=None,
+        **kwargs,
+    ):
+        """Compare between two dictionaries
+
+        fingerprints=True hashes both documents bottom-up once and skips identical
+        subtrees by digest. A Fingerprints built for the benchmark can be passed
+        instead and reused across many tests. Hashing is pure python, so this pays
+        off on deep documents and reused benchmarks rather than one-off wide ones.
+        """
+        context = self.open_context(
+            benchmark, avoid_inner_order, external_logger, diff_id, **kwargs
+        )
+        return self.compare_in(test, key, context)
+
+    def iter_diffs(
+        self,
+        benchmark: dict,
+        test: dict,
+        key: str = None,
+        avoid_inner_order: bool = False,
+        external_logger=None,
+        diff_id=None,
+        **kwargs,
+    ):
+        """Yield the differences between two dictionaries as DiffEvents, lazily
+
+        Each (kind, path, bench_value, test_value) event is yielded as soon as the
+        walk finds it and in the order compare() records it, so closing the
+        generator early skips the rest of the walk. kind is "added", "removed" or
+        "modified"; the side a value is missing from holds NOT_FOUND. A path is
+        yielded once even where compare() would record it twice, with the value
+        compare() keeps: under a column_mapping or generic_key, removed paths are
+        only yielded once the walk is over.
+        """
+        context = self.open_context(
+            benchmark, avoid_inner_order, external_logger, diff_id, **kwargs
+        )
+        stats = context.stats
+        # a nested frame can re-report a removed chain its parent already found, the
+        # mapped and the unmapped test chain both named by the same path
+        removed = {} if self.mapping or self.generic_key else None
+        if stats is not None:
+            stats.counters["compares"] += 1
+        for event in self._iter_diffs(test, key, context):
+            if removed is not None and event.kind == REMOVED:
+                # first position, last value, as DictDiff.record keeps it
+                removed[event.path] = event
+                continue
+            if stats is not None:
+                stats.counters[event.kind] += 1
+            yield event
+        for event in (removed or {}).values():
+            if stats is not None:
+                stats.counters[REMOVED] += 1
+            yield event
+
+    def first_difference(self, benchmark: dict, test: dict, **kwargs):
+        """Return the first difference between two dictionaries, or None if they're equal"""
+        return next(self.iter_diffs(benchmark, test, **kwargs), None)
+
+    def is_equal(self, benchmark: dict, test: dict, **kwargs) -> bool:
+        """Whether two dictionaries compare equal, stopping at the first difference"""
+        return self.first_difference(benchmark, test, **kwargs) is None
+
+    def compare_many(
+        self,
+        benchmark: dict,
+        tests,
+        key: str = None,
+        avoid_inner_order: bool = False,
+        external_logger=None,
+        diff_id=None,
+        **kwargs,
+    ):
+        """Compare one benchmark against many tests, yielding (test_id, DictDiff) lazily
+
+        tests is a mapping of test_id -> test, or an iterable of (test_id, test) pairs
+        or of plain tests (identified by their index). The benchmark side - its valid
+        and mapped keys, fix_funcs-normalized values and fingerprints - is prepared once
+        and shared by every test.
+        """
+        shared = self.open_context(
+            benchmark, avoid_inner_order, external_logger, diff_id, **kwargs
+        )
+        for test_id, test in iter_tests(tests):
+            context = CompareContext(shared.plan, avoid_inner_order, shared.logger, shared.stats)
+            yield test_id, self.compare_in(test, key, context)
+
+    def compare_with_reference(
+        self,
+        reference: dict,
+        original: dict,
+        revised: dict,
+        key: str = None,
+        avoid_inner_order: bool = False,
+        **kwargs,
+    ):
+        """Compare original and revised to the reference they were both made from
+
+        The three documents are walked together: a subtree equal on all three sides
+        is skipped, one only a single document changed is diffed for that document
+        alone, and one both documents share is diffed once. Each side's differences
+        are those compare(reference, side) finds, sorted into a ThreeWayDiff.
+        Without a logger, a default DictCompareLogger is used.
+        """
+        original_context = self.open_context(reference, avoid_inner_order, **kwargs)
+        plan, logger, stats = original_context.plan, original_context.logger, original_context.stats
+        contexts = (original_context, CompareContext(plan, avoid_inner_order, logger, stats))
+        result = ThreeWayDiff()
+        with phase(stats, "compare"):
+            for side, event in self._three_way_diffs(original, revised, key, contexts):
+                result.record(side, event)
+            result.settle()
+        return result
+
+    def reconcile(
+        self,
+        benchmark: dict,
+        tests,
+        avoid_inner_order=True,
+        changed_fields_of=None,
+        external_logger=None,
+        diff_id=None,
+        decisions=None,
+        as_patch=False,
+        **kwargs,
+    ):
+        """update() of many tests to one benchmark, yielding (test_id, changes) lazily
+
+        tests are taken as by compare_many(). The benchmark side of every decision -
+        its plan and each modified key's value, item types and items - is resolved
+        once and shared by all tests, and only the current test's delta is held.
+        decisions, a dict, counts every modify type decided (and ADD_DECISION for the
+        added keys) across the tests. changed_fields_of(test), when given, returns
+        the changed_fields of one test.
+        """
+        shared = self.open_context(
+            benchmark, avoid_inner_order, external_logger, diff_id, **kwargs
+        )
+        plan, logger, stats = shared.plan, shared.logger, shared.stats
+        for test_id, test in iter_tests(tests):
+            context = CompareContext(plan, avoid_inner_order, logger, stats)
+            changed_fields = changed_fields_of(test) if changed_fields_of else None
+            patch = self.delta_in(test, context, changed_fields, decisions)
+            with phase(stats, "merge"):
+                patch.apply(test)
+            logger.summary(patch)
+            yield test_id, patch if as_patch else patch.to_delta()
+
+    def prepare(self, benchmark: dict, fingerprints=None, logger=None, normalized=None):
+        """Return a BenchmarkPlan of benchmark to share between compares"""
+        if fingerprints is True:
+            fingerprints = Fingerprints(benchmark)
+        elif fingerprints and fingerprints.document is not benchmark:
+            raise ValueError("fingerprints were built for another benchmark")
+        if normalized is True:
+            normalized = self.normalize(benchmark, logger)
+        elif isinstance(normalized, Normalized):
+            # an empty one (no fix_funcs) is still shared
+            if normalized.document is not benchmark:
+                raise ValueError("normalized was built for another benchmark")
+            if normalized.fix_funcs != self.fix_funcs:
+                raise ValueError("normalized was built with other fix_funcs")
+        else:
+            normalized = Normalized(benchmark, self.fix_funcs)
+        return BenchmarkPlan(self, benchmark, fingerprints or None, logger, normalized)
+
+    def open_context(
+        self, benchmark: dict, avoid_inner_order, external_logger=None, diff_id=None, **kwargs
+    ) -> "CompareContext":
+        """A CompareContext on a new plan of benchmark, from the per-call options
+
+        kwargs are the options the public methods pass through: logger (else one of
+        external_logger and diff_id), fingerprints, normalized and stats.
+        """
+        logger = DictCompareLogger.init_logger(
+            diff_id, external_logger, logger=kwargs.get("logger")
+        )
+        plan = self.prepare(
+            benchmark,
+            fingerprints=kwargs.get("fingerprints"),
+            logger=logger,
+            normalized=kwargs.get("normalized"),
+        )
+        return CompareContext(plan, avoid_inner_order, logger, kwargs.get("stats"))
+
+    def normalize(self, document: dict, logger=None) -> "Normalized":
+        """Apply fix_funcs to every value of document under one of their keys, once
+
+        The result is passed as normalized= to compare/update and the other calls
+        on this benchmark (or normalized=True builds it for one call), so the values
+        of a benchmark are fixed - and its failing functions called and logged -
+        once for all of its compares rather than once per call.
+        """
+        normalized = Normalized(document, self.fix_funcs)
+        logger = DictCompareLogger.init_logger(None, None, logger=logger)
+        if not self.fix_funcs:
+            return normalized
+        stack = [document]
+        while stack:
+            node = stack.pop()
+            items = node.items() if isinstance(node, dict) else enumerate(node)
+            for key, value in items:
+                if key in self.fix_funcs:
+                    normalized.fixed(key, value, logger)
+                if isinstance(value, (dict, list, tuple)):
+                    stack.append(value)
+        return normalized
+
+    # -- engine ------------------------------------------------------------
+
+    def compare_in(self, test, key, context):
+        """Collect the diff events of test against the benchmark of a CompareContext into a DictDiff"""
+        with phase(context.stats, "compare"):
+            diffs = DictDiff()
+            for event in self._iter_diffs(test, key, context):
+                diffs.record(event)
+        if context.stats is not None:
+            context.stats.count_diffs(diffs)
+        return diffs
+
+    def _iter_diffs(self, test, key, context):
+        """Walk both documents with an explicit stack, one frame per differing nested dict
+
+        Frames are visited in the same order the recursive walk used to, so diffs are
+        yielded in the same order, each as soon as it is found. Prefixes are shared
+        PathNodes and a full key chain is only built when a diff is yielded.
+        """
+        stats = context.stats
+        root = PathNode(None, tuplize(key) if key else ())
+        benchmark = context.plan.benchmark
+        yield from self._level_diffs(benchmark, test, root, False, True, context)
+        stack = [(root, self._shared_values(benchmark, test, False, context))]
+        if stats is not None:
+            stats.counters["max_depth"] = max(stats.counters["max_depth"], 1)
+        yield from self._walk(stack, context)
+
+    def _walk(self, stack, context):
+        """Drain a stack of (prefix, shared values) frames, pushing a frame per modified dict"""
+        stats = context.stats
+        while stack:
+            prefix, shared = stack[-1]
+            item = next(shared, None)
+            if item is None:
+                stack.pop()
+                continue
+
+            _, _, fixed_bench_value, mapped_keys, test_value = item
+            fixed_test_value = self.fix_key(mapped_keys, test_value, context.logger, stats)
+            if self.list_keys:
+                frames = yield from self._keyed_frames(prefix, item, fixed_test_value, context)
+                if frames is not None:
+                    stack.extend(reversed(frames))
+                    continue
+            both_dicts = isinstance(fixed_bench_value, dict) and isinstance(fixed_test_value, dict)
+            if stats is None and not context.plan.fingerprints:
+                modified = is_modified(
+                    fixed_bench_value,
+                    fixed_test_value,
+                    context.avoid_inner_order,
+                    both_dicts,
+                    context.plan.multiset,
+                )
+            else:
+                modified = self._value_modified(item, fixed_test_value, both_dicts, context)
+            if not modified:
+                continue
+            if not both_dicts:
+                yield from self._value_diffs(prefix, item, fixed_test_value, context)
+                continue
+            child_frame = yield from self._open_frame(prefix, item, fixed_test_value, context)
+            stack.append(child_frame)
+            if stats is not None:
+                stats.counters["max_depth"] = max(stats.counters["max_depth"], len(stack))
+
+    def _keyed_frames(self, prefix, item, fixed_test_value, context):
+        """Yield the element diffs of a keyed list and return its elements' frames
+
+        None when the value isn't a pair of lists list_keys can key by identity.
+        """
+        bench_key, fixed_bench_value = item[0], item[2]
+        if not all(isinstance(v, (list, tuple)) for v in (fixed_bench_value, fixed_test_value)):
+            return None
+        path = prefix.path(tuplize(bench_key))
+        indexes = self._index_elements(path, fixed_bench_value, fixed_test_value)
+        if indexes is None:
+            return None
+        context.expanded_lists.add(path)
+        list_prefix = PathNode(prefix, tuplize(bench_key) if bench_key else ())
+        frames = yield from self._keyed_diffs(list_prefix, *indexes, context)
+        if context.avoid_inner_order or not is_reordered(*indexes):
+            return frames
+        # order matters: a list whose elements only moved is modified as a whole
+        changed = False
+        for event in self._walk(list(reversed(frames)), context):
+            changed = True
+            yield event
+        if not changed:
+            yield DiffEvent(MODIFIED, path, fixed_bench_value, fixed_test_value)
+        return []
+
+    def _value_modified(self, item, fixed_test_value, both_dicts, context):
+        """Whether a shared value differs, timed, and by fingerprint when both sides have one"""
+        _, bench_value, fixed_bench_value = item[:3]
+        stats = context.stats
+        if stats is not None:
+            start = perf_counter()
+        bench_digest = test_digest = None
+        if both_dicts and context.plan.fingerprints:
+            # a benchmark value replaced by fix_funcs isn't in the shared benchmark digests
+            bench_fingerprints = context.plan.fingerprints
+            if fixed_bench_value is not bench_value:
+                bench_fingerprints = context.test_fingerprints
+            bench_digest = bench_fingerprints.digest(fixed_bench_value)
+            test_digest = context.test_fingerprints.digest(fixed_test_value)
+        if bench_digest is not None and test_digest is not None:
+            modified = bench_digest != test_digest
+        else:
+            modified = is_modified(
+                fixed_bench_value,
+                fixed_test_value,
+                context.avoid_inner_order,
+                both_dicts,
+                context.plan.multiset,
+            )
+        if stats is not None:
+            stats.timings["modified"] += perf_counter() - start
+            if both_dicts and not modified:
+                stats.counters["subtrees_skipped"] += 1
+        return modified
+
+    def _value_diffs(self, prefix, item, fixed_test_value, context):
+        """Yield the diffs of a modified value that isn't a pair of dicts"""
+        bench_key, fixed_bench_value = item[0], item[2]
+        path = prefix.path(tuplize(bench_key))
+        if self.max_edits is not None and not context.avoid_inner_order:
+            events = self._sequence_diffs(path, fixed_bench_value, fixed_test_value)
+            if events is not None:
+                context.expanded_lists.add(path)
+                yield from events
+                return
+        yield DiffEvent(MODIFIED, path, fixed_bench_value, fixed_test_value)
+
+    def _three_way_diffs(self, original, revised, key, contexts):
+        """Yield (side, DiffEvent) of both documents' diffs to the plan's reference
+
+        side is ORIGINAL or REVISED, or BOTH for the diffs of a value both documents
+        hold by reference, found once. The reference is walked with both documents
+        together: a subtree equal on all three sides is skipped, and a subtree that
+        only one document changed is walked with that one only.
+        """
+        original_context, revised_context = contexts
+        if original is revised:
+            for event in self._iter_diffs(original, key, original_context):
+                yield BOTH, event
+            return
+        root = PathNode(None, tuplize(key) if key else ())
+        plan = original_context.plan
+        for side, context, test in zip((ORIGINAL, REVISED), contexts, (original, revised)):
+            for event in self._level_diffs(plan.benchmark, test, root, False, True, context):
+                yield side, event
+        yield from self._three_way_levels(root, original, revised, contexts)
+
+    def _three_way_levels(self, root, original, revised, contexts):
+        """Yield the (side, DiffEvent) diffs under the shared values of the reference, level by level"""
+        original_context, revised_context = contexts
+        plan = original_context.plan
+        # (prefix, reference level, original level, revised level, recursive)
+        stack = [(root, plan.benchmark, original, revised, False)]
+        while stack:
+            prefix, level, original_level, revised_level, recursive = stack.pop()
+            _, shared_candidates = plan.level(
+                level, recursive, original_context.logger, original_context.stats
+            )
+            for candidate in shared_candidates:
+                values = (
+                    self.get_nested_value(
+                        candidate[3], original_level, NOT_FOUND, original_context.lookup_cache
+                    ),
+                    self.get_nested_value(
+                        candidate[3], revised_level, NOT_FOUND, revised_context.lookup_cache
+                    ),
+                )
+                child = yield from self._three_way_value(prefix, candidate, values, contexts)
+                if child is not None:
+                    stack.append(child)
+
+    def _three_way_value(self, prefix, candidate, values, contexts):
+        """Yield the (side, DiffEvent) diffs at and under one shared value of the reference
+
+        Returns the frame to walk both documents under the value with, when both
+        changed a dict all three hold, else None.
+        """
+        bench_key, bench_value = candidate[:2]
+        items = [(*candidate, value) for value in values]
+        if values[0] is values[1]:
+            if values[0] is not NOT_FOUND:
+                for event in self._walk([(prefix, iter(items[:1]))], contexts[0]):
+                    yield BOTH, event
+            return None
+        changed = self._joint_changes(candidate, values, contexts[0])
+        if changed is None or not all(changed):
+            yield from self._walk_sides(prefix, items, contexts, changed)
+            return None
+        for side, context, item in zip((ORIGINAL, REVISED), contexts, items):
+            yield from self._side_events(side, self._open_frame(prefix, item, item[-1], context))
+        child = PathNode(prefix, tuplize(bench_key) if bench_key else ())
+        return child, bench_value, *values, True
+
+    def _walk_sides(self, prefix, items, contexts, changed=None):
+        """Yield the (side, DiffEvent) diffs of one value, walking each document on its own
+
+        With changed, the value is a dict of each document: only the ones that changed
+        it are walked, from its frame on.
+        """
+        for side, context, item, side_changed in zip(
+            (ORIGINAL, REVISED), contexts, items, changed or (True, True)
+        ):
+            if item[-1] is NOT_FOUND or not side_changed:
+                continue
+            if changed is None:
+                yield from self._side_events(side, self._walk([(prefix, iter([item]))], context))
+                continue
+            child_frame = yield from self._side_events(
+                side, self._open_frame(prefix, item, item[-1], context)
+            )
+            yield from self._side_events(side, self._walk([child_frame], context))
+
+    def _joint_changes(self, candidate, values, context):
+        """Whether each document changed a dict all three hold, walked together when both did
+
+        None when a value isn't a dict or fix_funcs apply: each document is then
+        walked on its own.
+        """
+        _, bench_value, fixed_bench_value, mapped_keys = candidate
+        if fixed_bench_value is not bench_value or any(key in self.fix_funcs for key in mapped_keys):
+            return None
+        if not all(isinstance(value, dict) for value in (bench_value, *values)):
+            return None
+        return [
+            is_modified(bench_value, value, context.avoid_inner_order, True, context.plan.multiset)
+            for value in values
+        ]
+
+    @staticmethod
+    def _side_events(side, events):
+        """Yield the events of a generator as (side, event), and return what it returns"""
+        while True:
+            try:
+                event = next(events)
+            except StopIteration as stop:
+                return stop.value
+            yield side, event
+
+    def _open_frame(self, prefix, item, fixed_test_value, context):
+        """Yield the added/removed keys of a modified dict, return its (prefix, shared values) frame"""
+        bench_key, bench_value, fixed_bench_value, mapped_keys, test_value = item
+        # the parent frame already looked up every test chain of this subtree
+        # when the lookup can't differ one level down
+        scan_removed = not (
+            self._flat_removed
+            and mapped_keys == (bench_key,)
+            and fixed_bench_value is bench_value
+            and fixed_test_value is test_value
+        )
+        child = PathNode(prefix, tuplize(bench_key) if bench_key else ())
+        yield from self._level_diffs(
+            fixed_bench_value, fixed_test_value, child, True, scan_removed, context
+        )
+        return child, self._shared_values(fixed_bench_value, fixed_test_value, True, context)
+
+    def region_diffs(self, root, level_path, key, test, context):
+        """Yield the diffs of compare() at and under level_path + (key,), and only those
+
+        Every level of level_path must hold dicts on both sides, and none of its keys
+        fix_funcs: the key is then diffed as the frame of its level would.
+        """
+        benchmark = bench_level = context.plan.benchmark
+        test_level = test
+        prefix = root
+        for segment in level_path:
+            bench_level, test_level = bench_level[segment], test_level[segment]
+            prefix = PathNode(prefix, (segment,))
+        if not level_path and self.key_to_ignore(key):
+            return
+        lookup_cache = context.lookup_cache
+        item = None
+        if key in bench_level and not self.key_to_ignore(key):
+            bench_value = bench_level[key]
+            test_value = self.get_nested_value(key, test_level, NOT_FOUND, lookup_cache)
+            if test_value is NOT_FOUND:
+                yield DiffEvent(ADDED, prefix.path((key,)), bench_value, NOT_FOUND)
+            else:
+                fixed_bench_value = context.plan.normalized.fixed(key, bench_value, context.logger)
+                item = (key, bench_value, fixed_bench_value, (key,), test_value)
+        if key in test_level:
+            # nested removed leaves are found by the root frame, ignored keys or not
+            value = test_level[key]
+            if not level_path and not isinstance(value, dict):
+                if self.get_nested_value(key, benchmark, NOT_FOUND) is NOT_FOUND:
+                    yield DiffEvent(REMOVED, prefix.path((key,)), NOT_FOUND, value)
+            else:
+                for key_chain, leaf in removed_leaves(step_into(bench_level, key), value):
+                    yield DiffEvent(REMOVED, prefix.path((key, *key_chain)), NOT_FOUND, leaf)
+        if item is not None:
+            yield from self._walk([(prefix, iter([item]))], context)
+
+    def _index_elements(self, path, bench_list, test_list):
+        """Index both lists by the identity field of path, or None if they aren't keyed"""
+        field = self.list_keys.get(path)
+        if field is None:
+            return None
+        bench_index = index_by_identity(bench_list, field)
+        if bench_index is None:
+            return None
+        test_index = index_by_identity(test_list, field)
+        if test_index is None:
+            return None
+        return bench_index, test_index
+
+    def _sequence_diffs(self, path, bench_list, test_list):
+        """The positional diffs of two lists, or None when they aren't diffed by position
+
+        Replaced items are modified and inserted items added at their benchmark
+        position, deleted items removed at their test position.
+        """
+        if not isinstance(bench_list, (list, tuple)) or type(bench_list) is not type(test_list):
+            return None
+        try:
+            blocks = matching_blocks(bench_list, test_list, self.max_edits)
+        except (EditCapExceeded, RecursionError):
+            return None
+        events = []
+        for i1, i2, j1, j2 in sequence_gaps(blocks, len(bench_list), len(test_list)):
+            replaced = min(i2 - i1, j2 - j1)
+            for offset in range(replaced):
+                events.append(
+                    DiffEvent(
+                        MODIFIED,
+                        path + (i1 + offset,),
+                        bench_list[i1 + offset],
+                        test_list[j1 + offset],
+                    )
+                )
+            for i in range(i1 + replaced, i2):
+                events.append(DiffEvent(ADDED, path + (i,), bench_list[i], NOT_FOUND))
+            for j in range(j1 + replaced, j2):
+                events.append(DiffEvent(REMOVED, path + (j,), NOT_FOUND, test_list[j]))
+        return events
+
+    def _keyed_diffs(self, prefix, bench_index, test_index, context):
+        """Yield the added/removed elements of a keyed list, return frames of the modified ones
+
+        Elements are joined by identity, so each list is walked once; the frames of the
+        modified elements are opened in list order.
+        """
+        frames = []
+        for identity, bench_element in bench_index.items():
+            test_element = test_index.get(identity, NOT_FOUND)
+            if test_element is NOT_FOUND:
+                yield DiffEvent(ADDED, prefix.path((identity,)), bench_element, NOT_FOUND)
+            elif test_element is not bench_element and is_modified(
+                bench_element, test_element, False, both_dicts=True
+            ):
+                frames.append((PathNode(prefix, (identity,)), bench_element, test_element))
+        for identity, test_element in test_index.items():
+            if identity not in bench_index:
+                yield DiffEvent(REMOVED, prefix.path((identity,)), NOT_FOUND, test_element)
+
+        opened = []
+        for child, bench_element, test_element in frames:
+            yield from self._level_diffs(bench_element, test_element, child, True, True, context)
+            opened.append(
+                (child, self._shared_values(bench_element, test_element, True, context))
+            )
+        return opened
+
+    def _level_diffs(self, benchmark, test, prefix, recursive, scan_removed, context):
+        """Yield the added/removed keys of one level"""
+        added_candidates, _ = context.plan.level(
+            benchmark, recursive, context.logger, context.stats
+        )
+        added = self._added_diffs(added_candidates, benchmark, test, prefix, context)
+        removed = (
+            self._removed_diffs(benchmark, test, prefix, recursive, context)
+            if scan_removed
+            else ()
+        )
+        stats = context.stats
+        if stats is not None:
+            stats.counters["frames"] += 1
+            stats.counters["lookups"] += len(added_candidates)
+            added = stats.timed(added, "added")
+            removed = stats.timed(removed, "removed")
+        yield from added
+        yield from removed
+
+    def _added_diffs(self, added_candidates, benchmark, test, prefix, context):
+        lookup_cache = context.lookup_cache
+        for bench_key, mapped_key in added_candidates:
+            if self.get_nested_value(mapped_key, test, NOT_FOUND, lookup_cache) is NOT_FOUND:
+                yield DiffEvent(
+                    ADDED, prefix.path(tuplize(bench_key)), benchmark[bench_key], NOT_FOUND
+                )
+
+    def _removed_diffs(self, benchmark, test, prefix, recursive, context):
+        for mapped_key, value in self.removed_keys(
+            benchmark, test, recursive, context.lookup_cache
+        ):
+            yield DiffEvent(REMOVED, prefix.path(tuplize(mapped_key)), NOT_FOUND, value)
+
+    def _shared_values(self, benchmark, test, recursive, context):
+        """Yield the keys of one level found on both sides, with their values"""
+        lookup_cache = context.lookup_cache
+        _, shared_candidates = context.plan.level(
+            benchmark, recursive, context.logger, context.stats
+        )
+        if context.stats is not None:
+            context.stats.counters["lookups"] += len(shared_candidates)
+            return context.stats.timed(
+                self._shared_lookups(shared_candidates, test, lookup_cache), "shared"
+            )
+        return self._shared_lookups(shared_candidates, test, lookup_cache)
+
+    def _shared_lookups(self, shared_candidates, test, lookup_cache):
+        for bench_key, bench_value, fixed_bench_value, mapped_keys in shared_candidates:
+            test_value = self.get_nested_value(mapped_keys, test, NOT_FOUND, lookup_cache)
+            if test_value is not NOT_FOUND:
+                # take only keys in both dicts
+                yield bench_key, bench_value, fixed_bench_value, mapped_keys, test_value
+
+    def prepare_level(self, benchmark, recursive=False, logger=None, normalized=None):
+        """Return the benchmark side of one level: (added candidates, shared candidates)
+
+        Added candidates are (bench_key, mapped_key) pairs of the valid keys, shared
+        candidates (bench_key, value, fixed value, mapped_keys) of the keys to look up in test.
+        Values are fixed through normalized, when given, instead of by fix_key().
+        """
+        fix = self.fix_key if normalized is None else normalized.fixed
+        bench_keys = self.get_valid_keys(benchmark)
+        added_candidates = tuple(
+            zip(bench_keys, self.bench_to_mapped_keys(bench_keys, recursive))
+        )
+        shared_candidates = []
+        for bench_key, mapped_keys in self.iterator(benchmark, recursive):
+            if self.key_to_ignore(bench_key):
+                continue
+            bench_value = benchmark[bench_key]
+            fixed_bench_value = fix(bench_key, bench_value, logger)
+            shared_candidates.append(
+                (bench_key, bench_value, fixed_bench_value, mapped_keys)
+            )
+        return added_candidates, tuple(shared_candidates)
+
+    def removed_keys(self, benchmark, test, recursive=False, lookup_cache=None):
+        """Yield the (mapped_key, value) pairs of test key chains missing in benchmark"""
+        if self._flat_removed:
+            yield from self._walk_removed_keys(benchmark, test, recursive)
+            return
+        test_keys = self.get_valid_mapped_keys(test)
+        bench_keys = self.mapped_to_bench_keys(test_keys, recursive)
+        for bench_key, mapped_key in zip(bench_keys, test_keys):
+            if (
+                self.get_nested_value(bench_key, benchmark, NOT_FOUND, lookup_cache)
+                is NOT_FOUND
+            ):
+                yield mapped_key, self.get_nested_value(
+                    mapped_key,
+                    test,
+                    default=AssertionError(f"{mapped_key} is not found in test"),
+                    lookup_cache=lookup_cache,
+                )
+
+    def get_dict_to_update(
+        self, diffs, benchmark, test, logger, lookup_cache=None, changed_fields=None
+    ):
+        return self._patch_to_update(
+            diffs, benchmark, test, logger, lookup_cache, changed_fields
+        ).to_delta()
+
+    def _patch_to_update(
+        self,
+        diffs,
+        benchmark,
+        test,
+        logger,
+        lookup_cache=None,
+        changed_fields=None,
+        plan=None,
+        decisions=None,
+    ):
+        """The Patch of the changes to make in test: get_dict_to_update() as flat ops
+
+        plan, a BenchmarkPlan of benchmark, keeps the benchmark side of each decision
+        for the next tests. decisions, a dict, counts the modify types decided.
+        """
+        if plan is None:
+            plan = BenchmarkPlan(self, benchmark)
+        ops = []
+
+        for bench_key, mapped_keys in self.iterator(diffs.added):
+            value = self.get_nested_value(
+                bench_key,
+                diffs.added,
+                default=AssertionError(f"{bench_key} is not found in added"),
+                lookup_cache=lookup_cache,
+            )
+            logger.info("Add a new benchmark key: %s=%s", mapped_keys, value)
+            ops.append((PATCH_ADD, mapped_keys, value))
+            if decisions is not None:
+                decisions[ADD_DECISION] = decisions.get(ADD_DECISION, 0) + 1
+
+        # fields that are allowed to be changed. If a modification field was changed then we keep it,
+        # else we restore it. This will allow us to keep user modified changes ot specific fields
+        # and to revert unofficially changes.
+        if changed_fields is None:
+            changed_fields = self.changed_fields
+
+        for bench_key, mapped_keys in self.iterator(diffs.modified):
+            bench_side = plan.bench_side(bench_key, lookup_cache)
+            bench_value = bench_side.value
+            mapped_value = self.get_nested_value(
+                mapped_keys,
+                test,
+                default=AssertionError(f"{mapped_keys} is not found in test"),
+                lookup_cache=lookup_cache,
+            )
+
+            # check if key wasn't modified by the user, if so we keep it,
+            # else revert it to the benchmark value
+            must_reset = bench_key not in changed_fields
+            if mapped_value is NOT_FOUND:
+                # value is a new one: take new benchmark value
+                value = bench_value
+                modify_type = "modify key [new benchmark value]"
+            elif must_reset:
+                # value wasn't modified: take the benchmark value
+                modify_type = "modify key [set benchmark value]"
+                value = self._reset_value(bench_value, mapped_value)
+            else:
+                modify_type, value = merge_user_modified(bench_side, mapped_value)
+
+            logger.info(
+                "%s: '%s=%s'. Values: [benchmark='%s', existing='%s']",
+                modify_type,
+                mapped_keys,
+                value,
+                bench_value,
+                mapped_value,
+            )
+            ops.append((PATCH_REPLACE, mapped_keys, value))
+            if decisions is not None:
+                decisions[modify_type] = decisions.get(modify_type, 0) + 1
+        # mapped chains are the distinct chains of diffs unless a mapping merges some
+        return Patch.compile(ops, check_overlap=bool(self.mapping))
+
+    def _reset_value(self, bench_value, mapped_value):
+        """The benchmark value to set in place of mapped_value: a ListPatch of it, with sequence_diff"""
+        if (
+            self.max_edits is not None
+            and isinstance(bench_value, (list, tuple))
+            and type(bench_value) is type(mapped_value)
+        ):
+            # patch the changed items only
+            return ListPatch.between(mapped_value, bench_value, self.max_edits) or bench_value
+        return bench_value
+
+    def _fold_lists(self, diffs, expanded_lists, benchmark, test, lookup_cache=None):
+        """Fold the element diffs of keyed and sequence-diffed lists into one modification each
+
+        get_dict_to_update() works on whole values: a list with element changes is
+        handled like any other modified list (and patched, with sequence_diff).
+        """
+        folded = DictDiff()
+        # element chains are benchmark-side chains under the list, removed ones too
+        for kind in (ADDED, REMOVED, MODIFIED):
+            for path, value in getattr(diffs, kind).items():
+                list_path = expanded_list_of(path, expanded_lists)
+                if list_path is None:
+                    getattr(folded, kind)[path] = value
+                elif list_path not in folded.modified:
+                    _, mapped_keys = next(self.iterator([list_path]))
+                    folded.modified[list_path] = (
+                        self.get_nested_value(list_path, benchmark, NOT_FOUND, lookup_cache),
+                        self.get_nested_value(mapped_keys, test, NOT_FOUND, lookup_cache),
+                    )
+        return folded
+
+    def _walk_removed_keys(self, benchmark, test, recursive):
+        # same result as looking every test key chain up in the benchmark, but both documents
+        # are walked side by side so each lookup is a single step from its parent
+        reverse_mapping = {} if recursive else self.reverse_mapping
+        for key in self.get_valid_keys(test):
+            value = test[key]
+            if not isinstance(value, dict):
+                bench_key = reverse_mapping.get(key, key)
+                if self.get_nested_value(bench_key, benchmark, NOT_FOUND) is NOT_FOUND:
+                    yield key, value
+                continue
+            for key_chain, leaf in removed_leaves(step_into(benchmark, key), value):
+                yield (key, *key_chain), leaf
+
+
+ADDED, REMOVED, MODIFIED = "added", "removed", "modified"
+# which document of a compare_with_reference() made a change, and the status of a
+# path changed by neither or by both differently
+ORIGINAL, REVISED, BOTH = "original", "revised", "both"
+UNCHANGED, CONFLICT = "unchanged", "conflict"
+
+# One difference found by a compare: the side a value is missing from holds NOT_FOUND
+DiffEvent = namedtuple("DiffEvent", ("kind", "path", "bench_value", "test_value"))
+
+
+class DictDiff:
+    """The differences found by a compare, keyed by key chain
+
+    The chains are stored as one path trie shared by added, removed and modified,
+    so a common prefix is held once however many leaves hang under it. .added,
+    .removed and .modified are live mapping views of the trie: their keys are the
+    full tuples, built only when iterated.
+
+    A plain key is stored as the one-segment chain (key,), so iterating .added of
+    added_keys() yields ("x",) where it used to yield "x". Lookups still take
+    either shape: diff.added["x"] and "x" in diff.added find the ("x",) entry.
+    """
+
+    __slots__ = ("_root", "added", "removed", "modified")
+
+    def __init__(self, added=None, removed=None, modified=None):
+        self._root = DiffNode(None, None)
+        cursor = [(), self._root]
+        self.added = DiffView(self._root, ADDED, cursor)
+        self.removed = DiffView(self._root, REMOVED, cursor)
+        self.modified = DiffView(self._root, MODIFIED, cursor)
+        for view, entries in (
+            (self.added, added),
+            (self.removed, removed),
+            (self.modified, modified),
+        ):
+            if entries:
+                view.update(entries)
+
+    def __reduce__(self):
+        return DictDiff, (dict(self.added), dict(self.removed), dict(self.modified))
+
+    @staticmethod
+    def _update_dict(_from, _to, key):
+        for k, v in _from.items():
+            t = tuplize(key) if key else tuple()
+            _to[t + tuplize(k)] = v
+
+    def update(self, diff: "DictDiff", key: str = None):
+        if not diff:
+            return
+        self._update_dict(diff.added, self.added, key=key)
+        self._update_dict(diff.removed, self.removed, key=key)
+        self._update_dict(diff.modified, self.modified, key=key)
+
+    def __repr__(self):
+        return str(self.changes)
+
+    @property
+    def changes(self):
+        return {"added": self.added, "modified": self.modified}
+
+    def record(self, event: DiffEvent):
+        """Record a DiffEvent the way compare() does"""
+        kind, path, bench_value, test_value = event
+        if kind == MODIFIED:
+            self.modified[path] = (bench_value, test_value)
+        elif kind == ADDED:
+            self.added[path] = bench_value
+        else:
+            self.removed[path] = test_value
+
+    def events(self):
+        """Yield the recorded differences as DiffEvents"""
+        for path, value in self.added.items():
+            yield DiffEvent(ADDED, path, value, NOT_FOUND)
+        for path, value in self.removed.items():
+            yield DiffEvent(REMOVED, path, NOT_FOUND, value)
+        for path, (bench_value, test_value) in self.modified.items():
+            yield DiffEvent(MODIFIED, path, bench_value, test_value)
+
+    def touches(self, path) -> bool:
+        """Whether a difference is recorded at path, over it or under it"""
+        node = self._root
+        for segment in path:
+            node = node.children.get(segment) if node.children else None
+            if node is None:
+                return False
+            if not (node.added is node.removed is node.modified is NOT_FOUND):
+                return True
+        return bool(node.children)
+
+    def pop_subtree(self, path) -> list:
+        """Remove the differences recorded at path and under it, and return them as DiffEvents"""
+        node = self.node_at(path)
+        if node is None:
+            return []
+        events = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            events.extend(current.pop_values())
+            if current.children:
+                stack.extend(current.children.values())
+        if node.parent is None:
+            node.children = None
+        else:
+            del node.parent.children[node.segment]
+            node.parent.prune()
+        kinds = {event.kind for event in events}
+        for view in (self.added, self.removed, self.modified):
+            view.discard_reset(kinds)
+        return events
+
+    def node_at(self, path) -> "DiffNode":
+        """The trie node of path, None when nothing is recorded at it or under it"""
+        return self._root.find(tuplize(path))
+
+    def element_changes(self, path) -> "ElementChanges":
+        """The added/removed items of the collection modified at path, regardless of order
+
+        This is the only place the items are reported: compare() and update() record
+        a collection that differs as one modified (bench_value, test_value) pair, as
+        they always have, since its items have no key chain of their own and update()
+        restores the collection as a whole.
+        """
+        bench_value, test_value = self.modified[path]
+        return element_changes(bench_value, test_value)
+
+    def node_count(self) -> int:
+        """The number of distinct path segments held by the trie"""
+        count, stack = 0, [self._root]
+        while stack:
+            node = stack.pop()
+            if node.children:
+                count += len(node.children)
+                stack.extend(node.children.values())
+        return count
+
+
+class DiffNode:
+    """One key segment of a DictDiff trie and the values recorded at its chain"""
+
+    __slots__ = ("parent", "segment", "children", ADDED, REMOVED, MODIFIED)
+
+    def __init__(self, parent: "DiffNode", segment):
+        self.parent = parent
+        self.segment = segment
+        self.children = None
+        self.added = self.removed = self.modified = NOT_FOUND
+
+    def path(self) -> tuple:
+        segments = []
+        node = self
+        while node.parent is not None:
+            segments.append(node.segment)
+            node = node.parent
+        return tuple(reversed(segments))
+
+    def find(self, path: tuple):
+        node = self
+        for segment in path:
+            if not node.children:
+                return None
+            node = node.children.get(segment)
+            if node is None:
+                return None
+        return node
+
+    def child(self, segment) -> "DiffNode":
+        children = self.children
+        if children is None:
+            children = self.children = {}
+        node = children.get(segment)
+        if node is None:
+            # intern() raises TypeError on str subclasses, so isinstance() won't do
+            if type(segment) is str:
+                segment = intern(segment)
+            node = children[segment] = DiffNode(self, segment)
+        return node
+
+    def insert(self, path: tuple) -> "DiffNode":
+        node = self
+        for segment in path:
+            node = node.child(segment)
+        return node
+
+    def pop_values(self) -> list:
+        """Reset the values recorded at this node, returning them as DiffEvents"""
+        events = []
+        if self.added is not NOT_FOUND:
+            events.append(DiffEvent(ADDED, self.path(), self.added, NOT_FOUND))
+        if self.removed is not NOT_FOUND:
+            events.append(DiffEvent(REMOVED, self.path(), NOT_FOUND, self.removed))
+        if self.modified is not NOT_FOUND:
+            # modified holds the (bench_value, test_value) pair
+            events.append(DiffEvent(MODIFIED, self.path(), *self.modified))
+        self.added = self.removed = self.modified = NOT_FOUND
+        return events
+
+    def prune(self):
+        """Drop this node and its ancestors once they hold neither values nor children"""
+        node = self
+        while (
+            node.parent is not None
+            and not node.children
+            and node.added is node.removed is node.modified is NOT_FOUND
+        ):
+            del node.parent.children[node.segment]
+            node = node.parent
+
+
+class DiffView(MutableMapping):
+    """The key chain -> value mapping of one kind of difference of a DictDiff trie"""
+
+    __slots__ = ("_root", "_kind", "_nodes", "_cursor")
+
+    def __init__(self, root: DiffNode, kind: str, cursor: list):
+        self._root = root
+        self._kind = kind
+        # the nodes holding a value of this kind, in insertion order
+        self._nodes = []
+        # [chain, node] of the last parent inserted under, shared by the views of a
+        # trie: siblings are emitted together
+        self._cursor = cursor
+
+    def __getitem__(self, path):
+        node = self._root.find(tuplize(path))
+        value = NOT_FOUND if node is None else getattr(node, self._kind)
+        if value is NOT_FOUND:
+            raise KeyError(path)
+        return value
+
+    def __setitem__(self, path, value):
+        path = tuplize(path)
+        cursor = self._cursor
+        parent_path, parent = cursor
+        if not path:
+            node = self._root
+        else:
+            if path[:-1] != parent_path:
+                parent_path = path[:-1]
+                parent = self._root.insert(parent_path)
+                cursor[:] = parent_path, parent
+            node = parent.child(path[-1])
+        if getattr(node, self._kind) is NOT_FOUND:
+            self._nodes.append(node)
+        setattr(node, self._kind, value)
+
+    def __delitem__(self, path):
+        node = self._root.find(tuplize(path))
+        if node is None or getattr(node, self._kind) is NOT_FOUND:
+            raise KeyError(path)
+        self._nodes.remove(node)
+        setattr(node, self._kind, NOT_FOUND)
+        node.prune()
+        self._cursor[:] = (), self._root
+
+    def __iter__(self):
+        for node in self._nodes:
+            yield node.path()
+
+    def discard_reset(self, kinds):
+        """Forget the nodes reset behind the view's back when its kind is in kinds, and the cursor"""
+        if self._kind in kinds:
+            kind = self._kind
+            self._nodes = [node for node in self._nodes if getattr(node, kind) is not NOT_FOUND]
+        self._cursor[:] = (), self._root
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def items(self):
+        return DiffItemsView(self)
+
+    def _items(self):
+        kind = self._kind
+        for node in self._nodes:
+            yield node.path(), getattr(node, kind)
+
+    def __repr__(self):
+        return repr(dict(self._items()))
+
+
+class DiffItemsView(ItemsView):
+    # one trie walk per chain instead of a key lookup per item
+    __slots__ = ()
+
+    def __iter__(self):
+        return self._mapping._items()
+
+
+class ThreeWayDiff:
+    """The changes two documents made to a common reference, split by who made them
+
+    original and revised are DictDiffs of the changes only that document made,
+    both a DictDiff of those the two made alike, and conflicts maps each path the
+    two changed differently - at the path itself, or one over the other - to
+    (original's DiffEvents, revised's DiffEvents) at that path, a tuple each, empty
+    where a side made no change there. As in compare(), "added" is a reference path
+    a document lacks and "removed" a path only the document has.
+    """
+
+    __slots__ = ("original", "revised", "both", "conflicts")
+
+    def __init__(self):
+        self.original = DictDiff()
+        self.revised = DictDiff()
+        self.both = DictDiff()
+        self.conflicts = {}
+
+    def __repr__(self):
+        return (
+            f"ThreeWayDiff(original={self.original!r}, revised={self.revised!r}, "
+            f"both={self.both!r}, conflicts={self.conflicts!r})"
+        )
+
+    def record(self, side, event: DiffEvent):
+        getattr(self, side).record(event)
+
+    def settle(self):
+        """Move the changes recorded on both sides to both when alike, else to conflicts"""
+        alike, conflicting = self._pair_events()
+        recorded = ((ORIGINAL, self.original), (REVISED, self.revised))
+        self.original, self.revised = DictDiff(), DictDiff()
+        for side, diffs in recorded:
+            for event in diffs.events():
+                if (event.kind, event.path) in alike:
+                    if side == REVISED:
+                        self.both.record(event)
+                elif event.path not in conflicting:
+                    self.record(side, event)
+        for path, (original_events, revised_events) in conflicting.items():
+            self.conflicts[path] = (tuple(original_events), tuple(revised_events))
+
+    def _pair_events(self):
+        """The (kind, path) of the changes both sides made alike, and the conflicting events by path
+
+        A side may report more than one kind at a path (removed and modified under an
+        inner_key_validity mapping), so conflicting events are listed per side.
+        """
+        revised_events = {(event.kind, event.path): event for event in self.revised.events()}
+        alike, conflicting = set(), {}
+        for event in self.original.events():
+            twin = revised_events.get((event.kind, event.path))
+            if twin is not None and deep_equal(event.test_value, twin.test_value):
+                alike.add((event.kind, event.path))
+            elif self.revised.touches(event.path):
+                conflicting.setdefault(event.path, ([], []))[0].append(event)
+        for key, event in revised_events.items():
+            if key not in alike and self.original.touches(event.path):
+                conflicting.setdefault(event.path, ([], []))[1].append(event)
+        return alike, conflicting
+
+    def status(self, path) -> str:
+        """Who changed the value at path, counting changes at, over and under it
+
+        UNCHANGED, ORIGINAL, REVISED, BOTH (alike, or apart from each other under
+        it) or CONFLICT.
+        """
+        path = tuplize(path)
+        for conflict in self.conflicts:
+            size = min(len(conflict), len(path))
+            if conflict[:size] == path[:size]:
+                return CONFLICT
+        sides = [
+            side
+            for side, diffs in ((ORIGINAL, self.original), (REVISED, self.revised), (BOTH, self.both))
+            if diffs.touches(path)
+        ]
+        if not sides:
+            return UNCHANGED
+        return sides[0] if len(sides) == 1 else BOTH
+
+
+class Normalized:
+    """fix_funcs applied to the values of one document, each value under each key chain once
+
+    Comparator.normalize() fixes every value held under a fix_funcs key up front;
+    other key chains are fixed on first use. A failing function is called, and
+    logged, once. Results are kept by value identity: the document must not be
+    mutated while it's in use.
+
+    The multisets of its collections compared with avoid_inner_order are kept here
+    too, so the calls given the same normalized= count them once.
+    """
+
+    __slots__ = ("document", "fix_funcs", "_values", "_multisets")
+
+    def __init__(self, document, fix_funcs):
+        self.document = document
+        self.fix_funcs = fix_funcs
+        # (key chain, id(value)) -> (value, fixed value): the value is kept alive so
+        # its id() stays valid
+        self._values = {}
+        # id(collection) -> (collection, multiset or None until it's used again)
+        self._multisets = {}
+
+    def __len__(self):
+        return len(self._values)
+
+    def fixed(self, keys, value, logger=None, stats=None):
+        """fix_key() of value under keys, computed once"""
+        keys = tuplize(keys)
+        if not any(key in self.fix_funcs for key in keys):
+            return value
+        cache_key = (keys, id(value))
+        try:
+            return self._values[cache_key][1]
+        except KeyError:
+            fixed = apply_fix_funcs(self.fix_funcs, keys, value, logger, stats)
+            self._values[cache_key] = (value, fixed)
+            return fixed
+
+    def multiset(self, collection) -> dict:
+        """multiset() of a collection of the document, kept once it's been asked for twice
+
+        A one-off compare doesn't pay for keeping the counts of every collection.
+        """
+        key = id(collection)
+        counts = self._multisets.get(key, (None, None))[1]
+        if counts is None:
+            counts = multiset(collection)
+            # the collection is kept alive so its id() stays valid
+            self._multisets[key] = (collection, counts if key in self._multisets else None)
+        return counts
+
+
+class BenchmarkPlan:
+    """The benchmark side of a compare, prepared once and shared by every test compared to it
+
+    Each level of the benchmark walked by a compare is prepared on first use (see
+    Comparator.prepare_level) and kept, with its fix_funcs-normalized values, for the
+    next tests. The benchmark must not be mutated while its plan is in use.
+    """
+
+    __slots__ = (
+        "comparator",
+        "benchmark",
+        "fingerprints",
+        "normalized",
+        "_logger",
+        "_levels",
+        "_bench_sides",
+    )
+
+    def __init__(self, comparator, benchmark, fingerprints=None, logger=None, normalized=None):
+        self.comparator = comparator
+        self.benchmark = benchmark
+        self.fingerprints = fingerprints
+        self.normalized = normalized
+        self._logger = logger
+        # (id(level), recursive) -> (level, prepared level):
+        # the level is kept alive so its id() stays valid
+        self._levels = {}
+        # bench key -> BenchSide of the modified keys update() has decided on
+        self._bench_sides = {}
+
+    def __len__(self):
+        return len(self._levels)
+
+    def level(self, benchmark, recursive=False, logger=None, stats=None):
+        key = (id(benchmark), recursive)
+        try:
+            return self._levels[key][1]
+        except KeyError:
+            with phase(stats, "prepare"):
+                prepared = self.comparator.prepare_level(
+                    benchmark, recursive, logger or self._logger, self.normalized
+                )
+            self._levels[key] = (benchmark, prepared)
+            return prepared
+
+    def bench_side(self, bench_key, lookup_cache=None) -> "BenchSide":
+        """The BenchSide of a modified key, looked up once for all tests"""
+        try:
+            return self._bench_sides[bench_key]
+        except KeyError:
+            value = self.comparator.get_nested_value(
+                bench_key,
+                self.benchmark,
+                default=AssertionError(f"{bench_key} is not found in benchmark"),
+                lookup_cache=lookup_cache,
+            )
+            side = self._bench_sides[bench_key] = BenchSide(value)
+            return side
+
+    def multiset(self, collection) -> dict:
+        """multiset() of a benchmark collection, kept by the plan's Normalized"""
+        return self.normalized.multiset(collection)
+
+
+class BenchSide:
+    """The benchmark side of update()'s decision on one modified key
+
+    Whether its items are of one type and its distinct items, in order, are worked out
+    on first use and kept: they raise, as they always did, on values that have no such
+    thing.
+    """
+
+    __slots__ = ("value", "_same_type", "_items")
+
+    def __init__(self, value):
+        self.value = value
+        self._same_type = self._items = None
+
+    def same_type(self) -> bool:
+        if self._same_type is None:
+            self._same_type = is_same_type(self.value)
+        return self._same_type
+
+    def items(self) -> dict:
+        if self._items is None:
+            self._items = dict.fromkeys(self.value)
+        return self._items
+
+
+class CompareContext:
+    """Per-call state of a single compare: its plan, options, logger, stats and caches"""
+
+    __slots__ = (
+        "plan",
+        "avoid_inner_order",
+        "logger",
+        "lookup_cache",
+        "test_fingerprints",
+        "stats",
+        "expanded_lists",
+    )
+
+    def __init__(
+        self, plan: BenchmarkPlan, avoid_inner_order=False, logger=None, stats=None
+    ):
+        self.plan = plan
+        self.avoid_inner_order = avoid_inner_order
+        self.logger = logger
+        self.stats = stats
+        # key chains of the lists diffed element by element
+        self.expanded_lists = set()
+        self.lookup_cache = LookupCache()
+        self.test_fingerprints = Fingerprints() if plan.fingerprints else None
+
+
+# the result of a CompareSession.refresh(): the current diffs and the events that
+# appeared in and resolved from them since the previous refresh
+SessionUpdate = namedtuple("SessionUpdate", ("diffs", "appeared", "resolved"))
+
+
+class CompareSession:
+    """A compare of one benchmark to a live test dict, kept up to date incrementally
+
+    Report the test key chains that changed with touch(), or mutate the test through
+    tracked(), then refresh(): only the dirty subtrees are compared again and patched
+    into the held DictDiff. A column_mapping can move any test key anywhere in the
+    benchmark, so with one every refresh compares the whole test.
+
+    Values are held by reference: a value mutated in place must be touched (tracked()
+    touches the lists and sets it hands out). The benchmark must not change.
+    """
+
+    def __init__(
+        self, benchmark, test, key=None, avoid_inner_order=False, logger=None, stats=None, **options
+    ):
+        self.comparator = Comparator.from_kwargs(**options)
+        self.test = test
+        self.key = key
+        self.avoid_inner_order = avoid_inner_order
+        self.stats = stats
+        self._logger = DictCompareLogger.init_logger(
+            options.get("diff_id"), options.get("external_logger"), logger=logger
+        )
+        self._plan = self.comparator.prepare(
+            benchmark, logger=self._logger, normalized=options.get("normalized")
+        )
+        self._incremental = not (self.comparator.mapping or self.comparator.generic_key)
+        self._dirty = set()
+        self._all_dirty = False
+        self.diffs = self.comparator.compare_in(test, key, self._context())
+
+    def _context(self):
+        # lookups are cached per compare: the test changes between refreshes
+        return CompareContext(self._plan, self.avoid_inner_order, self._logger, self.stats)
+
+    def touch(self, *paths):
+        """Mark test key chains as changed; touch() with no path marks the whole test"""
+        if not paths:
+            self._all_dirty = True
+        self._dirty.update(tuplize(path) for path in paths)
+
+    def tracked(self) -> "TrackedDict":
+        """A view of the test that touches every key chain written through it"""
+        return TrackedDict(self.test, self)
+
+    def refresh(self) -> SessionUpdate:
+        """Compare the dirty subtrees again and return the diffs with what changed in them"""
+        dirty, self._dirty = self._dirty, set()
+        if self._all_dirty or not self._incremental or () in dirty:
+            self._all_dirty = False
+            old_events = list(self.diffs.events())
+            self.diffs = self.comparator.compare_in(self.test, self.key, self._context())
+            return self._update(old_events, list(self.diffs.events()))
+
+        root = PathNode(None, tuplize(self.key) if self.key else ())
+        regions = sorted({self._region(path) for path in dirty}, key=len)
+        covered = set()
+        old_events, new_events = [], []
+        context = self._context()
+        with phase(self.stats, "compare"):
+            for region in regions:
+                if any(region[:end] in covered for end in range(1, len(region))):
+                    continue
+                covered.add(region)
+                old_events.extend(self.diffs.pop_subtree(root.path(region)))
+                for event in self.comparator.region_diffs(
+                    root, region[:-1], region[-1], self.test, context
+                ):
+                    new_events.append(event)
+                    self.diffs.record(event)
+        return self._update(old_events, new_events)
+
+    def _region(self, path):
+        """The shortest prefix of path whose subtree can be compared again on its own"""
+        comparator = self.comparator
+        bench, test = self._plan.benchmark, self.test
+        node = self.diffs.node_at(self.key or ())
+        for depth, segment in enumerate(path, 1):
+            region = path[:depth]
+            if node is not None:
+                node = node.children.get(segment) if node.children else None
+            if node is not None and not (node.added is node.removed is node.modified is NOT_FOUND):
+                # a whole value is recorded at it
+                return region
+            if segment in comparator.fix_funcs or comparator.key_to_ignore(segment):
+                return region
+            bench, test = step_into(bench, segment), step_into(test, segment)
+            if not (isinstance(bench, dict) and isinstance(test, dict)):
+                return region
+        return path
+
+    def _update(self, old_events, new_events):
+        old = {(event.kind, event.path): event for event in old_events}
+        appeared = []
+        for event in new_events:
+            previous = old.pop((event.kind, event.path), None)
+            if previous is None or not (
+                deep_equal(previous.bench_value, event.bench_value)
+                and deep_equal(previous.test_value, event.test_value)
+            ):
+                appeared.append(event)
+                if previous is not None:
+                    old[event.kind, event.path] = previous
+        return SessionUpdate(self.diffs, appeared, list(old.values()))
+
+
+class TrackedDict(MutableMapping):
+    """A write-through view of a dict that touches its session with every key chain written
+
+    Nested dicts are handed out as TrackedDicts; lists and sets are touched as they're
+    handed out, since they may be mutated in place.
+    """
+
+    __slots__ = ("_data", "_session", "_path")
+
+    def __init__(self, data: dict, session: CompareSession, path=()):
+        self._data = data
+        self._session = session
+        self._path = path
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        if isinstance(value, dict):
+            return TrackedDict(value, self._session, self._path + (key,))
+        if isinstance(value, (list, set)):
+            self._session.touch(self._path + (key,))
+        return value
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self._session.touch(self._path + (key,))
+
+    def __delitem__(self, key):
+        del self._data[key]
+        self._session.touch(self._path + (key,))
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"TrackedDict({self._data!r})"
+
+
+class ResultCache:
+    """An LRU memo of compare()/update()/updated() results across calls
+
+    Entries are keyed by the content fingerprints of the benchmark and the test, the
+    comparator's options (fix_funcs by function identity) and the per-call options,
+    so equal inputs hit whatever dicts hold them. Results are held pickled: a hit
+    returns a fresh copy that the caller is free to change, and an entry's size is
+    its pickle's. A cache is bounded by max_entries and max_bytes, evicting the least
+    recently used entries; a result bigger than max_bytes isn't kept.
+
+    Documents that can't be fingerprinted, and results that can't be pickled, are
+    passed through uncached. Keys are ExactFingerprints: unlike compare, they tell
+    1, 1.0 and True and dicts in another order apart, so a hit only replays a result
+    computed for the same values. A hit logs the update summary but nothing of the
+    compare.
+
+    The digest of the last benchmark is kept for the next calls with the same
+    benchmark object, so only the test is hashed on those; call clear() after
+    changing a benchmark in place.
+    """
+
+    __slots__ = (
+        "max_entries",
+        "max_bytes",
+        "hits",
+        "misses",
+        "evictions",
+        "_entries",
+        "_bytes",
+        "_benchmark",
+    )
+
+    def __init__(self, max_entries=DEFAULT_CACHE_ENTRIES, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = self.misses = self.evictions = 0
+        # key -> pickled result, least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # (benchmark, its digest) of the last call
+        self._benchmark = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"ResultCache({self.as_dict()})"
+
+    def clear(self):
+        """Drop every entry and the kept benchmark digest; the hit/miss counters are kept"""
+        self._entries.clear()
+        self._bytes = 0
+        self._benchmark = None
+
+    def as_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def compare(
+        self, benchmark: dict, test: dict, key: str = None, avoid_inner_order: bool = False, **kwargs
+    ):
+        """compare(), answered from the cache when equal inputs were compared before"""
+        comparator = Comparator.from_kwargs(**kwargs)
+        cache_key = self._key("compare", comparator, benchmark, test, key, avoid_inner_order)
+        diffs = self._get(cache_key)
+        if diffs is None:
+            diffs = comparator.compare(
+                benchmark,
+                test,
+                key=key,
+                avoid_inner_order=avoid_inner_order,
+                external_logger=kwargs.get("external_logger"),
+                diff_id=kwargs.get("diff_id"),
+                logger=kwargs.get("logger"),
+                fingerprints=kwargs.get("fingerprints"),
+                normalized=kwargs.get("normalized"),
+                stats=kwargs.get("stats"),
+            )
+            self._put(cache_key, diffs)
+        return diffs
+
+    def update(
+        self, benchmark, test, avoid_inner_order=True, changed_fields=None, as_patch=False, **kwargs
+    ):
+        """update(), with the Patch to apply to test taken from the cache on a hit"""
+        patch = self._patch(benchmark, test, avoid_inner_order, changed_fields, kwargs)
+        with phase(kwargs.get("stats"), "merge"):
+            patch.apply(test)
+        return patch if as_patch else patch.to_delta()
+
+    def updated(
+        self, benchmark, test, avoid_inner_order=True, changed_fields=None, **kwargs
+    ) -> dict:
+        """updated(), with the Patch to apply to test taken from the cache on a hit"""
+        patch = self._patch(benchmark, test, avoid_inner_order, changed_fields, kwargs)
+        with phase(kwargs.get("stats"), "merge"):
+            return patch.applied(test)
+
+    def _patch(self, benchmark, test, avoid_inner_order, changed_fields, kwargs):
+        comparator = Comparator.from_kwargs(**kwargs)
+        logger = DictCompareLogger.init_logger(
+            kwargs.get("diff_id"), kwargs.get("external_logger"), logger=kwargs.get("logger")
+        )
+        fields = None if changed_fields is None else hash_fields(changed_fields)
+        cache_key = self._key("update", comparator, benchmark, test, fields, avoid_inner_order)
+        patch = self._get(cache_key)
+        if patch is None:
+            plan = comparator.prepare(
+                benchmark,
+                fingerprints=kwargs.get("fingerprints"),
+                logger=logger,
+                normalized=kwargs.get("normalized"),
+            )
+            context = CompareContext(plan, avoid_inner_order, logger, kwargs.get("stats"))
+            patch = comparator.delta_in(test, context, changed_fields)
+            self._put(cache_key, patch)
+        logger.summary(patch)
+        return patch
+
+    def _key(self, operation, comparator, benchmark, test, *call_options):
+        """The entry key of a call, or None when its inputs can't be fingerprinted"""
+        options = comparator.options_key()
+        parts = (self._benchmark_digest(benchmark), ExactFingerprints().digest(test), options)
+        if None in parts:
+            return None
+        return (operation, *parts, *call_options)
+
+    def _benchmark_digest(self, benchmark):
+        if self._benchmark is None or self._benchmark[0] is not benchmark:
+            self._benchmark = (benchmark, ExactFingerprints().digest(benchmark))
+        return self._benchmark[1]
+
+    def _get(self, key):
+        """The copy of the result held under key, or None on a miss"""
+        payload = None if key is None else self._entries.get(key)
+        if payload is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return pickle.loads(payload)
+
+    def _put(self, key, result):
+        if key is None:
+            return
+        try:
+            payload = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+        if len(payload) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+        self._entries[key] = payload
+        self._bytes += len(payload)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+
+class CompareStats:
+    """Opt-in counters and per-phase wall times of compares and updates
+
+    Pass one as stats= to compare/update/iter_diffs/compare_many; it accumulates
+    across calls until reset(). Phases are timed exclusive of each other except
+    "compare", which covers a whole compare, and "prepare", which covers the
+    benchmark side's fix_funcs. fix_funcs counters cover the test side only: the
+    benchmark side is prepared once per plan. Without stats nothing is timed or
+    counted.
+    """
+
+    PHASES = (
+        "compare",
+        "prepare",
+        "added",
+        "removed",
+        "shared",
+        "modified",
+        "fix_funcs",
+        "delta",
+        "merge",
+    )
+    COUNTERS = (
+        "compares",
+        "frames",
+        "max_depth",
+        "lookups",
+        "subtrees_skipped",
+        "fix_calls",
+        "fix_failures",
+        "added",
+        "removed",
+        "modified",
+    )
+
+    __slots__ = ("timings", "counters")
+
+    def __init__(self):
+        self.timings = dict.fromkeys(self.PHASES, 0.0)
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+
+    def __repr__(self):
+        return f"CompareStats({self.as_dict()})"
+
+    def reset(self):
+        """Zero every timing and counter, in place"""
+        self.timings.clear()
+        self.timings.update(dict.fromkeys(self.PHASES, 0.0))
+        self.counters.clear()
+        self.counters.update(dict.fromkeys(self.COUNTERS, 0))
+
+    def timed(self, events, phase_name):
+        """Wrap a generator, adding the time spent producing each item to phase_name"""
+        timings = self.timings
+        events = iter(events)
+        while True:
+            start = perf_counter()
+            item = next(events, NOT_FOUND)
+            timings[phase_name] += perf_counter() - start
+            if item is NOT_FOUND:
+                return
+            yield item
+
+    def count_diffs(self, diffs: "DictDiff"):
+        counters = self.counters
+        counters["compares"] += 1
+        counters["added"] += len(diffs.added)
+        counters["removed"] += len(diffs.removed)
+        counters["modified"] += len(diffs.modified)
+
+    def merge(self, other: "CompareStats"):
+        """Add the timings and counters of other, e.g. collected by another thread"""
+        for name, value in other.timings.items():
+            self.timings[name] += value
+        for name, value in other.counters.items():
+            if name == "max_depth":
+                self.counters[name] = max(self.counters[name], value)
+            else:
+                self.counters[name] += value
+
+    def as_dict(self) -> dict:
+        """Flat metric name -> value: phase timings are "time.<phase>" in seconds"""
+        metrics = {f"time.{name}": value for name, value in self.timings.items()}
+        metrics.update(self.counters)
+        return metrics
+
+    def export(self, emit, prefix="dict_compare"):
+        """Call emit(name, value) for every metric, e.g. a statsd client's gauge"""
+        for name, value in self.as_dict().items():
+            emit(f"{prefix}.{name}", value)
+
+
+@contextmanager
+def timed_phase(stats: CompareStats, phase_name):
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        stats.timings[phase_name] += perf_counter() - start
+
+
+def phase(stats, phase_name):
+    """Time a block as phase_name of stats, or nothing when stats is None"""
+    return NO_PHASE if stats is None else timed_phase(stats, phase_name)
+
+
+NO_PHASE = nullcontext()
+
+
+class PathNode:
+    """A key-chain prefix shared by reference: the full tuple is built only on emit"""
+
+    __slots__ = ("parent", "segment", "_chain")
+
+    def __init__(self, parent: "PathNode", segment: tuple):
+        self.parent = parent
+        self.segment = segment
+        self._chain = None
+
+    def path(self, leaf: tuple = ()) -> tuple:
+        # only prefixes that emit keep their tuple: caching every prefix of a deep
+        # chain would be quadratic
+        if self._chain is None:
+            segments = []
+            node = self
+            while node is not None and node._chain is None:
+                segments.append(node.segment)
+                node = node.parent
+            if node is not None:
+                segments.append(node._chain)
+            self._chain = tuple(chain.from_iterable(reversed(segments)))
+        return self._chain + leaf
+
+
+class Fingerprints:
+    """Merkle-style digests of the dicts and collections of a document
+
+    Digests are built bottom-up once per subtree and cached by node identity, so two
+    subtrees compare in O(1) afterwards. Equal values get equal digests (1 == 1.0 == True,
+    dict and set order doesn't matter); a subtree holding anything else than dicts,
+    collections, strings, bytes, numbers and None has no digest (None).
+    The document must not be mutated while its fingerprints are in use.
+    """
+
+    __slots__ = ("document", "_digests")
+
+    # exact-type fast paths and the fallback of the leaf tokens, and whether dict order counts
+    leaf_tokens = None
+    sort_dicts = True
+
+    def __init__(self, document=None):
+        self.document = document
+        # id(node) -> (node, digest): the node is kept alive so its id() stays valid
+        self._digests = {}
+        if document is not None:
+            self.digest(document)
+
+    def __len__(self):
+        return len(self._digests)
+
+    def digest(self, value):
+        """Return the digest of value, or None when it can't be fingerprinted"""
+        if not isinstance(value, FINGERPRINT_CONTAINERS):
+            token = self.leaf_token(value)
+            return None if token is None else blake2b(token, digest_size=16).digest()
+
+        digests = self._digests
+        stack = [(value, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if id(node) in digests:
+                continue
+            children = node.values() if isinstance(node, dict) else node
+            if not expanded:
+                stack.append((node, True))
+                stack.extend(
+                    (child, False)
+                    for child in children
+                    if isinstance(child, FINGERPRINT_CONTAINERS)
+                )
+                continue
+            digests[id(node)] = (node, self._node_digest(node))
+        return digests[id(value)][1]
+
+    @staticmethod
+    def leaf_token(value):
+        return leaf_token(value)
+
+    def _part(self, value):
+        tokenize = self.leaf_tokens.get(type(value))
+        if tokenize is not None:
+            return tokenize(value)
+        if isinstance(value, FINGERPRINT_CONTAINERS):
+            cached = self._digests.get(id(value))
+            return cached[1] if cached else self.digest(value)
+        return self.leaf_token(value)
+
+    def _node_digest(self, node):
+        part = self._part
+        if isinstance(node, dict):
+            tag = b"d"
+            parts = []
+            for k, v in node.items():
+                key_part, value_part = part(k), part(v)
+                if key_part is None or value_part is None:
+                    return None
+                parts.append(frame_bytes(key_part) + value_part)
+            if self.sort_dicts:
+                parts.sort()
+        else:
+            parts = list(map(part, node))
+            if None in parts:
+                return None
+            if isinstance(node, (set, frozenset)):
+                tag = b"s"
+                parts.sort()
+            else:
+                tag = b"l" if isinstance(node, list) else b"t"
+        return blake2b(tag + b"".join(map(frame_bytes, parts)), digest_size=16).digest()
+
+
+FINGERPRINT_CONTAINERS = (dict, list, tuple, set, frozenset)
+
+
+def frame_bytes(part: bytes) -> bytes:
+    """part prefixed with its length, so joined parts can't run into each other"""
+    return len(part).to_bytes(4, "little") + part
+
+
+def leaf_token(value):
+    """Byte token of a scalar, equal for values that compare equal; None if unsupported"""
+    if value is None:
+        return b"n"
+    if isinstance(value, (bool, int)):
+        return b"i%d" % value
+    if isinstance(value, float):
+        if value != value:
+            # NaN only equals itself through the identity shortcut
+            return b"nan%d" % id(value)
+        if value.is_integer():
+            return b"i%d" % value
+        return b"f" + repr(value).encode()
+    if isinstance(value, str):
+        return b"u" + value.encode("utf-8", "surrogatepass")
+    if isinstance(value, bytes):
+        return b"b" + value
+    return None
+
+
+# exact-type fast paths of leaf_token
+LEAF_TOKENS = {
+    str: lambda value: b"u" + value.encode("utf-8", "surrogatepass"),
+    int: lambda value: b"i%d" % value,
+    bool: lambda value: b"i%d" % value,
+    type(None): lambda value: b"n",
+    float: leaf_token,
+    bytes: leaf_token,
+}
+Fingerprints.leaf_tokens = LEAF_TOKENS
+
+
+def exact_leaf_token(value):
+    """leaf_token() of value, telling apart equal values of other types (1, 1.0, True)"""
+    token = leaf_token(value)
+    if token is None:
+        return None
+    return type(value).__qualname__.encode() + b":" + token
+
+
+class ExactFingerprints(Fingerprints):
+    """Fingerprints equal only for documents that are the same value for value
+
+    Leaves of other types and dicts in another order get other digests, so a
+    result computed for one document can stand in for any other document with
+    the same digest.
+    """
+
+    __slots__ = ()
+
+    # the exact_leaf_token() of the common types, without its type dispatch
+    leaf_tokens = {
+        **{kind: exact_leaf_token for kind in LEAF_TOKENS},
+        str: lambda value: b"str:u" + value.encode("utf-8", "surrogatepass"),
+        int: lambda value: b"int:i%d" % value,
+        bool: lambda value: b"bool:i%d" % value,
+        type(None): lambda value: b"NoneType:n",
+    }
+    sort_dicts = False
+
+    @staticmethod
+    def leaf_token(value):
+        return exact_leaf_token(value)
+
+
+def apply_fix_funcs(fix_funcs, keys, value, logger=None, stats=None):
+    """Run the fix_funcs of every key of a key chain on value, stopping at a failing one"""
+    if not fix_funcs:
+        return value
+    if stats is not None:
+        start = perf_counter()
+    for key in tuplize(keys):
+        for func in fix_funcs.get(key, ()):
+            if stats is not None:
+                stats.counters["fix_calls"] += 1
+            try:
+                value = func(value)
+            except (Exception,):
+                if stats is not None:
+                    stats.counters["fix_failures"] += 1
+                logger.error("Failed to fix key '%s=%s' using '%s'", key, value, func)
+                break
+    if stats is not None:
+        stats.timings["fix_funcs"] += perf_counter() - start
+    return value
+
+
+class NotFoundSentinel:
+    def __repr__(self):
+        return "<NotFound>"
+
+
+NOT_FOUND = NotFoundSentinel()
+
+
+def step_into(node, key):
+    """Return node[key], or NOT_FOUND when it's missing or node can't be indexed"""
+    if node is NOT_FOUND:
+        return NOT_FOUND
+    try:
+        return node[key]
+    except (KeyError, IndexError, TypeError):
+        return NOT_FOUND
+
+
+def removed_leaves(bench_node, test_node):
+    """Yield the (relative key chain, value) of test_node leaves missing in bench_node"""
+    if not isinstance(test_node, dict):
+        if bench_node is NOT_FOUND:
+            yield (), test_node
+        return
+    path = []
+    stack = [(iter(test_node.items()), bench_node)]
+    while stack:
+        items, bench = stack[-1]
+        item = next(items, None)
+        if item is None:
+            stack.pop()
+            if path:
+                path.pop()
+            continue
+        key, value = item
+        bench_value = step_into(bench, key)
+        if isinstance(value, dict):
+            path.append(key)
+            stack.append((iter(value.items()), bench_value))
+        elif bench_value is NOT_FOUND:
+            yield (*path, key), value
+
+
+class LookupCache:
+    """Memoize resolved key-chain prefixes of the documents walked by a single compare/update.
+
+    Nodes are cached per root document and looked up by reference - nothing is copied.
+    Every root is kept alive by the cache so its id() can't be reused during the compare.
+    """
+
+    def __init__(self):
+        self._roots = {}
+
+    def _prefixes(self, root):
+        try:
+            return self._roots[id(root)][1]
+        except KeyError:
+            prefixes = {}
+            self._roots[id(root)] = (root, prefixes)
+            return prefixes
+
+    def resolve(self, root, keys: tuple):
+        """Return the value found at the key chain `keys` of `root` or NOT_FOUND"""
+        if not keys:
+            return NOT_FOUND
+        prefixes = self._prefixes(root)
+        try:
+            return prefixes[keys]
+        except KeyError:
+            pass
+
+        # siblings share a parent: try it before walking from the root
+        parent_keys = keys[:-1]
+        parent = prefixes.get(parent_keys, NOT_FOUND) if parent_keys else root
+        if parent is NOT_FOUND:
+            parent = root
+            for k in parent_keys:
+                parent = step_into(parent, k)
+            if parent is NOT_FOUND:
+                return NOT_FOUND
+            # only the parent prefix is kept: caching every prefix of a deep chain is quadratic
+            prefixes[parent_keys] = parent
+        node = step_into(parent, keys[-1])
+        if node is not NOT_FOUND:
+            prefixes[keys] = node
+        return node
+
+
+def iter_tests(tests):
+    """Yield (test_id, test) pairs of a mapping, of pairs or of plain tests (by index)"""
+    if isinstance(tests, Mapping):
+        yield from tests.items()
+        return
+    for index, item in enumerate(tests):
+        if isinstance(item, Mapping):
+            yield index, item
+        else:
+            yield item
+
+
+def merge_user_modified(bench_side, mapped_value):
+    """The (modify type, value) of a value the user changed officially, merged with the benchmark's"""
+    # value was officially changed so we add it to the benchmark values
+    type_bench = type(bench_side.value)
+    if type_bench is not type(mapped_value):
+        return "modify key [type mismatch: set benchmark value]", bench_side.value
+    if type_bench not in COLLECTION_VAR:
+        # bool, int, float, string: Take only user defined value
+        return "modify key [primitive value: set user-modified value]", mapped_value
+    # iterable: check that all items are of the same type
+    if bench_side.same_type() and is_same_type(mapped_value):
+        # all values form the same type, combine both benchmark and user defined changes:
+        # the user's items, then the benchmark's new ones, whatever the hash seed
+        return (
+            "modify key [collection with same type: combine benchmark & user-modified]",
+            list({**dict.fromkeys(mapped_value), **bench_side.items()}),
+        )
+    # same type, collection items not of the same type take user defined value
+    return "modify key [collection not with same type: set user-modified]", mapped_value
+
+
+def is_same_type(collection):
+    """Return True when all collection items are of the same type"""
+    return all(type(collection[0]) is type(t) for t in collection)
+
+
+def merge_dicts(orig_dict, new_dict):
+    """Merge two dict by keeping both keys-values"""
+    stack = [(orig_dict, new_dict)]
+    while stack:
+        orig, new = stack.pop()
+        for key, val in new.items():
+            if isinstance(val, dict):
+                inner = orig.get(key, {}) or {}
+                orig[key] = inner
+                stack.append((inner, val))
+            elif isinstance(val, ListPatch) and key in orig:
+                # a patch merged into a delta stays a patch until it reaches its list
+                orig[key] = val.apply(orig[key])
+            else:
+                orig[key] = new[key]
+    return orig_dict
+
+
+def deep_equal(first, second) -> bool:
+    """Iterative equality of nested dicts and collections, for inputs too deep for ==."""
+    stack = [(first, second)]
+    while stack:
+        a, b = stack.pop()
+        if a is b:
+            continue
+        if isinstance(a, dict) and isinstance(b, dict):
+            if a.keys() != b.keys():
+                return False
+            stack.extend((a[k], b[k]) for k in a)
+        elif isinstance(a, (list, tuple)) and type(a) is type(b):
+            if len(a) != len(b):
+                return False
+            stack.extend(zip(a, b))
+        elif a != b:
+            return False
+    return True
+
+
+# tags of the canonical forms of unhashable values: no user value can hold them
+CANONICAL_DICT, CANONICAL_LIST, CANONICAL_TUPLE = object(), object(), object()
+
+
+# default cap on the edit distance of sequence_diff=True
+MAX_SEQUENCE_EDITS = 1000
+
+
+class EditCapExceeded(Exception):
+    """The edit distance of two sequences is over the cap asked for"""
+
+
+def sequence_ids(first, second):
+    """Map the items of both sequences to ints, equal for equal items"""
+    ids = {}
+    encoded = []
+    for sequence in (first, second):
+        try:
+            encoded.append([ids.setdefault(item, len(ids)) for item in sequence])
+        except TypeError:
+            encoded.append([ids.setdefault(canonical(item), len(ids)) for item in sequence])
+    return encoded
+
+
+def matching_blocks(first, second, max_edits=None):
+    """Myers' diff of two sequences: the (i, j, size) runs of first[i:i + size] == second[j:j + size]
+
+    Runs in O((N + M) * D) time and linear space, D being the edit distance, by
+    splitting both sequences at the middle snake of their edit graph. Raises
+    EditCapExceeded when D is over max_edits.
+    """
+    a, b = sequence_ids(first, second)
+    blocks = []
+    # (a_start, a_end, b_start, b_end, cap) of the ranges left to diff, last on top
+    stack = [(0, len(a), 0, len(b), max_edits)]
+    while stack:
+        a0, a1, b0, b1, cap = stack.pop()
+        # common prefix and suffix are matched without searching
+        prefix = 0
+        while a0 + prefix < a1 and b0 + prefix < b1 and a[a0 + prefix] == b[b0 + prefix]:
+            prefix += 1
+        suffix = 0
+        while (
+            a1 - suffix > a0 + prefix
+            and b1 - suffix > b0 + prefix
+            and a[a1 - suffix - 1] == b[b1 - suffix - 1]
+        ):
+            suffix += 1
+        if prefix:
+            blocks.append((a0, b0, prefix))
+        if suffix:
+            blocks.append((a1 - suffix, b1 - suffix, suffix))
+        a0, a1, b0, b1 = a0 + prefix, a1 - suffix, b0 + prefix, b1 - suffix
+        if a0 == a1 or b0 == b1:
+            if cap is not None and (a1 - a0) + (b1 - b0) > cap:
+                raise EditCapExceeded()
+            continue
+        split = middle_snake(a, b, a0, a1, b0, b1, cap)
+        if split is not None:
+            x, y = split
+            # both halves share what's left of the cap, only the top level enforces it
+            stack.append((x, a1, y, b1, None))
+            stack.append((a0, x, b0, y, None))
+    blocks.sort()
+    return blocks
+
+
+class EditFrontier:
+    """The furthest-reaching D-paths of one direction of the middle snake search
+
+    Diagonal k of a[a_base:], b[b_base:] read forward (sign 1) or backward (sign -1)
+    holds reach[offset + k], the furthest x a path of the current D gets to on it.
+    """
+
+    __slots__ = ("a", "b", "a_base", "b_base", "sign", "n", "m", "offset", "reach", "k_start", "k_end")
+
+    def __init__(self, a, b, a_base, b_base, sign, n, m, offset):
+        self.a, self.b = a, b
+        self.a_base, self.b_base, self.sign = a_base, b_base, sign
+        self.n, self.m = n, m
+        self.offset = offset
+        self.reach = [-1] * (2 * offset + 1)
+        self.reach[offset + 1] = 0
+        # diagonals that ran off the edit graph are skipped on both ends
+        self.k_start = self.k_end = 0
+
+    def extend(self, d, other=None):
+        """Extend the paths to d edits, returning the first (k, x, other x) that overlaps other
+
+        Diagonal k here is diagonal n - m - k of other, the opposite direction; None
+        when no path overlaps or other isn't given.
+        """
+        a, b, a_base, b_base, sign = self.a, self.b, self.a_base, self.b_base, self.sign
+        n, m, reach, offset = self.n, self.m, self.reach, self.offset
+        other_reach = other.reach if other is not None else ()
+        # other_reach[other_offset - k] is diagonal n - m - k of other
+        other_offset = offset + n - m
+        for k in range(-d + self.k_start, d + 1 - self.k_end, 2):
+            i = offset + k
+            if k == -d or (k != d and reach[i - 1] < reach[i + 1]):
+                x = reach[i + 1]
+            else:
+                x = reach[i - 1] + 1
+            y = x - k
+            while x < n and y < m and a[a_base + sign * x] == b[b_base + sign * y]:
+                x += 1
+                y += 1
+            reach[i] = x
+            if x > n:
+                self.k_end += 2
+            elif y > m:
+                self.k_start += 2
+            elif 0 <= other_offset - k < len(other_reach):
+                other_x = other_reach[other_offset - k]
+                if other_x != -1 and x + other_x >= n:
+                    return k, x, other_x
+        return None
+
+
+def middle_snake(a, b, a0, a1, b0, b1, cap=None):
+    """The point where the forward and backward shortest edit paths of a[a0:a1], b[b0:b1] meet
+
+    None when the ranges have nothing in common.
+    """
+    n, m = a1 - a0, b1 - b0
+    max_d = (n + m + 1) // 2
+    if cap is not None:
+        # the paths meet at d = ceil(D / 2)
+        max_d = min(max_d, cap // 2 + 2)
+    offset = max_d + 1
+    forward = EditFrontier(a, b, a0, b0, 1, n, m, offset)
+    backward = EditFrontier(a, b, a1 - 1, b1 - 1, -1, n, m, offset)
+    # a shortest path of odd length D meets on a forward step, of even D on a backward one
+    odd = (n - m) % 2 != 0
+    for d in range(max_d):
+        meeting = forward.extend(d, backward if odd else None)
+        if meeting is not None:
+            check_edit_cap(2 * d - 1, cap)
+            k, x, _ = meeting
+            return a0 + x, b0 + x - k
+        meeting = backward.extend(d, None if odd else forward)
+        if meeting is not None:
+            check_edit_cap(2 * d, cap)
+            k, _, x = meeting
+            return a0 + x, b0 + x - (n - m - k)
+    # no meeting within max_d: over the cap, or nothing in common at all
+    if cap is not None and (max_d < (n + m + 1) // 2 or n + m > cap):
+        raise EditCapExceeded()
+    return None
+
+
+def check_edit_cap(edits, cap):
+    if cap is not None and edits > cap:
+        raise EditCapExceeded()
+
+
+def sequence_gaps(blocks, first_size, second_size):
+    """The (i1, i2, j1, j2) ranges between matching blocks: first[i1:i2] became second[j1:j2]"""
+    i = j = 0
+    for block_i, block_j, size in chain(blocks, [(first_size, second_size, 0)]):
+        if i < block_i or j < block_j:
+            yield i, block_i, j, block_j
+        i, j = block_i + size, block_j + size
+
+
+class ListPatch:
+    """The positional edits that turn a test list into its benchmark list
+
+    update() writes one in place of a modified list when sequence_diff is on, so the
+    delta holds the changed items only; merge_dicts() applies it. The test list
+    itself isn't kept, only its length and Fingerprints digest, to check that a
+    patch is applied to a list equal to the one it was made from.
+    """
+
+    __slots__ = ("ops", "source_length", "source_digest")
+
+    def __init__(self, ops, source_length: int, source_digest: bytes):
+        # (j1, j2, items): test[j1:j2] is replaced by items, in test positions
+        self.ops = ops
+        self.source_length = source_length
+        self.source_digest = source_digest
+
+    @classmethod
+    def between(cls, test_list, bench_list, max_edits=None):
+        """The patch from test_list to bench_list, or None when it's over max_edits
+
+        None as well when test_list can't be fingerprinted.
+        """
+        source_digest = Fingerprints().digest(test_list)
+        if source_digest is None:
+            return None
+        try:
+            blocks = matching_blocks(bench_list, test_list, max_edits)
+        except (EditCapExceeded, RecursionError):
+            return None
+        ops = [
+            (j1, j2, list(bench_list[i1:i2]))
+            for i1, i2, j1, j2 in sequence_gaps(blocks, len(bench_list), len(test_list))
+        ]
+        return cls(ops, len(test_list), source_digest)
+
+    def __repr__(self):
+        return f"ListPatch({self.ops})"
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, ListPatch)
+            and self.ops == other.ops
+            and self.source_length == other.source_length
+            and self.source_digest == other.source_digest
+        )
+
+    def apply(self, target):
+        """Patch target in place (a new tuple for a tuple) and return it
+
+        Raises ValueError when target isn't a list (or tuple) equal to the one the
+        patch was made from.
+        """
+        if (
+            not isinstance(target, (list, tuple))
+            or len(target) != self.source_length
+            or Fingerprints().digest(target) != self.source_digest
+        ):
+            raise ValueError(f"{self!r} wasn't made from {render(target)}")
+        patched = target if isinstance(target, list) else list(target)
+        for j1, j2, items in reversed(self.ops):
+            patched[j1:j2] = items
+        return patched if isinstance(target, list) else type(target)(patched)
+
+
+PATCH_ADD, PATCH_REPLACE, PATCH_REMOVE = "add", "replace", "remove"
+
+# the decision counted for added keys, beside update()'s modify types
+ADD_DECISION = "add key [new benchmark key]"
+
+
+class Patch:
+    """A flat, ordered list of (op, key chain, value) changes, applied to a target in one pass
+
+    ops are PATCH_ADD, PATCH_REPLACE and PATCH_REMOVE (whose value is unused). Values
+    are written the way merge_dicts() writes a delta: a dict value is merged into the
+    dict already there and a ListPatch patches the list already there. Missing
+    parents are created; removing a missing key does nothing.
+    """
+
+    __slots__ = ("ops",)
+
+    def __init__(self, ops=()):
+        self.ops = [(op, tuplize(path), value) for op, path, value in ops]
+
+    @classmethod
+    def compile(cls, ops, check_overlap=True):
+        """A Patch of add/replace/remove ops grouped by parent chain, so siblings are applied together
+
+        Key chains must be tuples. Grouping doesn't change the result while no chain is
+        another's or a prefix of it. Add/replace ops that overlap (column_mapping can
+        map two keys onto one chain) are merged into a nested delta first, as
+        get_dict_to_update() always did, and patched in as one op per top-level key;
+        a remove op between them is kept as is, in its place. check_overlap=False skips
+        the check for ops known not to overlap, such as the chains of one DictDiff.
+        """
+        if check_overlap and overlapping_chains(path for _, path, _ in ops):
+            return cls(merged_ops(ops))
+        groups = {}
+        for entry in ops:
+            groups.setdefault(entry[1][:-1], []).append(entry)
+        patch = cls()
+        patch.ops = list(chain.from_iterable(groups.values()))
+        return patch
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __iter__(self):
+        return iter(self.ops)
+
+    def __eq__(self, other):
+        return isinstance(other, Patch) and self.ops == other.ops
+
+    def __repr__(self):
+        return f"Patch({self.ops})"
+
+    def to_list(self) -> list:
+        """The ops as [op, [*chain], value] lists, ready for json.dumps() when the values are"""
+        return [[op, list(path), value] for op, path, value in self.ops]
+
+    @classmethod
+    def from_list(cls, items) -> "Patch":
+        return cls((op, tuple(path), value) for op, path, value in items)
+
+    def to_delta(self) -> dict:
+        """The nested-dict delta of the add/replace ops, as get_dict_to_update() returns it"""
+        return self.apply({})
+
+    def apply(self, target):
+        """Apply the ops to target in place and return it
+
+        Consecutive ops under the same parent chain share the walk down to it.
+        """
+        return self._apply(target, None)
+
+    def applied(self, target: dict) -> dict:
+        """A new version of target with the ops applied, leaving target untouched
+
+        Only the dicts on the chains of the ops are copied: every other subtree is
+        shared with target, so the cost follows the number of ops and not the size
+        of target. Patched lists are copied as well.
+        """
+        root = dict(target)
+        return self._apply(root, {id(root): root})
+
+    def _apply(self, target, fresh):
+        # fresh: id -> dict of the dicts copied for a copy-on-write apply, else None
+        parent_path, parents = (), [target]
+        for op, path, value in self.ops:
+            if op == PATCH_REMOVE:
+                remove_chain(target, path, fresh)
+                continue
+            if path[:-1] != parent_path:
+                common, limit = 0, min(len(parent_path), len(path) - 1)
+                while common < limit and parent_path[common] == path[common]:
+                    common += 1
+                del parents[common + 1 :]
+                for segment in path[common:-1]:
+                    parents.append(writable_child(parents[-1], segment, fresh))
+                parent_path = path[:-1]
+            set_patch_value(parents[-1], path[-1], value, fresh)
+        return target
+
+
+def merged_ops(ops):
+    """Yield overlapping ops as Patch.compile() applies them
+
+    Each run of add/replace ops is merged into one op per top-level key; remove ops
+    are yielded as they are, between the runs.
+    """
+    delta, kinds = {}, {}
+    for op, path, value in ops:
+        if op != PATCH_REMOVE:
+            merge_dicts(delta, convert_to_nested_dicts(path, value=value))
+            kinds.setdefault(path[0], op)
+            continue
+        yield from ((kinds[key], (key,), merged) for key, merged in delta.items())
+        delta, kinds = {}, {}
+        yield op, path, value
+    yield from ((kinds[key], (key,), merged) for key, merged in delta.items())
+
+
+def remove_chain(target, path, fresh=None):
+    """Delete the key at the end of path from target, if it's there"""
+    parent = step_into_chain(target, path[:-1])
+    if not isinstance(parent, dict) or path[-1] not in parent:
+        return
+    if fresh is not None:
+        parent = target
+        for segment in path[:-1]:
+            parent = writable_child(parent, segment, fresh)
+    del parent[path[-1]]
+
+
+def set_patch_value(parent, key, value, fresh=None):
+    """parent[key] set as a Patch op sets it: dicts merged, ListPatches applied"""
+    if isinstance(value, dict):
+        inner = writable_child(parent, key, fresh)
+        if fresh is None:
+            merge_dicts(inner, value)
+        else:
+            merge_writable(inner, value, fresh)
+    elif isinstance(value, ListPatch) and key in parent:
+        existing = parent[key]
+        if fresh is not None and isinstance(existing, list):
+            existing = list(existing)
+        parent[key] = value.apply(existing)
+    else:
+        parent[key] = value
+
+
+def merge_writable(orig, new, fresh):
+    """merge_dicts(orig, new), copying the dicts of orig it writes to that aren't in fresh"""
+    stack = [(orig, new)]
+    while stack:
+        orig, new = stack.pop()
+        for new_key, new_value in new.items():
+            if isinstance(new_value, dict):
+                stack.append((writable_child(orig, new_key, fresh), new_value))
+            else:
+                # a ListPatch is applied to a copy of its list, as merge_dicts applies it
+                set_patch_value(orig, new_key, new_value, fresh)
+
+
+def writable_child(node, key, fresh=None):
+    """node[key] set to a dict, as merge_dicts() does; copied first when it isn't in fresh"""
+    inner = node.get(key, {}) or {}
+    if fresh is not None and isinstance(inner, dict) and id(inner) not in fresh:
+        inner = dict(inner)
+        fresh[id(inner)] = inner
+    node[key] = inner
+    return inner
+
+
+def overlapping_chains(paths) -> bool:
+    """Whether a key chain of paths repeats or is the prefix of another"""
+    seen = set()
+    for path in paths:
+        if path in seen:
+            return True
+        seen.add(path)
+    return any(path[:end] in seen for path in seen for end in range(1, len(path)))
+
+
+def step_into_chain(node, path):
+    """Return the value at key chain path of node, or NOT_FOUND"""
+    for segment in path:
+        node = step_into(node, segment)
+    return node
+
+
+def expanded_list_of(path, expanded_lists):
+    """The key chain of the expanded list path is inside of, or None"""
+    for end in range(len(path) - 1, 0, -1):
+        if path[:end] in expanded_lists:
+            return path[:end]
+    return None
+
+
+def hash_fields(fields):
+    return frozenset(tuplize(f) for f in (fields or ()))
+
+
+def is_modified(
+    bench_value, test_value, avoid_inner_order, both_dicts=False, bench_multiset=None
+):
+    """Whether two values differ; collections as multisets when avoid_inner_order
+
+    bench_multiset lets a BenchmarkPlan reuse the multisets of its collections.
+    """
+    if avoid_inner_order and all(
+        isinstance(v, COLLECTION_VAR) for v in (bench_value, test_value)
+    ):
+        if len(bench_value) != len(test_value):
+            return True
+        try:
+            bench_counts = (bench_multiset or multiset)(bench_value)
+            # Counter's own == is pure python; no count is ever 0 here
+            return dict.__ne__(bench_counts, multiset(test_value))
+        except (TypeError, RecursionError):
+            # elements that can't be hashed: compare in order
+            pass
+    try:
+        return bench_value != test_value
+    except RecursionError:
+        # too deep for the builtin comparison: descend into dicts, compare the rest iteratively
+        return both_dicts or not deep_equal(bench_value, test_value)
+
+
+def is_reordered(bench_index, test_index) -> bool:
+    """Whether two identity indexes hold the same elements in a different order"""
+    return bench_index.keys() == test_index.keys() and any(
+        bench_identity != test_identity
+        for bench_identity, test_identity in zip(bench_index, test_index)
+    )
+
+
+def index_by_identity(elements, field):
+    """identity -> element of a list of dicts, or None when field doesn't key them uniquely"""
+    index = {}
+    for element in elements:
+        if not isinstance(element, dict):
+            return None
+        try:
+            if isinstance(field, tuple):
+                identity = tuple(element[f] for f in field)
+            else:
+                identity = element[field]
+            if identity in index:
+                return None
+        except (KeyError, TypeError):
+            return None
+        index[identity] = element
+    return index
+
+
+def canonical(value):
+    """A hashable stand-in for value: equal for equal values, in their own order
+
+    Raises TypeError for unhashable values other than dicts, lists, tuples and sets.
+    """
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        pass
+    if isinstance(value, dict):
+        return CANONICAL_DICT, frozenset((k, canonical(v)) for k, v in value.items())
+    if isinstance(value, (set, frozenset)):
+        # a set's items are hashable and a set equals the frozenset of its items
+        return frozenset(value)
+    if isinstance(value, list):
+        return CANONICAL_LIST, tuple(map(canonical, value))
+    if isinstance(value, tuple):
+        return CANONICAL_TUPLE, tuple(map(canonical, value))
+    raise TypeError(f"unhashable type: '{type(value).__name__}'")
+
+
+def multiset(collection: Union[COLLECTION_VAR]) -> dict:
+    """Count the items of a collection, by their canonical form when they're unhashable"""
+    try:
+        return Counter(collection)
+    except TypeError:
+        return Counter(map(canonical, collection))
+
+
+ElementChanges = namedtuple("ElementChanges", ("added", "removed"))
+
+
+def element_changes(bench_value, test_value) -> ElementChanges:
+    """The items of bench_value missing from test_value (added) and the other way around
+
+    Items are matched regardless of order, duplicates included.
+    """
+    changes = []
+    for items, other in ((bench_value, test_value), (test_value, bench_value)):
+        counts = multiset(other)
+        unmatched = []
+        for item in items:
+            key = canonical(item)
+            if counts.get(key, 0) > 0:
+                counts[key] -= 1
+            else:
+                unmatched.append(item)
+        changes.append(unmatched)
+    return ElementChanges(*changes)
+
+
+def dict_to_key_chain(_dict: Dict[str, Any]):
+    # convert a dict to tuple of key chain:
+    # {1:{2:{3:v1, 4:v2}, 5:{6:v4}}, 7:v5} ==> [(1,2,3), (1,2,4), (1,5,6), 7]
+    key_chains = []
+    path = []
+    stack = [iter(_dict.items())]
+    while stack:
+        item = next(stack[-1], None)
+        if item is None:
+            stack.pop()
+            if path:
+                path.pop()
+            continue
+        k, v = item
+        if isinstance(v, dict):
+            path.append(k)
+            stack.append(iter(v.items()))
+        elif path:
+            key_chains.append((*path, k))
+        else:
+            key_chains.append(k if isinstance(k, str) else tuple(k))
+    return key_chains
+
+
+def convert_to_nested_dicts(keys, value=None):
+    # return nested dicts from tuple of strings: (1,2,3) ==> {1:{2:{3:value}}}
+    if isinstance(keys, str):
+        return keys
+    t = value
+    for k in reversed(keys):
+        d = {k: t}
+        t = d
+    return t
+
+
+def tuplize(item: Union[COLLECTION_VAR]):
+    # convert to tuple
+    return item if isinstance(item, tuple) else tuple(listify(item))
+
+
+def listify(item: Union[COLLECTION_VAR]):
+    # convert to list
+    return item if isinstance(item, list) else [item]
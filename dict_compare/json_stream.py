@@ -0,0 +1,256 @@
+"""Compare of JSON files read incrementally, without loading them into memory"""
+
+import os
+import re
+from contextlib import contextmanager
+from json.decoder import JSONDecodeError, JSONDecoder, scanstring
+
+from .engine import NOT_FOUND, Comparator, DictCompareLogger, DictDiff, removed_leaves
+
+JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+JSON_VALUE_END = frozenset(" \t\n\r,}]")
+
+
+def compare_json_files(
+    benchmark,
+    test,
+    avoid_inner_order: bool = False,
+    chunk_size: int = 1 << 16,
+    max_spill: int = 10000,
+    external_logger=None,
+    diff_id=None,
+    **kwargs,
+):
+    """Compare two JSON documents (paths or text files) without loading them into memory
+
+    Both are parsed incrementally and walked side by side; see JSONStreamCompare.
+    A map with more than max_spill out-of-order members raises ValueError.
+    column_mapping isn't supported here.
+    """
+    logger = DictCompareLogger.init_logger(diff_id, external_logger, logger=kwargs.get("logger"))
+    stream_compare = JSONStreamCompare(
+        Comparator.from_kwargs(**kwargs), avoid_inner_order, max_spill, logger
+    )
+    with open_json(benchmark) as bench_fp, open_json(test) as test_fp:
+        return stream_compare.run(
+            JSONStreamReader(bench_fp, chunk_size),
+            JSONStreamReader(test_fp, chunk_size),
+        )
+
+
+class JSONStreamReader:
+    """Incremental pull parser over a text file
+
+    Maps are entered and walked member by member (enter_map/next_key) and any value can
+    be materialized by the C decoder (read_value) once it's buffered. Only the unread
+    part of the current chunk, or the value being read, is held in memory.
+    """
+
+    def __init__(self, fp, chunk_size: int = 1 << 16):
+        self._read = fp.read
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = JSONDecoder()
+
+    def _more(self, size: int = None) -> bool:
+        data = self._read(size or self._chunk_size)
+        if not data:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos :] + data
+        self._pos = 0
+        return True
+
+    def _error(self, msg):
+        return JSONDecodeError(msg, self._buf, self._pos)
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character, or "" at the end of the file"""
+        while True:
+            self._pos = JSON_WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if self._eof or not self._more():
+                return ""
+
+    def enter_map(self):
+        if self.peek() != "{":
+            raise self._error("Expecting '{'")
+        self._pos += 1
+
+    def next_key(self):
+        """Return the next key of the current map, its value comes next; None at its end"""
+        char = self.peek()
+        if char == ",":
+            self._pos += 1
+            char = self.peek()
+        if char == "}":
+            self._pos += 1
+            return None
+        if char != '"':
+            raise self._error("Expecting property name enclosed in double quotes")
+        while True:
+            try:
+                key, end = scanstring(self._buf, self._pos + 1)
+                break
+            except JSONDecodeError:
+                # the key spans chunks: read at least as much again
+                if self._eof or not self._more(max(self._chunk_size, len(self._buf))):
+                    raise
+        self._pos = end
+        if self.peek() != ":":
+            raise self._error("Expecting ':' delimiter")
+        self._pos += 1
+        return key
+
+    def read_value(self):
+        """Materialize the next value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except JSONDecodeError:
+                if self._eof or not self._more(max(self._chunk_size, len(self._buf))):
+                    raise
+                continue
+            ended = end < len(self._buf) and self._buf[end] in JSON_VALUE_END
+            if not (ended or self._eof or isinstance(value, (dict, list, str))):
+                # a number or literal may go on in the next chunk ("1." decodes as 1)
+                self._more()
+                continue
+            self._pos = end
+            return value
+
+
+class StreamFrame:
+    """One pair of maps walked side by side, with the out-of-order members read so far"""
+
+    __slots__ = ("prefix", "nested", "bench_spill", "test_spill", "bench_done", "test_done")
+
+    def __init__(self, prefix: tuple, nested: bool):
+        self.prefix = prefix
+        self.nested = nested
+        self.bench_spill = {}
+        self.test_spill = {}
+        self.bench_done = False
+        self.test_done = False
+
+
+class JSONStreamCompare:
+    """Compare two JSON documents read as streams, keeping memory per subtree
+
+    Members with the same key at the same position are walked in parallel; nested maps
+    are descended without being materialized, other values are decoded one at a time.
+    Out-of-order members are materialized into a per-map spill buffer until their
+    counterpart shows up (or the map ends), so peak memory is bounded by the largest
+    subtree that isn't aligned rather than by the document.
+    """
+
+    def __init__(self, comparator, avoid_inner_order=False, max_spill=10000, logger=None):
+        if comparator.mapping or comparator.generic_key:
+            raise ValueError("streaming compare supports no column_mapping")
+        self.comparator = comparator
+        self.avoid_inner_order = avoid_inner_order
+        self.max_spill = max_spill
+        self.logger = logger
+        self.diffs = DictDiff()
+
+    def run(self, bench_reader, test_reader) -> DictDiff:
+        bench_reader.enter_map()
+        test_reader.enter_map()
+        stack = [StreamFrame((), nested=False)]
+        while stack:
+            stream_frame = stack[-1]
+            bench_key = None if stream_frame.bench_done else bench_reader.next_key()
+            test_key = None if stream_frame.test_done else test_reader.next_key()
+            stream_frame.bench_done = stream_frame.bench_done or bench_key is None
+            stream_frame.test_done = stream_frame.test_done or test_key is None
+            if bench_key is None and test_key is None:
+                self._close(stack.pop())
+                continue
+
+            if bench_key is not None and bench_key == test_key:
+                child = self._aligned(stream_frame, bench_key, bench_reader, test_reader)
+                if child is not None:
+                    stack.append(child)
+                continue
+            if bench_key is not None:
+                self._unaligned(stream_frame, bench_key, bench_reader, is_bench=True)
+            if test_key is not None:
+                self._unaligned(stream_frame, test_key, test_reader, is_bench=False)
+            if len(stream_frame.bench_spill) + len(stream_frame.test_spill) > self.max_spill:
+                raise ValueError(
+                    f"more than {self.max_spill} out-of-order members under {stream_frame.prefix}"
+                )
+        return self.diffs
+
+    def _aligned(self, stream_frame, key, bench_reader, test_reader):
+        ignored = self.comparator.key_to_ignore(key)
+        if ignored and not stream_frame.nested:
+            bench_reader.read_value()
+            test_reader.read_value()
+            return None
+        if (
+            not ignored
+            and key not in self.comparator.fix_funcs
+            and bench_reader.peek() == "{"
+            and test_reader.peek() == "{"
+        ):
+            bench_reader.enter_map()
+            test_reader.enter_map()
+            return StreamFrame((*stream_frame.prefix, key), nested=True)
+        self._pair(stream_frame, key, bench_reader.read_value(), test_reader.read_value())
+        return None
+
+    def _unaligned(self, stream_frame, key, reader, is_bench):
+        value = reader.read_value()
+        if is_bench:
+            spill, other_spill = stream_frame.bench_spill, stream_frame.test_spill
+        else:
+            spill, other_spill = stream_frame.test_spill, stream_frame.bench_spill
+        if self.comparator.key_to_ignore(key) and not stream_frame.nested:
+            return
+        if key not in other_spill:
+            spill[key] = value
+        elif is_bench:
+            self._pair(stream_frame, key, value, other_spill.pop(key))
+        else:
+            self._pair(stream_frame, key, other_spill.pop(key), value)
+
+    def _close(self, stream_frame):
+        for key, value in stream_frame.bench_spill.items():
+            if not self.comparator.key_to_ignore(key):
+                self.diffs.added[(*stream_frame.prefix, key)] = value
+        for key, value in stream_frame.test_spill.items():
+            for key_chain, leaf in removed_leaves(NOT_FOUND, value):
+                self.diffs.removed[(*stream_frame.prefix, key, *key_chain)] = leaf
+
+    def _pair(self, stream_frame, key, bench_value, test_value):
+        """Diff one materialized member exactly as the in-memory engine does"""
+        if self.comparator.key_to_ignore(key):
+            for key_chain, leaf in removed_leaves(bench_value, test_value):
+                self.diffs.removed[(*stream_frame.prefix, key, *key_chain)] = leaf
+            return
+        diffs = self.comparator.compare(
+            {key: bench_value},
+            {key: test_value},
+            key=stream_frame.prefix,
+            avoid_inner_order=self.avoid_inner_order,
+            logger=self.logger,
+        )
+        self.diffs.added.update(diffs.added)
+        self.diffs.removed.update(diffs.removed)
+        self.diffs.modified.update(diffs.modified)
+
+
+@contextmanager
+def open_json(source):
+    """Yield a text file object for a path or an already open file"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding="utf-8") as fp:
+            yield fp
+    else:
+        yield source
+
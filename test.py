@@ -1,6 +1,19 @@
+import asyncio
+import io
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import random
+import tempfile
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
+from functools import partial
 
+import bench
 import dict_compare
 
 EVENT_DEF_EXTRA_ARGS = {
@@ -399,6 +412,8 @@ class TestDictCompare(unittest.TestCase):
         # combine benchmark and user-defined values
         for trigger_off_value in {"NEW_CASE", "ANOTHER_CASE", "DONE"}:
             self.assertIn(trigger_off_value, test["alarm_definitions"]["trigger_off"])
+        # the user's items first, then the benchmark's new ones, whatever the hash seed
+        self.assertEqual(test["alarm_definitions"]["trigger_off"], ["DONE", "ANOTHER_CASE", "NEW_CASE"])
 
         for trigger_on_value in {"SHOULD_ADDED", "ROLLBACK"}:
             self.assertIn(trigger_on_value, test["alarm_definitions"]["trigger_on"])
@@ -846,6 +861,968 @@ class TestDictCompare(unittest.TestCase):
         self.assertEqual(diff, {'A': {'A1': {'A12': False}}, "B": "poo"})
         self.assertEqual(test['B'], 'poo')
 
+    def test_nested_value_by_reference(self):
+        inner = {"severity": "MAJOR"}
+        test = {"alarm": inner, "metadata": {"name": "N"}}
+        comparator = dict_compare.Comparator(column_mapping={"generic_key": ["metadata"]})
+        cache = dict_compare.LookupCache()
+
+        self.assertIs(comparator.get_nested_value(("alarm",), test, None, cache), inner)
+        self.assertEqual(
+            comparator.get_nested_value(("alarm", "severity"), test, None), "MAJOR"
+        )
+        # generic_key prefixed chain is the fallback
+        self.assertEqual(comparator.get_nested_value("name", test, None, cache), "N")
+        self.assertIs(
+            comparator.get_nested_value(("alarm", "missing"), test, dict_compare.NOT_FOUND),
+            dict_compare.NOT_FOUND,
+        )
+
+    def test_comparator_reuse(self):
+        kwargs = deepcopy(EVENT_DEF_EXTRA_ARGS)
+        comparator = dict_compare.Comparator(**kwargs)
+        self.assertEqual(comparator.reverse_mapping["alarm_definitions"], "alarm")
+        self.assertEqual(
+            comparator.mapped_to_bench_keys(("event_message", "other")),
+            ("text", "other"),
+        )
+        self.assertTrue(comparator.key_to_ignore("id"))
+
+        for _ in range(3):
+            diffs = comparator.compare(exist_event_def_task_changed, exist_event_def_task)
+            expected = dict_compare.compare(
+                exist_event_def_task_changed, exist_event_def_task, **kwargs
+            )
+            self.assertEqual(diffs.changes, expected.changes)
+
+        benchmark = deepcopy(bundle)
+        test = deepcopy(bundle_dict)
+        changes = comparator.update(
+            benchmark, test, changed_fields=test['metadata']['changed_fields']
+        )
+        self.assertEqual(changes, {"property": "popo", "enabled": False})
+
+    def test_module_helpers(self):
+        kwargs = {"column_mapping": {"map": {"a": "aa"}}, "ignore_keys": ["id"]}
+        benchmark = {"a": 1, "b": {"c": 2, "d": [1, 2]}, "x": 5, "id": 1}
+        test = {"aa": 1, "b": {"c": 3, "d": [2, 1]}, "y": 6, "id": 2}
+
+        self.assertEqual(
+            dict(dict_compare.added_keys(benchmark, test, **kwargs).added), {("x",): 5}
+        )
+        added = dict_compare.added_keys(benchmark, test, **kwargs).added
+        self.assertIn("x", added)
+        self.assertEqual(added["x"], 5)
+        self.assertEqual(
+            dict(dict_compare.removed_keys(benchmark, test, **kwargs).removed),
+            {("y",): 6},
+        )
+        shared = dict_compare.get_shared_keys(benchmark, test, **kwargs)
+        self.assertEqual([s[2] for s in shared], [("aa",), ("b",)])
+        diffs = dict_compare.modified_keys(shared, avoid_inner_order=True, **kwargs)
+        self.assertEqual(dict(diffs.modified), {("b", "c"): (2, 3)})
+        self.assertEqual(dict_compare.bench_to_mapped_keys(["a"], **kwargs), ("aa",))
+        self.assertTrue(dict_compare.key_to_ignore("id", **kwargs))
+        # the split modules are re-exported by the package
+        for name in dict_compare.__all__:
+            self.assertTrue(hasattr(dict_compare, name), name)
+
+    def test_deep_documents(self):
+        def nested(depth, leaf):
+            document = {"leaf": leaf, "same": ["A", "B"]}
+            for level in range(depth):
+                document = {"inner": document, "level": level}
+            return document
+
+        depth = 3000
+        benchmark = nested(depth, 1)
+        test = nested(depth, 2)
+        test["inner"]["inner"]["extra"] = True
+
+        diffs = dict_compare.compare(benchmark, test)
+        path = ("inner",) * depth + ("leaf",)
+        self.assertEqual(diffs.modified, {path: (1, 2)})
+        self.assertEqual(diffs.removed, {("inner", "inner", "extra"): True})
+        self.assertEqual(diffs.added, {})
+        self.assertEqual(dict_compare.compare(benchmark, nested(depth, 1)).changes,
+                         {"added": {}, "modified": {}})
+
+    def test_fingerprints(self):
+        benchmark = deepcopy(event_def_cluster)
+        fingerprints = dict_compare.Fingerprints(benchmark)
+        self.assertEqual(
+            fingerprints.digest({"a": [1, 2.0], "b": None}),
+            fingerprints.digest({"b": None, "a": [1.0, 2]}),
+        )
+        self.assertNotEqual(fingerprints.digest([1]), fingerprints.digest((1,)))
+        self.assertIsNone(fingerprints.digest({"a": object()}))
+
+        kwargs = deepcopy(EVENT_DEF_EXTRA_ARGS)
+        for test in (exist_event_def_cluster, event_def_cluster, event_def_task):
+            expected = dict_compare.compare(benchmark, test, **kwargs)
+            diffs = dict_compare.compare(benchmark, test, fingerprints=fingerprints, **kwargs)
+            self.assertEqual(diffs.changes, expected.changes)
+            self.assertEqual(diffs.removed, expected.removed)
+
+        with self.assertRaises(ValueError):
+            dict_compare.compare(deepcopy(benchmark), benchmark, fingerprints=fingerprints)
+
+    def test_compare_many(self):
+        kwargs = deepcopy(EVENT_DEF_EXTRA_ARGS)
+        tests = {
+            "cluster": exist_event_def_cluster,
+            "task": exist_event_def_task,
+            "same": event_def_cluster,
+        }
+        results = dict_compare.compare_many(event_def_cluster, tests, **kwargs)
+        self.assertFalse(isinstance(results, dict))
+        for test_id, diffs in results:
+            expected = dict_compare.compare(event_def_cluster, tests[test_id], **kwargs)
+            self.assertEqual(diffs.changes, expected.changes)
+            self.assertEqual(diffs.removed, expected.removed)
+
+        comparator = dict_compare.Comparator(**kwargs)
+        plan = comparator.prepare(event_def_cluster)
+        self.assertEqual(len(plan), 0)
+        ids = [test_id for test_id, _ in comparator.compare_many(event_def_cluster, [bundle, ad_old])]
+        self.assertEqual(ids, [0, 1])
+
+    def test_iter_diffs(self):
+        kwargs = deepcopy(EVENT_DEF_EXTRA_ARGS)
+        expected = dict_compare.compare(event_def_cluster, exist_event_def_cluster, **kwargs)
+        events = list(dict_compare.iter_diffs(event_def_cluster, exist_event_def_cluster, **kwargs))
+        self.assertEqual(
+            {e.path: (e.bench_value, e.test_value) for e in events if e.kind == "modified"},
+            expected.modified,
+        )
+        self.assertEqual(
+            {e.path: e.bench_value for e in events if e.kind == "added"}, expected.added
+        )
+        self.assertEqual(
+            {e.path: e.test_value for e in events if e.kind == "removed"}, expected.removed
+        )
+        # ("a", "d") names both the unmapped test chain and the mapped ("c", "d")
+        mapping = {"column_mapping": {"map": {"a": "c"}, "inner_key_validity": True}}
+        benchmark, test = {"a": {}}, {"c": {"d": None}, "a": {"d": "y"}}
+        self.assertEqual(
+            sorted(dict_compare.iter_diffs(benchmark, test, **mapping)),
+            sorted(dict_compare.compare(benchmark, test, **mapping).events()),
+        )
+
+        first = dict_compare.first_difference(
+            event_def_cluster, exist_event_def_cluster, **kwargs
+        )
+        self.assertEqual(first, events[0])
+        self.assertFalse(
+            dict_compare.is_equal(event_def_cluster, exist_event_def_cluster, **kwargs)
+        )
+        self.assertTrue(dict_compare.is_equal(event_def_cluster, deepcopy(event_def_cluster)))
+        self.assertIsNone(
+            dict_compare.first_difference({"a": [1, 2]}, {"a": [2, 1]}, avoid_inner_order=True)
+        )
+        self.assertEqual(
+            tuple(dict_compare.first_difference({"a": [1, 2]}, {"a": [2, 1]})),
+            ("modified", ("a",), [1, 2], [2, 1]),
+        )
+
+    def test_diff_trie(self):
+        diffs = dict_compare.DictDiff(
+            added={("a", "b", "c"): 1, ("a", "b", "d"): 2},
+            modified={("a", "e"): (1, 2)},
+        )
+        diffs.removed[("a", "b", "x")] = 3
+        self.assertEqual(diffs.added, {("a", "b", "c"): 1, ("a", "b", "d"): 2})
+        self.assertEqual(list(diffs.added), [("a", "b", "c"), ("a", "b", "d")])
+        self.assertEqual(diffs.removed, {("a", "b", "x"): 3})
+        self.assertEqual(
+            diffs.changes, {"added": dict(diffs.added), "modified": {("a", "e"): (1, 2)}}
+        )
+        self.assertNotIn(("a", "b"), diffs.added)
+        self.assertEqual(diffs.node_count(), 6)
+
+        del diffs.removed[("a", "b", "x")]
+        del diffs.modified[("a", "e")]
+        self.assertEqual(diffs.node_count(), 4)
+        self.assertEqual(repr(diffs), str({"added": dict(diffs.added), "modified": {}}))
+        with self.assertRaises(KeyError):
+            del diffs.modified[("a", "e")]
+
+        copied = pickle.loads(pickle.dumps(diffs))
+        self.assertEqual(copied.added, diffs.added)
+        self.assertEqual(copied.removed, {})
+
+    def test_logging(self):
+        class Unrenderable:
+            def __repr__(self):
+                raise AssertionError("rendered a disabled message")
+
+        dict_compare.compare(bundle, ad_old)
+        dict_compare.update(deepcopy(bundle), deepcopy(ad_old))
+        handlers = [
+            h for h in logging.getLogger().handlers
+            if h.get_name() == dict_compare.LOG_HANDLER_NAME
+        ]
+        self.assertEqual(len(handlers), 1)
+
+        external_logger = logging.getLogger("dict_compare.test")
+        external_logger.setLevel(logging.WARNING)
+        logger = dict_compare.DictCompareLogger(external_logger=external_logger)
+        logger.info("value = %s", Unrenderable())
+        logger.summary({"key": Unrenderable()})
+
+        with self.assertLogs(external_logger, logging.WARNING) as logs:
+            logger.warning("diffs = %s", {f"key{i}": "x" * 1000 for i in range(1000)})
+        self.assertLess(len(logs.output[0]), dict_compare.MAX_RENDERED_CHARS + 200)
+
+        expected, test = deepcopy(ad_old), deepcopy(ad_old)
+        dict_compare.update(deepcopy(bundle), expected)
+        dict_compare.update(deepcopy(bundle), test, logger=dict_compare.NULL_LOGGER)
+        self.assertEqual(test, expected)
+        self.assertEqual(dict_compare.NULL_LOGGER.info("%s", Unrenderable()), None)
+
+    def test_compare_stats(self):
+        kwargs = deepcopy(EVENT_DEF_EXTRA_ARGS)
+        stats = dict_compare.CompareStats()
+        test = deepcopy(exist_event_def_cluster)
+        expected = dict_compare.compare(event_def_cluster, test, **kwargs)
+        dict_compare.update(event_def_cluster, test, stats=stats, **kwargs)
+
+        metrics = stats.as_dict()
+        self.assertEqual(metrics["compares"], 1)
+        self.assertEqual(metrics["added"], len(expected.added))
+        self.assertEqual(metrics["removed"], len(expected.removed))
+        self.assertEqual(metrics["modified"], len(expected.modified))
+        self.assertGreater(metrics["frames"], 1)
+        self.assertGreater(metrics["lookups"], 0)
+        self.assertGreater(metrics["fix_calls"], 0)
+        for phase in dict_compare.CompareStats.PHASES:
+            self.assertGreaterEqual(metrics[f"time.{phase}"], 0)
+        self.assertGreater(metrics["time.compare"], metrics["time.added"])
+
+        emitted = {}
+        stats.export(emitted.__setitem__, prefix="dc")
+        self.assertEqual(emitted["dc.modified"], len(expected.modified))
+
+        stats.reset()
+        dict_compare.compare(
+            {"action": "a"},
+            {"action": "b"},
+            fix_funcs={"action": [int]},
+            stats=stats,
+            logger=dict_compare.NULL_LOGGER,
+        )
+        # the benchmark side is prepared outside the counters
+        self.assertEqual(stats.counters["fix_calls"], 1)
+        self.assertEqual(stats.counters["fix_failures"], 1)
+
+    def test_bench(self):
+        results = bench.run(["compare_deep", "update_mapped"], scale=0.01, repeat=1)
+        self.assertEqual(set(results), {"compare_deep", "update_mapped"})
+        self.assertGreater(results["update_mapped"]["peak_bytes"], 0)
+        # same seed, same documents
+        self.assertEqual(
+            bench.mutate(random.Random(1), bench.wide_document(random.Random(1), 100)),
+            bench.mutate(random.Random(1), bench.wide_document(random.Random(1), 100)),
+        )
+
+        baseline = {"compare_deep": {"seconds": 1.0, "peak_bytes": 1 << 20}}
+        within = {"compare_deep": {"seconds": 1.2, "peak_bytes": 1 << 20}}
+        self.assertEqual(bench.regressions(within, baseline), [])
+        slower = {"compare_deep": {"seconds": 2.0, "peak_bytes": 1 << 21}}
+        failures = bench.regressions(slower, baseline)
+        self.assertEqual(len(failures), 2)
+        self.assertEqual(bench.regressions({"compare_deep": {"seconds": 2.0, "peak_bytes": 0}}, {}), [])
+
+    def test_multiset_compare(self):
+        compare = dict_compare.compare
+        benchmark = {"rules": [{"id": 1, "on": ["a", "b"]}, {"id": 2}, {"id": 2}], "tags": [1, "x"]}
+        test = {"rules": [{"id": 2}, {"id": 1, "on": ["a", "b"]}, {"id": 2}], "tags": ("x", 1)}
+        self.assertEqual(dict(compare(benchmark, test, avoid_inner_order=True).modified), {})
+        self.assertEqual(len(compare(benchmark, test).modified), 2)
+
+        # duplicates count
+        test["rules"][2] = {"id": 3}
+        test["tags"] = ["x", 1, 1]
+        diffs = compare(benchmark, test, avoid_inner_order=True)
+        self.assertEqual(set(diffs.modified), {("rules",), ("tags",)})
+        self.assertEqual(diffs.element_changes(("rules",)), ([{"id": 2}], [{"id": 3}]))
+        self.assertEqual(diffs.element_changes(("tags",)), ([], [1]))
+
+        comparator = dict_compare.Comparator()
+        plan = comparator.prepare(benchmark)
+        for _ in range(3):
+            context = dict_compare.CompareContext(plan, avoid_inner_order=True)
+            comparator.compare_in(test, None, context)
+        self.assertIsNotNone(plan.normalized._multisets[id(benchmark["rules"])][1])
+
+        # kept across calls given the same normalized=
+        normalized = comparator.normalize(benchmark)
+        for _ in range(2):
+            compare(benchmark, test, avoid_inner_order=True, normalized=normalized)
+        self.assertIsNotNone(normalized._multisets[id(benchmark["rules"])][1])
+
+    def test_keyed_lists(self):
+        benchmark = {
+            "rules": [{"id": 1, "on": "a", "to": {"x": 1}}, {"id": 2, "on": "b"}, {"id": 3}],
+            "targets": [{"name": "t", "zone": 0}],
+        }
+        test = {
+            "rules": [{"id": 4}, {"id": 3}, {"id": 1, "on": "z", "to": {"x": 2}}],
+            "targets": [{"zone": 0, "name": "t"}],
+        }
+        list_keys = {"rules": "id", "targets": ["name", "zone"]}
+        diffs = dict_compare.compare(benchmark, test, list_keys=list_keys)
+        self.assertEqual(diffs.added, {("rules", 2): {"id": 2, "on": "b"}})
+        self.assertEqual(diffs.removed, {("rules", 4): {"id": 4}})
+        self.assertEqual(
+            diffs.modified, {("rules", 1, "on"): ("a", "z"), ("rules", 1, "to", "x"): (1, 2)}
+        )
+
+        # not keyed: a whole-list modification
+        diffs = dict_compare.compare(benchmark, test, list_keys={"rules": "missing"})
+        self.assertEqual(list(diffs.modified), [("rules",)])
+
+        # update still writes whole lists
+        expected, keyed = deepcopy(test), deepcopy(test)
+        dict_compare.update(benchmark, expected)
+        dict_compare.update(benchmark, keyed, list_keys=list_keys)
+        self.assertEqual(keyed, expected)
+
+        # an extra test element, alone or beside other changes, resets the list too
+        benchmark = {"rules": [{"id": 1}]}
+        for test in ({"rules": [{"id": 1}, {"id": 2}]}, {"rules": [{"id": 2}, {"id": 1, "on": "a"}]}):
+            expected, keyed = deepcopy(test), deepcopy(test)
+            dict_compare.update(benchmark, expected)
+            delta = dict_compare.update(benchmark, keyed, list_keys={"rules": "id"})
+            self.assertEqual(delta, {"rules": [{"id": 1}]})
+            self.assertEqual(keyed, expected)
+
+        # elements that only moved: one modification when order matters
+        benchmark = {"rules": [{"id": 1}, {"id": 2, "on": "a"}]}
+        test = {"rules": [{"id": 2, "on": "a"}, {"id": 1}]}
+        diffs = dict_compare.compare(benchmark, test, list_keys={"rules": "id"})
+        self.assertEqual(diffs.modified, {("rules",): (benchmark["rules"], test["rules"])})
+        diffs = dict_compare.compare(
+            benchmark, test, avoid_inner_order=True, list_keys={"rules": "id"}
+        )
+        self.assertEqual(list(diffs.events()), [])
+        keyed = deepcopy(test)
+        delta = dict_compare.update(
+            benchmark, keyed, avoid_inner_order=False, list_keys={"rules": "id"}
+        )
+        self.assertEqual(delta, benchmark)
+        self.assertEqual(keyed, benchmark)
+
+    def test_sequence_diff(self):
+        benchmark = {"steps": ["a", "b", "c", "d", "e"], "tags": ("x", "y"), "n": 1}
+        test = {"steps": ["a", "B", "c", "e", "f", "g"], "tags": ("x", "y"), "n": 2}
+        diffs = dict_compare.compare(benchmark, test, sequence_diff=True)
+        self.assertEqual(diffs.modified, {("steps", 1): ("b", "B"), ("n",): (1, 2)})
+        self.assertEqual(diffs.added, {("steps", 3): "d"})
+        self.assertEqual(diffs.removed, {("steps", 4): "f", ("steps", 5): "g"})
+
+        # over the edit cap: a whole-list modification
+        diffs = dict_compare.compare(benchmark, test, sequence_diff=2)
+        self.assertEqual(diffs.modified[("steps",)], (benchmark["steps"], test["steps"]))
+
+        # update patches the changed items into the test list
+        patched, expected = deepcopy(test), deepcopy(test)
+        steps = patched["steps"]
+        delta = dict_compare.update(benchmark, patched, sequence_diff=True)
+        dict_compare.update(benchmark, expected)
+        self.assertEqual(patched, expected)
+        self.assertIs(patched["steps"], steps)
+        self.assertEqual(delta["steps"].ops, [(1, 2, ["b"]), (3, 3, ["d"]), (4, 6, [])])
+        self.assertEqual(delta["steps"], dict_compare.ListPatch.between(test["steps"], benchmark["steps"]))
+
+        # a pure deletion is a deletion slice, in update() and reconcile() alike
+        patched = {"steps": ["a", "b", "c"]}
+        deletion = dict_compare.update(
+            {"steps": ["a", "b"]}, patched, avoid_inner_order=False, sequence_diff=True
+        )
+        self.assertEqual(deletion["steps"].ops, [(2, 3, [])])
+        self.assertEqual(patched, {"steps": ["a", "b"]})
+        [(_, patch)] = dict_compare.reconcile(
+            {"steps": ["a", "b"]}, [{"steps": ["a", "b", "c"]}], avoid_inner_order=False, sequence_diff=True
+        )
+        self.assertEqual(patch["steps"].apply(["a", "b", "c"]), ["a", "b"])
+
+        # a patch applied to another list raises, even one as long as its own
+        for other in (["z"], ["a", "B", "c", "e", "f", "G"]):
+            with self.assertRaises(ValueError):
+                delta["steps"].apply(other)
+        long_list = list(range(10_000))
+        edited = long_list[:5000] + [-1] + long_list[5000:]
+        patch = dict_compare.ListPatch.between(edited, long_list)
+        self.assertEqual(patch.ops, [(5000, 5001, [])])
+        # the patch holds the edits, not the lists
+        self.assertLess(len(pickle.dumps(patch)), 200)
+        self.assertLess(len(dict_compare.encode_diff({"steps": patch})), 100)
+        decoded = dict_compare.decode_diff(dict_compare.encode_diff({"steps": patch}))
+        self.assertEqual(decoded["steps"], patch)
+
+    def test_compare_session(self):
+        benchmark = {"a": {"x": 1, "y": [1, 2]}, "b": 2, "c": {"d": {"e": 1}}}
+        test = deepcopy(benchmark)
+        test["b"] = 3
+        session = dict_compare.CompareSession(benchmark, test)
+        self.assertEqual(session.diffs.modified, {("b",): (2, 3)})
+
+        tracked = session.tracked()
+        tracked["a"]["x"] = 5
+        tracked["a"]["y"].append(3)
+        tracked["b"] = 2
+        del tracked["c"]["d"]["e"]
+        update = session.refresh()
+        self.assertIs(update.diffs, session.diffs)
+        self.assertEqual(
+            update.diffs.modified, {("a", "x"): (1, 5), ("a", "y"): ([1, 2], [1, 2, 3])}
+        )
+        self.assertEqual(update.diffs.added, {("c", "d", "e"): 1})
+        self.assertEqual(
+            {(event.kind, event.path) for event in update.appeared},
+            {("modified", ("a", "x")), ("modified", ("a", "y")), ("added", ("c", "d", "e"))},
+        )
+        self.assertEqual(update.resolved, [dict_compare.DiffEvent("modified", ("b",), 2, 3)])
+
+        # changes made behind the session's back are reported with touch()
+        test["c"]["d"]["e"] = 1
+        test["new"] = 0
+        session.touch(("c", "d", "e"), "new")
+        update = session.refresh()
+        self.assertEqual(update.diffs.removed, {("new",): 0})
+        self.assertEqual(update.diffs.added, {})
+        self.assertEqual(session.refresh().appeared, [])
+        self.assertEqual(
+            dict(session.diffs.modified), dict(dict_compare.compare(benchmark, test).modified)
+        )
+
+    def test_patch(self):
+        benchmark = deepcopy(event_def_task)
+        delta_test, patch_test = deepcopy(exist_event_def_task), deepcopy(exist_event_def_task)
+        delta = dict_compare.update(benchmark, delta_test, **deepcopy(EVENT_DEF_EXTRA_ARGS))
+        patch = dict_compare.update(
+            benchmark, patch_test, as_patch=True, **deepcopy(EVENT_DEF_EXTRA_ARGS)
+        )
+        self.assertIsInstance(patch, dict_compare.Patch)
+        self.assertEqual(patch_test, delta_test)
+        self.assertEqual(patch.to_delta(), delta)
+
+        # flat ops survive a JSON round trip and apply in one pass
+        restored = dict_compare.Patch.from_list(json.loads(json.dumps(patch.to_list())))
+        self.assertEqual(restored, patch)
+        again = deepcopy(exist_event_def_task)
+        self.assertIs(restored.apply(again), again)
+        self.assertEqual(again, delta_test)
+
+        patch = dict_compare.Patch.compile(
+            [
+                ("replace", ("a", "b", "c"), 1),
+                ("add", ("x",), {"y": 2}),
+                ("add", ("a", "b", "d"), 3),
+                ("remove", ("a", "gone"), None),
+            ]
+        )
+        self.assertEqual(
+            [path for _, path, _ in patch],
+            [("a", "b", "c"), ("a", "b", "d"), ("x",), ("a", "gone")],
+        )
+        target = {"a": {"gone": 0, "b": {"c": 0}}, "x": {"z": 1}}
+        self.assertEqual(
+            patch.apply(target), {"a": {"b": {"c": 1, "d": 3}}, "x": {"z": 1, "y": 2}}
+        )
+        # overlapping chains are merged as nested deltas are
+        overlapping = dict_compare.Patch.compile(
+            [("replace", ("a",), {"b": 1}), ("replace", ("a", "c"), 2)]
+        )
+        self.assertEqual(overlapping.ops, [("replace", ("a",), {"b": 1, "c": 2})])
+        # a remove among them stays a remove of its own chain, in its place
+        overlapping = dict_compare.Patch.compile(
+            [("remove", ("a", "gone"), None), ("replace", ("a",), {"b": 1})]
+        )
+        self.assertEqual(
+            overlapping.apply({"a": {"gone": 0, "k": 1}}), {"a": {"k": 1, "b": 1}}
+        )
+        overlapping = dict_compare.Patch.compile(
+            [("replace", ("a",), {"gone": 1}), ("remove", ("a", "gone"), None)]
+        )
+        self.assertEqual(overlapping.apply({"a": {"k": 1}}), {"a": {"k": 1}})
+
+    def test_updated(self):
+        benchmark = deepcopy(event_def_task)
+        test = deepcopy(exist_event_def_task)
+        original = deepcopy(test)
+        expected = deepcopy(test)
+        dict_compare.update(benchmark, expected, **deepcopy(EVENT_DEF_EXTRA_ARGS))
+
+        version = dict_compare.updated(benchmark, test, **deepcopy(EVENT_DEF_EXTRA_ARGS))
+        self.assertEqual(version, expected)
+        self.assertEqual(test, original)
+        self.assertIsNot(version, test)
+
+        # only the dicts on changed chains are copied
+        patch = dict_compare.Patch.compile(
+            [("replace", ("a", "b"), 2), ("remove", ("c", "d"), None), ("add", ("e",), {"f": 1})]
+        )
+        test = {"a": {"b": 1, "x": {}}, "c": {"d": 0}, "e": {"g": {}}, "h": {"i": [1]}}
+        version = patch.applied(test)
+        self.assertEqual(
+            version, {"a": {"b": 2, "x": {}}, "c": {}, "e": {"g": {}, "f": 1}, "h": {"i": [1]}}
+        )
+        self.assertEqual(
+            test, {"a": {"b": 1, "x": {}}, "c": {"d": 0}, "e": {"g": {}}, "h": {"i": [1]}}
+        )
+        self.assertIs(version["h"], test["h"])
+        self.assertIs(version["a"]["x"], test["a"]["x"])
+        self.assertIs(version["e"]["g"], test["e"]["g"])
+
+        # a ListPatch merged under a dict op is applied to a copy of its list
+        list_patch = dict_compare.ListPatch.between([1, 2, 3], [1, 4, 3])
+        patch = dict_compare.Patch.compile([("replace", ("h",), {"i": list_patch})])
+        test = {"h": {"i": [1, 2, 3]}}
+        version = patch.applied(test)
+        self.assertEqual(version, {"h": {"i": [1, 4, 3]}})
+        self.assertEqual(test, {"h": {"i": [1, 2, 3]}})
+
+    def test_reconcile(self):
+        kwargs = deepcopy(EVENT_DEF_EXTRA_ARGS)
+        tests = [deepcopy(t) for t in [exist_event_def_cluster, exist_event_def_task, ad_old] * 2]
+        serial_tests = deepcopy(tests)
+        serial_changes = [dict_compare.update(event_def_task, t, **deepcopy(kwargs)) for t in serial_tests]
+
+        decisions = {}
+        results = dict_compare.reconcile(event_def_task, tests, decisions=decisions, **kwargs)
+        self.assertEqual(list(results), list(enumerate(serial_changes)))
+        self.assertEqual(tests, serial_tests)
+        self.assertEqual(
+            sum(decisions.values()),
+            sum(
+                len(diffs.added) + len(diffs.modified)
+                for diffs in (
+                    dict_compare.compare(event_def_task, t, **deepcopy(kwargs))
+                    for t in [exist_event_def_cluster, exist_event_def_task, ad_old] * 2
+                )
+            ),
+        )
+
+        # the benchmark side of a decision is resolved once for all tests
+        benchmark = {"tags": ["a", "b"], "name": "x"}
+        fleet = {i: {"tags": ["c"], "name": f"y{i}"} for i in range(3)}
+        comparator = dict_compare.Comparator(changed_fields=[["tags"], ["name"]])
+        decisions = {}
+        patches = dict(
+            comparator.reconcile(benchmark, fleet, decisions=decisions, as_patch=True)
+        )
+        self.assertEqual(sorted(patches), [0, 1, 2])
+        self.assertEqual(sorted(fleet[2]["tags"]), ["a", "b", "c"])
+        self.assertEqual(fleet[2]["name"], "y2")
+        self.assertEqual(
+            decisions,
+            {
+                "modify key [collection with same type: combine benchmark & user-modified]": 3,
+                "modify key [primitive value: set user-modified value]": 3,
+            },
+        )
+
+    def test_acompare(self):
+        kwargs = deepcopy(EVENT_DEF_EXTRA_ARGS)
+        tests = [deepcopy(t) for t in [exist_event_def_cluster, exist_event_def_task, ad_old] * 3]
+        serial = [dict_compare.compare(event_def_cluster, t, **kwargs).changes for t in tests]
+
+        async def source():
+            for index, test in enumerate(tests):
+                await asyncio.sleep(0)
+                # a triple carries its own benchmark
+                yield (index, event_def_cluster, test) if index % 4 == 0 else (index, test)
+
+        async def run(**options):
+            diffs = dict_compare.acompare(event_def_cluster, tests[0], **kwargs)
+            self.assertEqual((await diffs).changes, serial[0])
+            return [
+                (index, diffs.changes)
+                async for index, diffs in dict_compare.acompare_stream(
+                    source(), event_def_cluster, **options, **kwargs
+                )
+            ]
+
+        results = asyncio.run(run(max_in_flight=2))
+        self.assertEqual(sorted(results), list(enumerate(serial)))
+        self.assertEqual(asyncio.run(run(max_in_flight=3, ordered=True)), list(enumerate(serial)))
+
+        class SlowFirst(ThreadPoolExecutor):
+            started = 0
+
+            def submit(self, fn, *args, **kwargs):
+                self.started += 1
+                if self.started == 1:
+                    fn = partial(slow, fn)
+                return super().submit(fn, *args, **kwargs)
+
+        def slow(fn, *args):
+            time.sleep(0.1)
+            return fn(*args)
+
+        async def held_back():
+            read = []
+
+            async def counted():
+                for index, test in enumerate(tests):
+                    read.append(index)
+                    yield index, test
+
+            # results done ahead of the slow first one hold the source back
+            with SlowFirst(4) as executor:
+                return [
+                    len(read) - index
+                    async for index, _ in dict_compare.acompare_stream(
+                        counted(), event_def_cluster, executor, max_in_flight=2, ordered=True, **kwargs
+                    )
+                ]
+
+        self.assertLessEqual(max(asyncio.run(held_back())), 2)
+
+        async def pairs_only():
+            return [r async for r in dict_compare.acompare_stream(source())]
+
+        with self.assertRaises(ValueError):
+            asyncio.run(pairs_only())
+
+    def test_result_cache(self):
+        kwargs = deepcopy(EVENT_DEF_EXTRA_ARGS)
+        cache = dict_compare.ResultCache()
+        expected = dict_compare.compare(event_def_cluster, exist_event_def_task, **kwargs)
+        first = cache.compare(event_def_cluster, exist_event_def_task, **kwargs)
+        # equal documents in other dicts hit the entry
+        second = cache.compare(
+            deepcopy(event_def_cluster), deepcopy(exist_event_def_task), **kwargs
+        )
+        self.assertEqual(first.changes, expected.changes)
+        self.assertEqual(second.changes, expected.changes)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # a hit is a copy: changing it doesn't reach the entry
+        second.modified.clear()
+        third = cache.compare(event_def_cluster, exist_event_def_task, **kwargs)
+        self.assertEqual(third.changes, expected.changes)
+        # other options are another entry
+        cache.compare(event_def_cluster, exist_event_def_task, avoid_inner_order=True, **kwargs)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+        tests = [deepcopy(exist_event_def_task) for _ in range(3)]
+        serial = deepcopy(tests[0])
+        delta = dict_compare.update(event_def_task, serial, **deepcopy(kwargs))
+        for test in tests:
+            self.assertEqual(cache.update(event_def_task, test, **kwargs), delta)
+            self.assertEqual(test, serial)
+        self.assertEqual((cache.hits, cache.misses), (4, 3))
+        self.assertEqual(cache.updated(event_def_task, deepcopy(exist_event_def_task), **kwargs), serial)
+
+        # bounded by entries and by bytes, least recently used first
+        cache = dict_compare.ResultCache(max_entries=2)
+        for value in range(3):
+            cache.compare({"a": 0}, {"a": value})
+        cache.compare({"a": 0}, {"a": 1})
+        self.assertEqual(cache.as_dict()["evictions"], 1)
+        self.assertEqual((cache.hits, len(cache)), (1, 2))
+        cache = dict_compare.ResultCache(max_bytes=1)
+        cache.compare({"a": 0}, {"a": 1})
+        self.assertEqual((len(cache), cache.as_dict()["bytes"]), (0, 0))
+        # equal values of other types, or dicts in another order, are other entries
+        cache = dict_compare.ResultCache()
+        for value in (1, True, 1.0):
+            test = {"x": 0}
+            cache.update({"x": value}, test)
+            self.assertIs(type(test["x"]), type(value))
+        cache.updated({"a": 1, "b": 2}, {})
+        cache.updated({"b": 2, "a": 1}, {})
+        self.assertEqual((cache.hits, len(cache)), (0, 5))
+        # a document that can't be fingerprinted isn't cached
+        cache = dict_compare.ResultCache()
+        cache.compare({"a": object()}, {"a": 1})
+        self.assertEqual(len(cache), 0)
+
+    def test_normalize(self):
+        calls = []
+
+        def strict_upper(value):
+            calls.append(value)
+            return value.upper()
+
+        kwargs = deepcopy(EVENT_DEF_EXTRA_ARGS)
+        kwargs["fix_funcs"] = {"event_type": [strict_upper], "severity": [str.strip]}
+        comparator = dict_compare.Comparator.from_kwargs(**kwargs)
+        normalized = comparator.normalize(event_def_cluster, logger=dict_compare.NULL_LOGGER)
+        self.assertTrue(len(normalized))
+        bench_calls = len(calls)
+
+        tests = [exist_event_def_cluster, exist_event_def_task, ad_old]
+        for test in tests:
+            expected = dict_compare.compare(event_def_cluster, test, **kwargs)
+            del calls[:]
+            diffs = dict_compare.compare(event_def_cluster, test, normalized=normalized, **kwargs)
+            self.assertEqual(diffs.changes, expected.changes)
+            # the benchmark side is fixed once, by normalize()
+            self.assertLessEqual(len(calls), bench_calls)
+        self.assertEqual(
+            dict_compare.compare(event_def_cluster, ad_old, normalized=True, **kwargs).changes,
+            dict_compare.compare(event_def_cluster, ad_old, **kwargs).changes,
+        )
+        with self.assertRaises(ValueError):
+            dict_compare.compare(event_def_task, ad_old, normalized=normalized, **kwargs)
+        with self.assertRaises(ValueError):
+            dict_compare.compare(event_def_cluster, ad_old, normalized=normalized)
+
+        # a failing function is called and logged once per benchmark value
+        logger = dict_compare.DictCompareLogger()
+        benchmark = {"a": {"severity": "high"}, "b": {"severity": "high"}}
+        with self.assertLogs(level=logging.ERROR) as logs:
+            normalized = dict_compare.Comparator(fix_funcs={"severity": [int]}).normalize(
+                benchmark, logger
+            )
+            for _ in range(3):
+                dict_compare.update(
+                    benchmark,
+                    {"a": {"severity": "7"}},
+                    fix_funcs={"severity": [int]},
+                    normalized=normalized,
+                    logger=logger,
+                )
+        self.assertEqual(sum("Failed to fix key" in line for line in logs.output), 1)
+
+    def test_diff_archive(self):
+        kwargs = deepcopy(EVENT_DEF_EXTRA_ARGS)
+        diffs = dict_compare.compare(event_def_cluster, exist_event_def_task, **kwargs)
+        decoded = dict_compare.decode_diff(dict_compare.encode_diff(diffs))
+        self.assertEqual(list(decoded.events()), list(diffs.events()))
+        self.assertLess(
+            len(dict_compare.encode_diff(diffs)),
+            len(repr([dict(diffs.added), dict(diffs.removed), dict(diffs.modified)])),
+        )
+
+        test = deepcopy(exist_event_def_task)
+        patch = dict_compare.update(event_def_task, test, as_patch=True, **kwargs)
+        self.assertEqual(dict_compare.decode_diff(dict_compare.encode_diff(patch)), patch)
+        delta = patch.to_delta()
+        self.assertEqual(dict_compare.decode_diff(dict_compare.encode_diff(delta)), delta)
+        # leaves keep their types
+        leaves = {"a": [1, -(2**70), 0.5, None, True, b"x", ("t",), {1}, frozenset({2})]}
+        self.assertEqual(dict_compare.decode_diff(dict_compare.encode_diff(leaves)), leaves)
+        with self.assertRaises(TypeError):
+            dict_compare.encode_diff({"a": object()})
+        with self.assertRaises(ValueError):
+            dict_compare.decode_diff(dict_compare.encode_diff(diffs)[:-3])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "diffs.dda")
+            with dict_compare.DiffArchive(path) as archive:
+                archive.append("cluster", diffs)
+                archive.append(("task", 1), patch)
+                self.assertEqual(archive[("task", 1)], patch)
+            # a record cut short is dropped when the archive is opened again
+            with open(path, "ab") as fp:
+                fp.write(b"\x09\x00")
+            with dict_compare.DiffArchive(path) as archive:
+                self.assertEqual(list(archive), ["cluster", ("task", 1)])
+                self.assertEqual(
+                    archive.paths("cluster"), [(event.kind, event.path) for event in diffs.events()]
+                )
+                archive.append("cluster", dict_compare.DictDiff())
+                self.assertEqual(archive["cluster"].changes, {"added": {}, "modified": {}})
+                self.assertEqual(archive[("task", 1)], patch)
+            with dict_compare.DiffArchive(path) as archive:
+                self.assertEqual(len(archive), 2)
+                self.assertIsNone(archive.get("missing"))
+
+    def test_version_store(self):
+        versions = [deepcopy(event_def_cluster)]
+        for release in range(9):
+            version = deepcopy(versions[-1])
+            version["event_type"] = f"release_{release}"
+            if release % 3 == 0 and "alarm" in version:
+                version["alarm"]["severity"] = f"level_{release}"
+            if release == 4:
+                del version["alarm"]
+            if release == 6:
+                version["action"] = ["replaced"]
+            versions.append(version)
+
+        store = dict_compare.VersionStore(checkpoint_interval=4)
+        self.assertEqual([store.commit(version) for version in versions], list(range(10)))
+        self.assertEqual(list(store.versions()), list(range(10)))
+        for number, version in enumerate(versions):
+            self.assertEqual(store.get(number), version)
+        self.assertEqual(store.get(), versions[-1])
+        self.assertEqual(
+            store.delta(5).to_list(),
+            [["remove", ["alarm"], None], ["replace", ["event_type"], "release_4"]],
+        )
+        self.assertEqual(store.changed(["alarm", "severity"]), [1, 4, 5])
+        self.assertEqual(store.changed("alarm"), [1, 4, 5])
+        self.assertEqual(store.changed("action"), [7])
+
+        # a stored version is a copy
+        versions[9]["event_type"] = "changed later"
+        self.assertEqual(store.get(9)["event_type"], "release_8")
+        # a change compare() skips is kept whole
+        store.commit({**store.get(), "_state": 1})
+        self.assertEqual(store.get(10)["_state"], 1)
+        self.assertIn(10, store.changed("anything"))
+
+        store.compact(6)
+        self.assertEqual(list(store.versions()), list(range(6, 11)))
+        self.assertEqual(store.get(7), versions[7])
+        self.assertEqual(store.changed("action"), [7, 10])
+        with self.assertRaises(KeyError):
+            store.get(5)
+
+    def test_compare_with_reference(self):
+        reference = deepcopy(event_def_cluster)
+        original = deepcopy(reference)
+        original["cooldown"] = 60
+        original["name"] = "ORIGINAL_NAME"
+        original["alarm"]["severity"] = "MAJOR"
+        original["_state"] = "1234"
+        revised = deepcopy(reference)
+        revised["cooldown"] = 60
+        revised["name"] = "REVISED_NAME"
+        del revised["alarm"]
+        revised["extra_validators"]["check_ha_events"]["delay"] = 2
+
+        diffs = dict_compare.compare_with_reference(
+            reference, original, revised=revised, ignore_keys=["_state"], logger=dict_compare.NULL_LOGGER
+        )
+        self.assertEqual(list(diffs.original.events()), [])
+        self.assertEqual(
+            diffs.revised.modified, {("extra_validators", "check_ha_events", "delay"): (1, 2)}
+        )
+        self.assertEqual(diffs.both.modified, {("cooldown",): (1441, 60)})
+        self.assertEqual(sorted(diffs.conflicts), [("alarm",), ("alarm", "severity"), ("name",)])
+        self.assertEqual(diffs.conflicts[("alarm",)][0], ())
+        self.assertEqual(diffs.conflicts[("alarm", "severity")][1], ())
+        self.assertEqual(diffs.conflicts[("name",)][1][0].test_value, "REVISED_NAME")
+
+        self.assertEqual(diffs.status("cooldown"), "both")
+        self.assertEqual(diffs.status(["alarm", "trigger_on"]), "conflict")
+        self.assertEqual(diffs.status("extra_validators"), "revised")
+        self.assertEqual(diffs.status("object_type"), "unchanged")
+        self.assertEqual(diffs.status("_state"), "unchanged")
+
+        # each side holds what compare() of it to the reference finds
+        test = deepcopy(exist_event_def_cluster)
+        expected = dict_compare.compare(
+            event_def_cluster, test, logger=dict_compare.NULL_LOGGER, **deepcopy(EVENT_DEF_EXTRA_ARGS)
+        )
+        diffs = dict_compare.compare_with_reference(
+            event_def_cluster, test, test, logger=dict_compare.NULL_LOGGER, **deepcopy(EVENT_DEF_EXTRA_ARGS)
+        )
+        self.assertEqual(list(diffs.both.events()), list(expected.events()))
+        self.assertEqual(list(diffs.original.events()) + list(diffs.revised.events()), [])
+        revised = deepcopy(test)
+        revised["alarm_definitions"]["severity"] = "MINOR"
+        diffs = dict_compare.compare_with_reference(
+            event_def_cluster, test, revised, logger=dict_compare.NULL_LOGGER, **deepcopy(EVENT_DEF_EXTRA_ARGS)
+        )
+        # a mapped key is reported under its name on both sides, as by compare()
+        self.assertEqual(
+            sorted(diffs.conflicts), [("alarm", "severity"), ("alarm_definitions", "severity")]
+        )
+        self.assertEqual(len(list(diffs.both.events())), len(list(expected.events())) - 2)
+
+        # a side removing and modifying the same path keeps both events in conflicts
+        kwargs = {"column_mapping": {"map": {"a": "c"}, "inner_key_validity": True}}
+        reference, original, revised = {"c": "y"}, {"c": None}, {"c": "y"}
+        diffs = dict_compare.compare_with_reference(reference, original, revised, **kwargs)
+        for side, document in ((diffs.original, original), (diffs.revised, revised)):
+            rebuilt = dict_compare.DictDiff()
+            for event in [*side.events(), *diffs.both.events()]:
+                rebuilt.record(event)
+            for original_events, revised_events in diffs.conflicts.values():
+                for event in original_events if side is diffs.original else revised_events:
+                    rebuilt.record(event)
+            expected = dict_compare.compare(reference, document, **kwargs)
+            self.assertEqual(sorted(rebuilt.events()), sorted(expected.events()))
+
+    def test_parallel(self):
+        kwargs = deepcopy(EVENT_DEF_EXTRA_ARGS)
+        tests = [
+            deepcopy(t)
+            for t in [exist_event_def_cluster, exist_event_def_task, event_def_dict, ad_old] * 3
+        ]
+        serial = [dict_compare.compare(event_def_cluster, t, **kwargs) for t in tests]
+        results = dict(
+            dict_compare.compare_parallel(
+                event_def_cluster, tests, workers=2, chunk_size=2, ordered=False, **kwargs
+            )
+        )
+        self.assertEqual(sorted(results), list(range(len(tests))))
+        for index, diffs in results.items():
+            self.assertEqual(diffs.changes, serial[index].changes)
+
+        serial_tests = deepcopy(tests)
+        serial_changes = [
+            dict_compare.update(event_def_task, t, **kwargs) for t in serial_tests
+        ]
+        parallel_tests = {index: t for index, t in enumerate(deepcopy(tests))}
+        parallel_changes = list(
+            dict_compare.update_parallel(
+                event_def_task, parallel_tests, workers=2, chunk_size=3, **kwargs
+            )
+        )
+        self.assertEqual(parallel_changes, list(enumerate(serial_changes)))
+        self.assertEqual(list(parallel_tests.values()), serial_tests)
+
+        results = dict_compare.compare_parallel(
+            event_def_cluster,
+            tests[:2],
+            workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            **kwargs
+        )
+        self.assertEqual([diffs.changes for _, diffs in results], [d.changes for d in serial[:2]])
+        for option in ("logger", "fingerprints", "normalized", "stats"):
+            with self.assertRaises(TypeError):
+                dict_compare.compare_parallel(event_def_cluster, tests, **{option: object()}, **kwargs)
+            with self.assertRaises(TypeError):
+                dict_compare.update_parallel(event_def_task, tests, **{option: object()}, **kwargs)
+
+    def test_compare_json_files(self):
+        benchmark = deepcopy(event_def_task)
+        test = deepcopy(exist_event_def_task)
+        benchmark["_private"] = {"a": 1}
+        # out of order members are buffered until their counterpart shows up
+        test = dict(reversed(list(test.items())))
+        kwargs = {"ignore_keys": ["id"], "fix_funcs": {"event_type": [str.upper]}}
+
+        expected = dict_compare.compare(benchmark, test, **kwargs)
+        diffs = dict_compare.compare_json_files(
+            io.StringIO(json.dumps(benchmark)),
+            io.StringIO(json.dumps(test)),
+            chunk_size=5,
+            **kwargs
+        )
+        self.assertEqual(diffs.added, expected.added)
+        self.assertEqual(diffs.removed, expected.removed)
+        self.assertEqual(diffs.modified, expected.modified)
+
+        with self.assertRaises(ValueError):
+            dict_compare.compare_json_files(
+                io.StringIO(json.dumps(benchmark)), io.StringIO(json.dumps(test)), max_spill=1
+            )
+
+    def test_compare_json_files_numbers(self):
+        benchmark = {"pad": "xxxxx", "v": 1.5, "w": {"e": 2e10, "n": -3.25e-4}, "t": True}
+        test = {"pad": "xxxxx", "v": 1.75, "w": {"e": 2e10, "n": -3.25e-4}, "t": None}
+        expected = dict_compare.compare(benchmark, test)
+        # numbers split right after their "." or "e" go on in the next chunk
+        for chunk_size in range(1, 40):
+            diffs = dict_compare.compare_json_files(
+                io.StringIO(json.dumps(benchmark)),
+                io.StringIO(json.dumps(test)),
+                chunk_size=chunk_size,
+            )
+            self.assertEqual(diffs.modified, expected.modified, chunk_size)
+            self.assertFalse(diffs.added or diffs.removed, chunk_size)
+
 
 if __name__ == "__main__":
     unittest.main()